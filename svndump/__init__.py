@@ -21,8 +21,9 @@
 #===============================================================================
 
 #import 
-__all__ = [ "common", "cvs2svnfix", "diff", "eolfix", "file", "merge",
-            "node", "props", "sanitize", "tools" ]
+__all__ = [ "blobcache", "common", "compress", "cvs2svnfix", "delta", "diff",
+            "eolfix", "file", "history", "index", "merge", "node",
+            "parallel", "props", "rename", "sanitize", "tools" ]
 
 import re
 import common
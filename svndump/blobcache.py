@@ -0,0 +1,233 @@
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+import tempfile
+
+from common import *
+
+__doc__ = """Content addressed cache of the texts of a dump file."""
+
+# default size of the in-memory part of the blob cache
+BLOB_CACHE_SIZE = 32 * 1024 * 1024
+
+class BlobCache:
+    """
+    Finds texts of a dump file by their md5 or sha1 sum.
+
+    For every text the location it can be read from is recorded, the
+    location is opaque to the cache and passed to the read function given
+    to the constructor. Texts which have been read are kept in memory
+    until they are the least recently used ones and the cache is full.
+
+    Texts which are expensive to read again (reconstructed from deltas)
+    or have no location at all are written to a spill file when they are
+    dropped from memory, if spilling is enabled.
+    """
+
+    def __init__( self, read, cachesize=BLOB_CACHE_SIZE, spill=False ):
+        """
+        Initialize.
+
+        @type read: function( location ) -> string
+        @param read: Reads the text at a location.
+        @type cachesize: integer
+        @param cachesize: Size of the in-memory cache in bytes.
+        @type spill: bool
+        @param spill: Spill expensive texts to a temp file.
+        """
+
+        # reads a text from its location
+        self.__read = read
+        # md5 -> [ length or -1, location, expensive, spill offset or -1 ]
+        self.__entries = {}
+        # sha1 -> md5
+        self.__sha1s = {}
+        # the texts in memory, md5 -> text
+        self.__memory = LRUCache( cachesize, self.__dropped )
+        # spill file or None
+        self.__spill = None
+        if spill:
+            self.__spill = tempfile.TemporaryFile()
+
+    def __get_entry( self, digest ):
+        """
+        Returns the md5 sum and the entry of a text.
+
+        @type digest: string
+        @param digest: The md5 or sha1 sum.
+        @rtype: ( string, list )
+        @return: md5 sum and entry, the entry is None if it's unknown.
+        """
+
+        if len( digest ) == 40:
+            digest = self.__sha1s.get( digest, digest )
+        return digest, self.__entries.get( digest )
+
+    def __dropped( self, md5, text ):
+        """
+        Spills an expensive text dropped from memory.
+
+        @type md5: string
+        @param md5: The md5 sum.
+        @type text: string
+        @param text: The text.
+        """
+
+        entry = self.__entries.get( md5 )
+        if self.__spill == None or entry == None or not entry[2] \
+                or entry[3] >= 0:
+            return
+        self.__spill.seek( 0, 2 )
+        entry[3] = self.__spill.tell()
+        self.__spill.write( text )
+
+    def __keep( self, md5, text ):
+        """
+        Puts a text into memory, or spills it if it is too big.
+
+        @type md5: string
+        @param md5: The md5 sum.
+        @type text: string
+        @param text: The text.
+        """
+
+        if not self.__memory.put( md5, text, len( text ) ):
+            self.__dropped( md5, text )
+
+    def add_text( self, md5, sha1, length, location, expensive=False ):
+        """
+        Records the location of a text.
+
+        If the text is already known the cheaper location is kept.
+
+        @type md5: string
+        @param md5: The md5 sum of the text.
+        @type sha1: string
+        @param sha1: The sha1 sum of the text or "".
+        @type length: integer
+        @param length: Length of the text, -1 if it's not known yet.
+        @type location: object
+        @param location: Location passed to the read function.
+        @type expensive: bool
+        @param expensive: True if reading it again is expensive.
+        """
+
+        if len( sha1 ) > 0:
+            self.__sha1s[sha1] = md5
+        entry = self.__entries.get( md5 )
+        if entry == None:
+            self.__entries[md5] = [ length, location, expensive, -1 ]
+        elif entry[2] and not expensive:
+            entry[0] = length
+            entry[1] = location
+            entry[2] = False
+
+    def add_content( self, md5, sha1, text ):
+        """
+        Adds a text which can't be read from the dump.
+
+        @type md5: string
+        @param md5: The md5 sum of the text.
+        @type sha1: string
+        @param sha1: The sha1 sum of the text or "".
+        @type text: string
+        @param text: The text.
+        """
+
+        if len( sha1 ) > 0:
+            self.__sha1s[sha1] = md5
+        if self.__entries.has_key( md5 ):
+            return
+        self.__entries[md5] = [ len( text ), None, True, -1 ]
+        self.__keep( md5, text )
+
+    def has_text( self, digest ):
+        """
+        Returns True if the text with the given md5 or sha1 sum is known.
+
+        @type digest: string
+        @param digest: The md5 or sha1 sum.
+        @rtype: bool
+        @return: True if the text is known.
+        """
+
+        md5, entry = self.__get_entry( digest )
+        return entry != None
+
+    def get_length( self, digest ):
+        """
+        Returns the length of a text.
+
+        @type digest: string
+        @param digest: The md5 or sha1 sum.
+        @rtype: integer
+        @return: The length or -1 if the text is not known.
+        """
+
+        md5, entry = self.__get_entry( digest )
+        if entry == None:
+            return -1
+        if entry[0] < 0:
+            text = self.get_text( md5 )
+            if text == None:
+                return -1
+        return entry[0]
+
+    def get_text( self, digest ):
+        """
+        Returns a text.
+
+        @type digest: string
+        @param digest: The md5 or sha1 sum.
+        @rtype: string
+        @return: The text or None if it is not known or has been lost.
+        """
+
+        md5, entry = self.__get_entry( digest )
+        if entry == None:
+            return None
+        text = self.__memory.get( md5 )
+        if text != None:
+            return text
+        if entry[3] >= 0:
+            self.__spill.seek( entry[3] )
+            text = self.__spill.read( entry[0] )
+        elif entry[1] != None:
+            text = self.__read( entry[1] )
+            entry[0] = len( text )
+        else:
+            # dropped from memory without spill file
+            return None
+        self.__keep( md5, text )
+        return text
+
+    def close( self ):
+        """
+        Closes the spill file and forgets all texts.
+        """
+
+        if self.__spill != None:
+            self.__spill.close()
+            self.__spill = None
+        self.__entries = {}
+        self.__sha1s = {}
+        self.__memory = LRUCache( 0 )
@@ -21,6 +21,9 @@
 #===============================================================================
 
 import calendar
+from collections import deque
+from itertools import imap, izip, repeat
+import threading
 import time
 
 try:
@@ -30,6 +33,12 @@ except ImportError:
 
 __doc__ = """Common functions and classes."""
 
+# size of the chunks texts are read in, see set_read_chunk_size()
+read_chunk_size = 1024 * 1024
+
+# the chunk buffer of each thread
+_chunk_buffers = threading.local()
+
 # perhaps some of these date functions can be replaced by
 # functions provided by the svn python bindings +++++
 # <sussman> it's our own string format, in libsvn_subr/time.c
@@ -72,6 +81,22 @@ def is_valid_md5_string( md5 ):
         return False
     return True
 
+def is_valid_sha1_string( sha1 ):
+    """
+    Checks a sha1 string.
+
+    @type sha1: object
+    @param sha1: Index or key.
+    @rtype: bool
+    @return: True if the string looks like a sha1 sum.
+    """
+
+    if len( sha1 ) != 40:
+        return False
+    if sha1.lower().strip( "0123456789abcdef" ) != "":
+        return False
+    return True
+
 class SvnDumpException( Exception ):
     """A simple exception class."""
     
@@ -81,44 +106,36 @@ class SvnDumpException( Exception ):
     def __str__( self ):
         return self.text
 
-class ListDictIter:
-    """
-    Iterator class used by ListDict.
-    """
-
-    def __init__( self, listdict, type ):
-        self.__listdict = listdict
-        self.__type = type
-        self.__index = 0
-
-    def __iter__( self ):
-        return self
-
-    def next( self ):
-        index = self.__index
-        if index >= len( self.__listdict ):
-            raise StopIteration()
-        self.__index = index+1
-        if self.__type == 1:
-            return self.__listdict.key( index )
-        elif self.__type == 2:
-            return self.__listdict[ index ]
-        else:
-            return self.__listdict.item( index )
-
 class ListDict( dict ):
     """
     A mix of list and dict.
 
     If the key is an int this class acts like a list else like a dict.
+
+    Lookup, insert and delete are O(1). The keys are kept in a list in
+    insertion order; deleted keys are removed from that list lazily the
+    next time it is used, so deleting many keys doesn't cost O(n) each.
     """
 
+    __slots__ = ( "__keys", "__deleted" )
+
     def __init__( self ):
         """
         Initialize.
         """
         dict.__init__( self )
-        self.__index = []
+        # the keys in insertion order, may contain deleted keys
+        self.__keys = []
+        # keys deleted but still in __keys or None
+        self.__deleted = None
+
+    def __compact( self ):
+        """
+        Removes the deleted keys from the key list.
+        """
+        deleted = self.__deleted
+        self.__deleted = None
+        self.__keys = [ key for key in self.__keys if not key in deleted ]
 
     def __delitem__( self, key ):
         """
@@ -128,12 +145,11 @@ class ListDict( dict ):
         @param key: Index or key.
         """
         if type( key ) is int:
-            index = key
-            key = self.__index[index]
-        else:
-            index = self.__index.index( key )
-        del self.__index[index]
+            key = self.__get_keys()[key]
         dict.__delitem__( self, key )
+        if self.__deleted == None:
+            self.__deleted = set()
+        self.__deleted.add( key )
 
     def __getitem__( self, key ):
         """
@@ -145,17 +161,17 @@ class ListDict( dict ):
         @return: An object.
         """
         if type( key ) is int:
-            key = self.__index[key]
+            key = self.__get_keys()[key]
         return dict.__getitem__( self, key )
 
     def __iter__( self ):
         """
-        Returns an iterator returning key/value tuples ordered by index.
+        Returns an iterator returning the keys ordered by index.
 
         @rtype: iterator
-        @return: An iterator over the items.
+        @return: An iterator over the keys.
         """
-        return ListDictIter( self, 1 )
+        return iter( self.__get_keys() )
 
     def __setitem__( self, key, value ):
         """
@@ -169,18 +185,33 @@ class ListDict( dict ):
         @param value: A value.
         """
         if type( key ) is int:
-            key = self.__index[key]
-        if not self.has_key( key ):
-            self.__index.append( key )
+            key = self.__get_keys()[key]
+        elif not dict.__contains__( self, key ):
+            if self.__deleted != None and key in self.__deleted:
+                # re-added, remove the old position first
+                self.__compact()
+            self.__keys.append( key )
         dict.__setitem__( self, key, value )
 
+    def __get_keys( self ):
+        """
+        Returns the list of keys without deleted keys.
+
+        @rtype: list
+        @return: The internal list of keys.
+        """
+        if self.__deleted != None:
+            self.__compact()
+        return self.__keys
+
     def clear( self ):
         """
         Clears this ListDict.
         """
 
         dict.clear( self )
-        self.__index = []
+        self.__keys = []
+        self.__deleted = None
 
     def item( self, index ):
         """
@@ -191,7 +222,7 @@ class ListDict( dict ):
         @rtype: tuple
         @return: An item (key/value pair).
         """
-        key = self.__index[ index ]
+        key = self.__get_keys()[ index ]
         return ( key, dict.__getitem__( self, key ) )
 
     def items( self ):
@@ -201,10 +232,7 @@ class ListDict( dict ):
         @rtype: list
         @return: A list of values.
         """
-        ret = []
-        for key in self.__index:
-            ret.append( ( key, dict.__getitem__( self, key ) ) )
-        return ret
+        return list( self.iteritems() )
 
     def iteritems( self ):
         """
@@ -213,7 +241,8 @@ class ListDict( dict ):
         @rtype: iterator
         @return: An iterator over the items.
         """
-        return ListDictIter( self, 0 )
+        keys = self.__get_keys()
+        return izip( keys, imap( dict.__getitem__, repeat( self ), keys ) )
 
     def iterkeys( self ):
         """
@@ -222,7 +251,7 @@ class ListDict( dict ):
         @rtype: iterator
         @return: An iterator over the keys.
         """
-        return ListDictIter( self, 1 )
+        return iter( self.__get_keys() )
 
     def itervalues( self ):
         """
@@ -231,7 +260,7 @@ class ListDict( dict ):
         @rtype: iterator
         @return: An iterator over the values.
         """
-        return ListDictIter( self, 2 )
+        return imap( dict.__getitem__, repeat( self ), self.__get_keys() )
 
     def key( self, index ):
         """
@@ -242,7 +271,7 @@ class ListDict( dict ):
         @rtype: object
         @return: A key.
         """
-        return self.__index[ index ]
+        return self.__get_keys()[ index ]
 
     def keys( self ):
         """
@@ -251,7 +280,7 @@ class ListDict( dict ):
         @rtype: list
         @return: A list of keys.
         """
-        return self.__index
+        return self.__get_keys()[:]
 
     def values( self ):
         """
@@ -260,10 +289,207 @@ class ListDict( dict ):
         @rtype: list
         @return: A list of values.
         """
-        ret = []
-        for key in self.__index:
-            ret.append( dict.__getitem__( self, key ) )
-        return ret
+        return list( self.itervalues() )
+
+class LRUCache:
+    """
+    A dict with a size limit, the least recently used entries are dropped
+    when the total size of the values exceeds it.
+    """
+
+    def __init__( self, maxsize, dropped=None ):
+        """
+        Initialize.
+
+        @type maxsize: integer
+        @param maxsize: Maximal total size of the values.
+        @type dropped: function( key, value )
+        @param dropped: Called for each entry dropped to make room for new
+            ones, or None.
+        """
+
+        # maximal total size of the values
+        self.__maxsize = maxsize
+        # called with key and value of dropped entries
+        self.__dropped = dropped
+        # total size of the values
+        self.__size = 0
+        # key -> [ value, size, stamp ]
+        self.__entries = {}
+        # ( stamp, key ) in order of use, may contain outdated stamps
+        self.__order = deque()
+        # stamp of the last use
+        self.__stamp = 0
+
+    def __len__( self ):
+        """
+        Returns the count of entries.
+
+        @rtype: integer
+        @return: Count of entries.
+        """
+        return len( self.__entries )
+
+    def has_key( self, key ):
+        """
+        Returns True if the cache contains the key.
+
+        @type key: object
+        @param key: A key.
+        @rtype: bool
+        @return: True if the key is in the cache.
+        """
+        return self.__entries.has_key( key )
+
+    def get_size( self ):
+        """
+        Returns the total size of the values.
+
+        @rtype: integer
+        @return: Total size.
+        """
+        return self.__size
+
+    def get( self, key ):
+        """
+        Returns the value of a key and marks it as recently used.
+
+        @type key: object
+        @param key: A key.
+        @rtype: object
+        @return: The value or None if it is not in the cache.
+        """
+
+        entry = self.__entries.get( key )
+        if entry == None:
+            return None
+        self.__touch( key, entry )
+        return entry[0]
+
+    def put( self, key, value, size ):
+        """
+        Adds or replaces a value, dropping old entries if needed.
+
+        @type key: object
+        @param key: A key.
+        @type value: object
+        @param value: The value.
+        @type size: integer
+        @param size: Size of the value.
+        @rtype: bool
+        @return: False if the value is bigger than the cache.
+        """
+
+        self.remove( key )
+        if size > self.__maxsize:
+            return False
+        entry = [ value, size, 0 ]
+        self.__entries[key] = entry
+        self.__size += size
+        self.__touch( key, entry )
+        while self.__size > self.__maxsize:
+            self.__drop_oldest()
+        return True
+
+    def remove( self, key ):
+        """
+        Removes a key if it is in the cache.
+
+        @type key: object
+        @param key: A key.
+        """
+
+        entry = self.__entries.get( key )
+        if entry != None:
+            del self.__entries[key]
+            self.__size -= entry[1]
+
+    def __touch( self, key, entry ):
+        """
+        Marks an entry as the most recently used.
+
+        @type key: object
+        @param key: The key.
+        @type entry: list
+        @param entry: The entry of the key.
+        """
+
+        self.__stamp += 1
+        entry[2] = self.__stamp
+        self.__order.append( ( self.__stamp, key ) )
+        if len( self.__order ) > 2 * len( self.__entries ) + 16:
+            # drop the outdated stamps
+            order = [ ( entry[2], key )
+                      for key, entry in self.__entries.iteritems() ]
+            order.sort()
+            self.__order = deque( order )
+
+    def __drop_oldest( self ):
+        """
+        Removes the least recently used entry.
+        """
+
+        while len( self.__order ) > 0:
+            stamp, key = self.__order.popleft()
+            entry = self.__entries.get( key )
+            if entry != None and entry[2] == stamp:
+                self.remove( key )
+                if self.__dropped != None:
+                    self.__dropped( key, entry[0] )
+                return
+
+def parse_properties( data, offset, length ):
+    """
+    Parses a property block.
+
+    @type data: string or mmap
+    @param data: An object containing the property block.
+    @type offset: integer
+    @param offset: Offset of the property block in data.
+    @type length: integer
+    @param length: Length of the property block including PROPS-END.
+    @rtype: ListDict
+    @return: A dict containing the properties.
+    """
+
+    pos = offset
+    end = offset + length
+    props = ListDict()
+    while True:
+        # key
+        eol = data.find( "\n", pos, end )
+        if eol < 0:
+            raise SvnDumpException, "missing PROPS-END"
+        line = data[pos:eol]
+        pos = eol + 1
+        if line == "PROPS-END":
+            break
+        words = line.split()
+        if len( words ) != 2 or (words[0] != "K" and words[0] != "D"):
+            raise SvnDumpException, "illegal proprty key ???"
+        keyend = pos + int(words[1])
+        key = data[pos:keyend]
+        if keyend >= end or data[keyend] != "\n":
+            raise SvnDumpException, "expected empty line after key '%s'" % key
+        pos = keyend + 1
+        # value
+        value = None
+        if words[0] == "K":
+            eol = data.find( "\n", pos, end )
+            if eol < 0:
+                raise SvnDumpException, "missing PROPS-END"
+            words = data[pos:eol].split()
+            if len( words ) != 2 or words[0] != "V":
+                raise SvnDumpException, "illegal proprty value ???"
+            pos = eol + 1
+            valueend = pos + int(words[1])
+            value = data[pos:valueend]
+            if valueend >= end or data[valueend] != "\n":
+                raise SvnDumpException, "expected empty line after value of '%s'" % key
+            pos = valueend + 1
+        # set property
+        props[key] = value
+    return props
 
 def sdt_md5():
     """
@@ -273,3 +499,150 @@ def sdt_md5():
     """
     return hashlib.md5()
 
+def sdt_sha1():
+    """
+    Returns a new sha1 object.
+    """
+    return hashlib.sha1()
+
+class MultiDigest:
+    """
+    Calculates several digests of a text in one pass.
+    """
+
+    def __init__( self, names ):
+        """
+        Initialize.
+
+        @type names: list( string )
+        @param names: Names of the digests: 'md5', 'sha1' or 'sha256'.
+        """
+
+        # ( name, digest object ) tuples
+        self.__digests = []
+        for name in names:
+            if name == "md5":
+                digest = sdt_md5()
+            else:
+                digest = hashlib.new( name )
+            self.__digests.append( ( name, digest ) )
+
+    def update( self, data ):
+        """
+        Adds data to all digests.
+
+        @type data: string
+        @param data: Some data.
+        """
+
+        for name, digest in self.__digests:
+            digest.update( data )
+
+    def hexdigest( self, name ):
+        """
+        Returns one of the digests as hex string.
+
+        @type name: string
+        @param name: Name of the digest.
+        @rtype: string
+        @return: The digest.
+        """
+
+        for dname, digest in self.__digests:
+            if dname == name:
+                return digest.hexdigest()
+        raise SvnDumpException, "digest '%s' not calculated" % name
+
+    def hexdigests( self ):
+        """
+        Returns all digests as hex strings.
+
+        @rtype: dict( string -> string )
+        @return: Name -> digest.
+        """
+
+        digests = {}
+        for name, digest in self.__digests:
+            digests[name] = digest.hexdigest()
+        return digests
+
+
+def set_read_chunk_size( size ):
+    """
+    Sets the size of the chunks in which texts are copied and hashed.
+
+    @type size: integer
+    @param size: Chunk size in bytes.
+    """
+    global read_chunk_size
+    read_chunk_size = max( 1, size )
+
+def get_read_chunk_size():
+    """
+    Returns the size of the chunks in which texts are copied and hashed.
+
+    @rtype: integer
+    @return: Chunk size in bytes.
+    """
+    return read_chunk_size
+
+def _chunk_buffer():
+    """
+    Returns the chunk buffer of the current thread.
+
+    The buffer is reused for all reads, it is reallocated when the chunk
+    size changes.
+
+    @rtype: ( bytearray, memoryview )
+    @return: The buffer and a view of it.
+    """
+
+    chunk = getattr( _chunk_buffers, "chunk", None )
+    if chunk == None or len( chunk[0] ) != read_chunk_size:
+        buf = bytearray( read_chunk_size )
+        chunk = ( buf, memoryview( buf ) )
+        _chunk_buffers.chunk = chunk
+    return chunk
+
+def read_chunks( infile, length, consume ):
+    """
+    Reads data from the current position of a file in chunks.
+
+    Data not fitting into one chunk is read into the reused chunk buffer
+    of the thread with readinto() if the file object supports it, so no
+    string is allocated per chunk. The chunks passed to consume are only
+    valid during the call.
+
+    @type infile: file object
+    @param infile: A file object opened for reading.
+    @type length: integer
+    @param length: Count of bytes to read.
+    @type consume: function( data )
+    @param consume: Called with each chunk (a string or buffer), for
+        example the write() method of a file or update() of a digest.
+    @rtype: integer
+    @return: Count of bytes read, less than length at end of file.
+    """
+
+    if length <= read_chunk_size or not hasattr( infile, "readinto" ):
+        total = 0
+        while total < length:
+            data = infile.read( min( length - total, read_chunk_size ) )
+            if len( data ) == 0:
+                break
+            consume( data )
+            total += len( data )
+        return total
+    buf, view = _chunk_buffer()
+    total = 0
+    while total < length:
+        n = length - total
+        if n >= len( buf ):
+            n = infile.readinto( buf )
+        else:
+            n = infile.readinto( view[:n] )
+        if n == 0:
+            break
+        consume( buffer( buf, 0, n ) )
+        total += n
+    return total
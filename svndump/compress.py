@@ -0,0 +1,335 @@
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+import bz2
+import gzip
+import os
+import subprocess
+import sys
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        # xz is done by running the xz program
+        lzma = None
+
+from common import *
+
+__doc__ = """Transparent compression of dump files."""
+
+# magic bytes at the start of compressed files
+__magics = [
+    ( "\x1f\x8b", "gz" ),
+    ( "BZh", "bz2" ),
+    ( "\xfd7zXZ\x00", "xz" ),
+]
+
+# file name extension -> compression
+__extensions = {
+    ".gz":      "gz",
+    ".bz2":     "bz2",
+    ".xz":      "xz",
+}
+
+def compression_from_magic( header ):
+    """
+    Returns the compression of a file by looking at its first bytes.
+
+    @type header: string
+    @param header: The first (at least 6) bytes of the file.
+    @rtype: string
+    @return: 'gz', 'bz2', 'xz' or None if not compressed.
+    """
+    for magic, compression in __magics:
+        if header.startswith( magic ):
+            return compression
+    return None
+
+def compression_from_name( filename ):
+    """
+    Returns the compression of a file by looking at its extension.
+
+    @type filename: string
+    @param filename: Name of the file.
+    @rtype: string
+    @return: 'gz', 'bz2', 'xz' or None if not compressed.
+    """
+    return __extensions.get( os.path.splitext( filename )[1].lower() )
+
+def new_decompressor( compression ):
+    """
+    Returns a new decompressor object.
+
+    @type compression: string
+    @param compression: 'gz', 'bz2' or 'xz'.
+    @rtype: decompressor object
+    @return: An object with decompress() and unused_data.
+    """
+    if compression == "gz":
+        return zlib.decompressobj( 16 + zlib.MAX_WBITS )
+    elif compression == "bz2":
+        return bz2.BZ2Decompressor()
+    elif compression == "xz" and lzma != None:
+        return lzma.LZMADecompressor()
+    raise SvnDumpException, "unsupported compression '%s'" % compression
+
+class DecompressReader:
+    """
+    A forward-only reader returning the decompressed data of a file.
+
+    Concatenated streams (as created by 'cat a.gz b.gz') are supported.
+    Like a pipe it can't tell() or seek().
+    """
+
+    def __init__( self, fileobj, compression, data="", process=None ):
+        """
+        Initialize.
+
+        @type fileobj: file object
+        @param fileobj: The file to read the compressed data from.
+        @type compression: string
+        @param compression: 'gz', 'bz2', 'xz' or None for no decompression.
+        @type data: string
+        @param data: Data already read from fileobj.
+        @type process: subprocess.Popen
+        @param process: Process writing to fileobj (waited for on close).
+        """
+
+        # the compressed input
+        self.__file = fileobj
+        # the compression
+        self.__compression = compression
+        # the decompressor or None
+        self.__decomp = None
+        if compression != None:
+            self.__decomp = new_decompressor( compression )
+        # the process writing to __file or None
+        self.__process = process
+        # decompressed data
+        self.__buf = ""
+        # position in __buf
+        self.__pos = 0
+        # end of input reached
+        self.__eof = False
+        if len( data ) > 0:
+            self.__buf = self.__decompress( data )
+
+    def __decompress( self, data ):
+        """
+        Decompresses some data.
+
+        @type data: string
+        @param data: Compressed data.
+        @rtype: string
+        @return: Decompressed data.
+        """
+        if self.__decomp == None:
+            return data
+        out = []
+        while len( data ) > 0:
+            try:
+                out.append( self.__decomp.decompress( data ) )
+            except EOFError:
+                # bz2 stream ended at the end of the previous chunk
+                self.__decomp = new_decompressor( self.__compression )
+                continue
+            data = self.__decomp.unused_data
+            if len( data ) > 0:
+                # next concatenated stream
+                self.__decomp = new_decompressor( self.__compression )
+        return "".join( out )
+
+    def __fill( self ):
+        """
+        Reads and decompresses the next chunk of input.
+        """
+        data = self.__file.read( 65536 )
+        if len( data ) == 0:
+            self.__eof = True
+        else:
+            self.__buf = self.__buf[self.__pos:] + self.__decompress( data )
+            self.__pos = 0
+
+    def readline( self ):
+        """
+        Reads one line.
+
+        @rtype: string
+        @return: The line including the LF.
+        """
+        n = self.__buf.find( "\n", self.__pos )
+        while n < 0 and not self.__eof:
+            searched = len( self.__buf ) - self.__pos
+            self.__fill()
+            n = self.__buf.find( "\n", searched )
+        if n < 0:
+            n = len( self.__buf )
+        else:
+            n += 1
+        line = self.__buf[self.__pos:n]
+        self.__pos = n
+        return line
+
+    def read( self, length ):
+        """
+        Reads some bytes.
+
+        @type length: integer
+        @param length: Count of bytes to read.
+        @rtype: string
+        @return: The data read.
+        """
+        while len( self.__buf ) - self.__pos < length and not self.__eof:
+            self.__fill()
+        data = self.__buf[self.__pos:self.__pos+length]
+        self.__pos += len( data )
+        return data
+
+    def tell( self ):
+        """
+        Always fails, the reader is not seekable.
+        """
+        raise IOError, "decompressed input is not seekable"
+
+    def close( self ):
+        """
+        Closes the input.
+        """
+        if self.__file != sys.stdin:
+            self.__file.close()
+        if self.__process != None:
+            self.__process.wait()
+            self.__process = None
+
+class PipeWriter:
+    """
+    Writes to a file through a compressing program like xz.
+    """
+
+    def __init__( self, filename, command ):
+        """
+        Initialize.
+
+        @type filename: string
+        @param filename: Name of the file to create.
+        @type command: list( string )
+        @param command: The program and its arguments.
+        """
+        outfile = open( filename, "wb" )
+        try:
+            self.__process = subprocess.Popen( command, stdin=subprocess.PIPE,
+                                               stdout=outfile )
+        finally:
+            outfile.close()
+        self.__file = self.__process.stdin
+
+    def write( self, data ):
+        """
+        Writes some data.
+
+        @type data: string
+        @param data: The data to write.
+        """
+        self.__file.write( data )
+
+    def writelines( self, lines ):
+        """
+        Writes some lines.
+
+        @type lines: list( string )
+        @param lines: The lines to write.
+        """
+        self.__file.writelines( lines )
+
+    def close( self ):
+        """
+        Closes the pipe and waits for the program to finish.
+        """
+        self.__file.close()
+        if self.__process.wait() != 0:
+            raise SvnDumpException, "compressing program failed"
+
+def open_input_file( filename ):
+    """
+    Opens a dump file for reading, decompressing it if necessary.
+
+    Compression is detected by the magic bytes at the start of the file.
+    Uncompressed files (except stdin) are returned as normal file
+    objects so they can be seeked and memory mapped.
+
+    @type filename: string
+    @param filename: Name of the file or '-' for stdin.
+    @rtype: file object
+    @return: A file or a DecompressReader.
+    """
+
+    if filename == "-":
+        # can't look ahead in a pipe, so always use a reader
+        header = sys.stdin.read( 6 )
+        compression = compression_from_magic( header )
+        if compression == "xz" and lzma == None:
+            raise SvnDumpException, \
+                    "reading xz from stdin needs the lzma module"
+        return DecompressReader( sys.stdin, compression, header )
+    infile = open( filename, "rb" )
+    header = infile.read( 6 )
+    infile.seek( 0 )
+    compression = compression_from_magic( header )
+    if compression == None:
+        return infile
+    if compression == "xz" and lzma == None:
+        infile.close()
+        process = subprocess.Popen( [ "xz", "-dc", filename ],
+                                    stdout=subprocess.PIPE )
+        return DecompressReader( process.stdout, None, process=process )
+    return DecompressReader( infile, compression )
+
+def open_output_file( filename, bufsize=-1 ):
+    """
+    Creates a dump file, compressing it if the extension asks for it.
+
+    The extensions .gz, .bz2 and .xz select the compression.
+
+    @type filename: string
+    @param filename: Name of the file.
+    @type bufsize: integer
+    @param bufsize: Size of the write buffer of uncompressed files, -1
+        for the system default.
+    @rtype: file object
+    @return: An object with write(), writelines() and close().
+    """
+
+    compression = compression_from_name( filename )
+    if compression == "gz":
+        return gzip.GzipFile( filename, "wb" )
+    elif compression == "bz2":
+        return bz2.BZ2File( filename, "wb" )
+    elif compression == "xz":
+        if lzma != None:
+            return lzma.LZMAFile( filename, "wb" )
+        return PipeWriter( filename, [ "xz", "-c" ] )
+    return open( filename, "wb", bufsize )
+
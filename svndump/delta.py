@@ -0,0 +1,820 @@
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+from bisect import bisect_right
+import zlib
+
+from common import *
+
+__doc__ = """Text deltas (svndiff) of dump format version 3."""
+
+# size of the windows of svndiff data created by svn
+SVNDIFF_WINDOW_SIZE = 102400
+
+# default size of the cache for fulltexts and properties
+DELTA_CACHE_SIZE = 64 * 1024 * 1024
+
+# texts longer than this are written as fulltext instead of as delta
+DELTA_MAX_TEXT_SIZE = 16 * 1024 * 1024
+
+# minimal length of a copy from the source when creating a delta
+_MATCH_BLOCK = 32
+
+# base key of a delta whose base is not known
+_MISSING = -1
+
+def _read_varint( data, pos ):
+    """
+    Reads a variable length integer.
+
+    @type data: string
+    @param data: The data.
+    @type pos: integer
+    @param pos: Offset of the integer.
+    @rtype: ( integer, integer )
+    @return: The integer and the offset after it.
+    """
+
+    value = 0
+    while True:
+        if pos >= len( data ):
+            raise SvnDumpException, "svndiff: truncated integer"
+        c = ord( data[pos] )
+        pos += 1
+        value = ( value << 7 ) | ( c & 0x7f )
+        if c < 0x80:
+            return value, pos
+
+def _varint( value ):
+    """
+    Encodes a variable length integer.
+
+    @type value: integer
+    @param value: A non-negative integer.
+    @rtype: string
+    @return: The encoded integer.
+    """
+
+    chars = [ chr( value & 0x7f ) ]
+    value >>= 7
+    while value > 0:
+        chars.append( chr( 0x80 | ( value & 0x7f ) ) )
+        value >>= 7
+    chars.reverse()
+    return "".join( chars )
+
+def _decompress_section( data ):
+    """
+    Decodes an instruction or new data section of svndiff1.
+
+    @type data: string
+    @param data: The section.
+    @rtype: string
+    @return: The decompressed section.
+    """
+
+    length, pos = _read_varint( data, 0 )
+    if len( data ) - pos == length:
+        # stored uncompressed
+        return data[pos:]
+    try:
+        data = zlib.decompress( data[pos:] )
+    except zlib.error, e:
+        raise SvnDumpException, "svndiff: %s" % e
+    if len( data ) != length:
+        raise SvnDumpException, "svndiff: wrong length of section"
+    return data
+
+def _compress_section( data ):
+    """
+    Encodes an instruction or new data section of svndiff1.
+
+    @type data: string
+    @param data: The section.
+    @rtype: string
+    @return: The section, compressed if that makes it smaller.
+    """
+
+    header = _varint( len( data ) )
+    if len( data ) > 0:
+        compressed = zlib.compress( data )
+        if len( compressed ) < len( data ):
+            return header + compressed
+    return header + data
+
+def _apply_window( sview, ins, new, tview_len ):
+    """
+    Applies the instructions of one svndiff window.
+
+    @type sview: string
+    @param sview: The source view.
+    @type ins: string
+    @param ins: The instructions.
+    @type new: string
+    @param new: The new data.
+    @type tview_len: integer
+    @param tview_len: Length of the target view.
+    @rtype: string
+    @return: The target view.
+    """
+
+    target = bytearray()
+    pos = 0
+    newpos = 0
+    while pos < len( ins ):
+        c = ord( ins[pos] )
+        pos += 1
+        op = c >> 6
+        length = c & 0x3f
+        if length == 0:
+            length, pos = _read_varint( ins, pos )
+        if op == 2:
+            # copy from new data
+            if newpos + length > len( new ):
+                raise SvnDumpException, "svndiff: new data overflow"
+            target.extend( new[newpos:newpos+length] )
+            newpos += length
+            continue
+        offset, pos = _read_varint( ins, pos )
+        if op == 0:
+            # copy from source view
+            if offset + length > len( sview ):
+                raise SvnDumpException, "svndiff: source view overflow"
+            target.extend( sview[offset:offset+length] )
+        elif op == 1:
+            # copy from target view, may overlap the bytes being written
+            if offset >= len( target ):
+                raise SvnDumpException, "svndiff: target view overflow"
+            end = offset + length
+            if end <= len( target ):
+                target.extend( target[offset:end] )
+            else:
+                pattern = target[offset:]
+                while length > 0:
+                    chunk = pattern[:length]
+                    target.extend( chunk )
+                    length -= len( chunk )
+        else:
+            raise SvnDumpException, "svndiff: invalid instruction"
+    if len( target ) != tview_len:
+        raise SvnDumpException, "svndiff: wrong length of target view"
+    return str( target )
+
+def svndiff_windows( source, delta ):
+    """
+    Applies svndiff0 or svndiff1 data window by window.
+
+    @type source: string
+    @param source: The source (delta base) text.
+    @type delta: string
+    @param delta: The svndiff data.
+    @rtype: generator
+    @return: A generator returning the target text in pieces.
+    """
+
+    if len( delta ) < 4 or delta[:3] != "SVN":
+        raise SvnDumpException, "svndiff: invalid header"
+    version = ord( delta[3] )
+    if version > 1:
+        raise SvnDumpException, "svndiff version %d not supported" % version
+    pos = 4
+    while pos < len( delta ):
+        sview_offset, pos = _read_varint( delta, pos )
+        sview_len, pos = _read_varint( delta, pos )
+        tview_len, pos = _read_varint( delta, pos )
+        ins_len, pos = _read_varint( delta, pos )
+        new_len, pos = _read_varint( delta, pos )
+        if pos + ins_len + new_len > len( delta ):
+            raise SvnDumpException, "svndiff: truncated window"
+        ins = delta[pos:pos+ins_len]
+        pos += ins_len
+        new = delta[pos:pos+new_len]
+        pos += new_len
+        if version == 1:
+            ins = _decompress_section( ins )
+            new = _decompress_section( new )
+        if sview_offset + sview_len > len( source ):
+            raise SvnDumpException, "svndiff: source view beyond delta base"
+        sview = source[sview_offset:sview_offset+sview_len]
+        yield _apply_window( sview, ins, new, tview_len )
+
+def apply_svndiff( source, delta ):
+    """
+    Applies svndiff0 or svndiff1 data to a text.
+
+    @type source: string
+    @param source: The source (delta base) text.
+    @type delta: string
+    @param delta: The svndiff data.
+    @rtype: string
+    @return: The target text.
+    """
+
+    return "".join( svndiff_windows( source, delta ) )
+
+def _match_length( a, i, b, j, limit ):
+    """
+    Returns the length of the common part of a[i:] and b[j:].
+
+    @type a: string
+    @param a: A string.
+    @type i: integer
+    @param i: Offset into a.
+    @type b: string
+    @param b: A string.
+    @type j: integer
+    @param j: Offset into b.
+    @type limit: integer
+    @param limit: Maximal length.
+    @rtype: integer
+    @return: The length.
+    """
+
+    n = 0
+    while n + 64 <= limit and a[i+n:i+n+64] == b[j+n:j+n+64]:
+        n += 64
+    while n < limit and a[i+n] == b[j+n]:
+        n += 1
+    return n
+
+def _instruction( op, length, offset=0 ):
+    """
+    Encodes an svndiff instruction.
+
+    @type op: integer
+    @param op: 0 = copy from source, 2 = copy from new data.
+    @type length: integer
+    @param length: Count of bytes.
+    @type offset: integer
+    @param offset: Offset into the source view.
+    @rtype: string
+    @return: The instruction.
+    """
+
+    if length < 64:
+        ins = chr( ( op << 6 ) | length )
+    else:
+        ins = chr( op << 6 ) + _varint( length )
+    if op != 2:
+        ins += _varint( offset )
+    return ins
+
+def _delta_window( sview, tview ):
+    """
+    Creates the instructions and new data of one window.
+
+    The common prefix and suffix are copied from the source, the rest is
+    matched against the source in blocks of _MATCH_BLOCK bytes.
+
+    @type sview: string
+    @param sview: The source view.
+    @type tview: string
+    @param tview: The target view.
+    @rtype: ( string, string )
+    @return: Instructions and new data.
+    """
+
+    ins = []
+    new = []
+    slen = len( sview )
+    tlen = len( tview )
+    prefix = _match_length( sview, 0, tview, 0, min( slen, tlen ) )
+    if prefix == tlen:
+        if tlen > 0:
+            ins.append( _instruction( 0, tlen, 0 ) )
+        return "".join( ins ), ""
+    suffix = 0
+    limit = min( slen, tlen ) - prefix
+    while suffix < limit and sview[slen-suffix-1] == tview[tlen-suffix-1]:
+        suffix += 1
+    if prefix > 0:
+        ins.append( _instruction( 0, prefix, 0 ) )
+    end = tlen - suffix
+    index = {}
+    for k in range( slen - _MATCH_BLOCK, -1, -_MATCH_BLOCK ):
+        index[sview[k:k+_MATCH_BLOCK]] = k
+    pending = prefix
+    j = prefix
+    if len( index ) == 0:
+        # the source is too short to match, the rest is new data
+        j = end
+    while j + _MATCH_BLOCK <= end:
+        k = index.get( tview[j:j+_MATCH_BLOCK] )
+        if k == None:
+            j += 1
+            continue
+        # extend the match backwards into the pending new data
+        while j > pending and k > 0 and tview[j-1] == sview[k-1]:
+            j -= 1
+            k -= 1
+        length = _match_length( sview, k, tview, j, min( slen - k, end - j ) )
+        if j > pending:
+            ins.append( _instruction( 2, j - pending ) )
+            new.append( tview[pending:j] )
+        ins.append( _instruction( 0, length, k ) )
+        j += length
+        pending = j
+    if end > pending:
+        ins.append( _instruction( 2, end - pending ) )
+        new.append( tview[pending:end] )
+    if suffix > 0:
+        ins.append( _instruction( 0, suffix, slen - suffix ) )
+    return "".join( ins ), "".join( new )
+
+def create_svndiff( source, target, version=1 ):
+    """
+    Creates svndiff data transforming source into target.
+
+    Like svn the texts are processed in windows of SVNDIFF_WINDOW_SIZE
+    bytes, each target window is compared with the source window at the
+    same offset.
+
+    @type source: string
+    @param source: The source (delta base) text.
+    @type target: string
+    @param target: The target text.
+    @type version: integer
+    @param version: 0 for svndiff0, 1 for svndiff1 (zlib compressed).
+    @rtype: string
+    @return: The svndiff data.
+    """
+
+    parts = [ "SVN" + chr( version ) ]
+    for offset in range( 0, len( target ), SVNDIFF_WINDOW_SIZE ):
+        tview = target[offset:offset+SVNDIFF_WINDOW_SIZE]
+        sview = source[offset:offset+SVNDIFF_WINDOW_SIZE]
+        ins, new = _delta_window( sview, tview )
+        if version == 1:
+            ins = _compress_section( ins )
+            new = _compress_section( new )
+        parts.append( _varint( min( offset, len( source ) ) ) )
+        parts.append( _varint( len( sview ) ) )
+        parts.append( _varint( len( tview ) ) )
+        parts.append( _varint( len( ins ) ) )
+        parts.append( _varint( len( new ) ) )
+        parts.append( ins )
+        parts.append( new )
+    return "".join( parts )
+
+class ContentHistory:
+    """
+    Keeps track of the nodes holding the text and properties of the paths
+    of a dump in each revision.
+
+    For every node an event is recorded for its path. The content of a
+    path in a revision is that of the newest event of the path itself or
+    of one of its parent directories: a parent deleted or added later
+    means the path doesn't exist, a parent copied later means the content
+    is that of the path below the copy source.
+    """
+
+    def __init__( self ):
+        """
+        Initialize.
+        """
+
+        # path -> ( revision numbers, events ), an event is a tuple
+        # ( sequence number, content or None if deleted, children source )
+        self.__paths = {}
+        # sequence number of the next event
+        self.__seq = 0
+
+    def __last_event( self, path, revnr ):
+        """
+        Returns the last event of a path up to a revision.
+
+        @type path: string
+        @param path: A path.
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: tuple
+        @return: The event or None.
+        """
+
+        entry = self.__paths.get( path )
+        if entry == None:
+            return None
+        i = bisect_right( entry[0], revnr ) - 1
+        if i < 0:
+            return None
+        return entry[1][i]
+
+    def lookup( self, path, revnr ):
+        """
+        Returns the content of a path in a revision.
+
+        The children source is what the children of a directory come from,
+        ( path, revnr ) of the copy source or None.
+
+        @type path: string
+        @param path: A path.
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: ( tuple, tuple )
+        @return: The content and the children source, the content is
+            None if the path doesn't exist.
+        """
+
+        orgpath = path
+        orgrevnr = revnr
+        while True:
+            best = None
+            bestpath = None
+            parent = path
+            while True:
+                event = self.__last_event( parent, revnr )
+                if event != None and ( best == None or event[0] > best[0] ):
+                    best = event
+                    bestpath = parent
+                i = parent.rfind( "/" )
+                if i < 0:
+                    break
+                parent = parent[:i]
+            if best == None:
+                return None, None
+            if bestpath == path:
+                if best[1] == None:
+                    return None, None
+                source = best[2]
+                if path != orgpath or revnr != orgrevnr:
+                    # found below a copy, children are found there too
+                    source = ( path, revnr )
+                return best[1], source
+            if best[1] == None or best[2] == None:
+                # parent deleted or added without copy
+                return None, None
+            # look at the path below the copy source
+            path = best[2][0] + path[len( bestpath ):]
+            revnr = best[2][1]
+
+    def add( self, revnr, path, content, source ):
+        """
+        Records the content of a path.
+
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        @type content: tuple
+        @param content: The content.
+        @type source: tuple
+        @param source: ( path, revnr ) the children come from or None.
+        """
+
+        entry = self.__paths.get( path )
+        if entry == None:
+            entry = ( [], [] )
+            self.__paths[path] = entry
+        entry[0].append( revnr )
+        entry[1].append( ( self.__seq, content, source ) )
+        self.__seq += 1
+
+    def delete( self, revnr, path ):
+        """
+        Records the deletion of a path.
+
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        """
+
+        self.add( revnr, path, None, None )
+
+    def get_base( self, revnr, path, action, copyfrom ):
+        """
+        Returns the content a node is based on.
+
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        @type action: string
+        @param action: Action of the node.
+        @type copyfrom: tuple
+        @param copyfrom: ( path, revnr ) the node is copied from or None.
+        @rtype: ( tuple, tuple )
+        @return: Content and children source, the content is None for new
+            paths and _MISSING if it is not known.
+        """
+
+        if action == "change":
+            content, source = self.lookup( path, revnr )
+        elif copyfrom != None:
+            content, source = self.lookup( copyfrom[0], copyfrom[1] )
+            source = copyfrom
+        else:
+            return None, None
+        if content == None:
+            return _MISSING, source
+        return content, source
+
+class DeltaResolver:
+    """
+    Reconstructs the texts and properties of the nodes of a dump file
+    with deltas (format version 3).
+
+    The offset and length of the text and properties of every node are
+    recorded together with the key of their delta base, the key of the
+    node holding the base is looked up in a ContentHistory. Fulltexts and
+    properties are kept in a bounded LRU cache, on a miss the chain of
+    deltas is applied again starting at the nearest cached or full version.
+    """
+
+    def __init__( self, read, cachesize=DELTA_CACHE_SIZE ):
+        """
+        Initialize.
+
+        @type read: function( offset, length )
+        @param read: Function reading data of the dump (or spool) file.
+        @type cachesize: integer
+        @param cachesize: Size of the cache in bytes.
+        """
+
+        # function reading data of the dump file
+        self.__read = read
+        # the content of the paths, ( text key, properties key )
+        self.__history = ContentHistory()
+        # key -> ( offset, length, is a delta, base key ) of the texts
+        self.__texts = {}
+        # key -> ( offset, length, is a delta, base key ) of the properties
+        self.__props = {}
+        # fulltexts ( "T", key ) and properties ( "P", key )
+        self.__cache = LRUCache( cachesize )
+        # key of the next node
+        self.__next_key = 0
+
+    def add_node( self, revnr, path, action, copyfrom, text, props ):
+        """
+        Records a node.
+
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        @type action: string
+        @param action: Action of the node.
+        @type copyfrom: tuple
+        @param copyfrom: ( path, revnr ) the node is copied from or None.
+        @type text: tuple
+        @param text: ( offset, length, is a delta ) of the text or None.
+        @type props: tuple
+        @param props: ( offset, length, is a delta ) of the properties
+            or None.
+        @rtype: integer
+        @return: The key of the node for get_text() and get_properties().
+        """
+
+        if action == "delete":
+            self.__history.delete( revnr, path )
+            return -1
+        base, source = self.__history.get_base( revnr, path, action,
+                                                copyfrom )
+        if base == None:
+            base = ( None, None )
+        elif base == _MISSING:
+            base = ( _MISSING, _MISSING )
+        textkey, propkey = base
+        key = self.__next_key
+        self.__next_key += 1
+        if text != None:
+            self.__texts[key] = text + ( textkey, )
+            textkey = key
+        if props != None:
+            self.__props[key] = props + ( propkey, )
+            propkey = key
+        self.__history.add( revnr, path, ( textkey, propkey ), source )
+        return key
+
+    def __resolve( self, kind, records, key, empty, apply ):
+        """
+        Returns a text or properties, applying deltas as needed.
+
+        @type kind: string
+        @param kind: "T" for texts, "P" for properties.
+        @type records: dict
+        @param records: The text or property records.
+        @type key: integer
+        @param key: Key of the node.
+        @type empty: function()
+        @param empty: Returns the empty base.
+        @type apply: function( base, data, isdelta )
+        @param apply: Applies data (full or delta) to a base.
+        @rtype: object
+        @return: The text or properties.
+        """
+
+        chain = []
+        value = None
+        while True:
+            if key == None:
+                value = empty()
+                break
+            if key == _MISSING:
+                raise SvnDumpException, "delta base not available " \
+                        "(revisions skipped?)"
+            value = self.__cache.get( ( kind, key ) )
+            if value != None:
+                break
+            offset, length, isdelta, basekey = records[key]
+            chain.append( ( key, self.__read( offset, length ), isdelta ) )
+            if not isdelta:
+                value = empty()
+                break
+            key = basekey
+        while len( chain ) > 0:
+            key, data, isdelta = chain.pop()
+            value, size = apply( value, data, isdelta )
+            self.__cache.put( ( kind, key ), value, size )
+        return value
+
+    def get_text( self, key ):
+        """
+        Returns the fulltext of a node.
+
+        @type key: integer
+        @param key: Key returned by add_node().
+        @rtype: string
+        @return: The text.
+        """
+
+        return self.__resolve( "T", self.__texts, key, self.__empty_text,
+                               self.__apply_text )
+
+    def get_properties( self, key ):
+        """
+        Returns the properties of a node.
+
+        @type key: integer
+        @param key: Key returned by add_node().
+        @rtype: ListDict
+        @return: The properties, a copy the caller may modify.
+        """
+
+        props = self.__resolve( "P", self.__props, key, ListDict,
+                                self.__apply_props )
+        copy = ListDict()
+        for name, value in props.iteritems():
+            copy[name] = value
+        return copy
+
+    def __empty_text( self ):
+        """
+        Returns the base of a text without delta base.
+
+        @rtype: string
+        @return: The empty string.
+        """
+        return ""
+
+    def __apply_text( self, base, data, isdelta ):
+        """
+        Applies a delta to a text.
+
+        @type base: string
+        @param base: The base text.
+        @type data: string
+        @param data: The svndiff data or the fulltext.
+        @type isdelta: bool
+        @param isdelta: True if data is svndiff data.
+        @rtype: ( string, integer )
+        @return: The text and its size.
+        """
+
+        if isdelta:
+            data = apply_svndiff( base, data )
+        return data, len( data )
+
+    def __apply_props( self, base, data, isdelta ):
+        """
+        Applies a property delta to properties.
+
+        @type base: ListDict
+        @param base: The base properties, empty if data is no delta.
+        @type data: string
+        @param data: The property block.
+        @type isdelta: bool
+        @param isdelta: True if the property block is a delta.
+        @rtype: ( ListDict, integer )
+        @return: The properties and their size.
+        """
+
+        props = ListDict()
+        for name, value in base.iteritems():
+            props[name] = value
+        size = 0
+        for name, value in parse_properties( data, 0, len( data ) ).iteritems():
+            if value == None:
+                if props.has_key( name ):
+                    del props[name]
+            else:
+                props[name] = value
+        for name, value in props.iteritems():
+            size += len( name ) + len( value )
+        return props, size
+
+class DeltaWriter:
+    """
+    Creates the text deltas of a dump file written with format version 3.
+
+    The fulltexts written are kept in a bounded LRU cache, a text whose
+    delta base has been dropped from the cache is written as fulltext.
+    Texts longer than maxtextsize are not read into memory, they are
+    written as fulltext and so are the texts based on them.
+    """
+
+    def __init__( self, cachesize=DELTA_CACHE_SIZE,
+                  maxtextsize=DELTA_MAX_TEXT_SIZE ):
+        """
+        Initialize.
+
+        @type cachesize: integer
+        @param cachesize: Size of the cache in bytes.
+        @type maxtextsize: integer
+        @param maxtextsize: Max length of a text written as delta.
+        """
+
+        # the content of the paths, ( text key, None )
+        self.__history = ContentHistory()
+        # key -> ( fulltext, md5 )
+        self.__cache = LRUCache( cachesize )
+        # key of the next text
+        self.__next_key = 0
+        # max length of a text written as delta
+        self.__max_text_size = maxtextsize
+
+    def add_node( self, revnr, node ):
+        """
+        Records a node and returns the delta of its text.
+
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type node: SvnDumpNode
+        @param node: The node.
+        @rtype: ( string, string )
+        @return: The svndiff data and the md5 sum of the delta base (empty
+            if the base is empty) or None if the text has to be written
+            as fulltext.
+        """
+
+        path = node.get_path()
+        action = node.get_action()
+        if action == "delete":
+            self.__history.delete( revnr, path )
+            return None
+        copyfrom = None
+        if node.has_copy_from():
+            copyfrom = ( node.get_copy_from_path(), node.get_copy_from_rev() )
+        base, source = self.__history.get_base( revnr, path, action,
+                                                copyfrom )
+        if base == None:
+            basekey = None
+        elif base == _MISSING:
+            basekey = _MISSING
+        else:
+            basekey = base[0]
+        if not node.has_text():
+            self.__history.add( revnr, path, ( basekey, None ), source )
+            return None
+        key = self.__next_key
+        self.__next_key += 1
+        self.__history.add( revnr, path, ( key, None ), source )
+        if node.get_text_length() > self.__max_text_size:
+            # not cached, so texts based on it are fulltexts too
+            return None
+        handle = node.text_open()
+        parts = []
+        data = node.text_read( handle )
+        while len( data ) > 0:
+            parts.append( data )
+            data = node.text_read( handle )
+        node.text_close( handle )
+        text = "".join( parts )
+        self.__cache.put( key, ( text, node.get_text_md5() ), len( text ) )
+        if basekey == None:
+            basetext, basemd5 = "", ""
+        else:
+            entry = self.__cache.get( basekey )
+            if entry == None:
+                return None
+            basetext, basemd5 = entry
+        return create_svndiff( basetext, text ), basemd5
@@ -24,7 +24,7 @@ from optparse import OptionParser
 
 from svndump import __version
 from file import SvnDumpFile
-from common import sdt_md5
+from common import MultiDigest, get_read_chunk_size
 
 __doc__ = """Diff functions and classes."""
 
@@ -74,6 +74,7 @@ class SvnDumpDiffCallback:
          - 'RevPropMissing'
          - 'NodeMissing'
          - 'WrongMD5'
+         - 'WrongSHA1'
          - 'PropDiff'
          - 'PropMissing'
 
@@ -318,6 +319,7 @@ class SvnDumpDiffCallback:
          - 'HasText'
          - 'TextLen'
          - 'TextMD5'
+         - 'TextSHA1'
 
         @type type: string
         @param type: A diff type.
@@ -386,6 +388,30 @@ class SvnDumpDiffCallback:
                 print "      should be:   '%s'" % should
                 print "      calculated:  '%s'" % calc
 
+    def wrong_sha1( self, dumpnr, should, calc ):
+        """
+        Called when text has wrong SHA1.
+
+        @type dumpnr: integer
+        @param dumpnr: Number of the dump file, 1 = first, 2 = second.
+        @type should: string
+        @param should: SHA1 sum in the dump file.
+        @type calc: string
+        @param calc: Calculated SHA1 sum.
+        """
+
+        show = True
+        if self.__ignores.has_key( "WrongSHA1" ):
+            show = False
+        self.__summary_inc( "WrongSHA1", show )
+        if show:
+            self.diffs = True
+            if self.verbosity > 0:
+                self.__print_node()
+                print "+   Wrong SHA1 in dump%d:" % dumpnr
+                print "      should be:   '%s'" % should
+                print "      calculated:  '%s'" % calc
+
     def text_diff( self, type ):
         """
         Called when text differs.
@@ -649,8 +675,13 @@ class SvnDumpDiff:
             callback.node_diff( "TextLen", node1.get_text_length(), node2.get_text_length() )
         if node1.get_text_md5() != node2.get_text_md5():
             callback.node_diff( "TextMD5", node1.get_text_md5(), node2.get_text_md5() )
-        md1 = sdt_md5()
-        md2 = sdt_md5()
+        # a missing sha1 is not a difference, older dumps have none
+        if node1.has_sha1() and node2.has_sha1() and \
+                node1.get_text_sha1() != node2.get_text_sha1():
+            callback.node_diff( "TextSHA1", node1.get_text_sha1(), node2.get_text_sha1() )
+        # all sums are calculated while comparing the texts
+        md1 = MultiDigest( self.__digest_names( node1 ) )
+        md2 = MultiDigest( self.__digest_names( node2 ) )
         handle1 = node1.text_open()
         handle2 = node2.text_open()
         str1 = node1.text_read( handle1 )
@@ -659,7 +690,7 @@ class SvnDumpDiff:
         n2 = len(str2)
         cmpstr1 = ""
         cmpstr2 = ""
-        defreadcount = 16384
+        defreadcount = get_read_chunk_size()
         readcount1 = defreadcount
         readcount2 = defreadcount
         # how to compare: 0=normal, 1=eol-check, 2=had a diff
@@ -748,17 +779,35 @@ class SvnDumpDiff:
             cmpstr2 = cmpstr2.replace( "\r\n", "\n" ).replace( "\r", "\n" )
             if cmpstr1 != cmpstr2:
                 cmpmode = 2
-        mdstr1 = md1.hexdigest()
-        mdstr2 = md2.hexdigest()
+        mdstr1 = md1.hexdigest( "md5" )
+        mdstr2 = md2.hexdigest( "md5" )
         if node1.get_text_md5() != mdstr1:
             callback.wrong_md5( 1, node1.get_text_md5(), mdstr1 )
         if node2.get_text_md5() != mdstr2:
             callback.wrong_md5( 2, node2.get_text_md5(), mdstr2 )
+        if node1.has_sha1() and node1.get_text_sha1() != md1.hexdigest( "sha1" ):
+            callback.wrong_sha1( 1, node1.get_text_sha1(), md1.hexdigest( "sha1" ) )
+        if node2.has_sha1() and node2.get_text_sha1() != md2.hexdigest( "sha1" ):
+            callback.wrong_sha1( 2, node2.get_text_sha1(), md2.hexdigest( "sha1" ) )
         if cmpmode == 1:
             callback.text_diff( "EOL" )
         elif cmpmode == 2:
             callback.text_diff( "Text" )
 
+    def __digest_names( self, node ):
+        """
+        Returns the names of the digests to calculate for a node.
+
+        @type node: SvnDumpNode
+        @param node: A node with text.
+        @rtype: list( string )
+        @return: 'md5' and 'sha1' if the node has a sha1 sum.
+        """
+
+        if node.has_sha1():
+            return [ "md5", "sha1" ]
+        return [ "md5" ]
+
     def __compare_properties( self, revprops, props1, props2, callback ):
         """
         Compare properties.
@@ -830,7 +879,7 @@ def svndump_diff_cmdline( appname, args ):
                        help="verbose output" )
     ignores = [ "UUID", "RevNr", "RevDate", "RevDateStr", "NodeCount",
                 "Path", "Action", "Kind", "CopyFromPath", "CopyFromRev",
-                "HasText", "TextLen", "TextMD5", "EOL", "Text",
+                "HasText", "TextLen", "TextMD5", "TextSHA1", "EOL", "Text",
                 "PropDiff", "PropMissing", "RevPropDiff", "RevPropMissing" ]
     ignore_help = "'" + ignores[0] + "'"
     for i in ignores[1:-1]:
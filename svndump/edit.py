@@ -138,6 +138,11 @@ class SvnDumpEdit:
         if hasrev:
             if not self.dry_run:
                 dstdmp = SvnDumpFile()
+                for rev in self.__edit_files.itervalues():
+                    for fn in rev.itervalues():
+                        if fn.has_key( 'replace' ):
+                            # copy sources may be replaced too
+                            dstdmp.set_copy_source_checksums( False )
                 if srcdmp.get_rev_nr() == 0:
                     # create new dump with revision 0
                     dstdmp.create_with_rev_0( self.__out_file,
@@ -226,7 +231,11 @@ class SvnDumpEdit:
         if node.has_properties():
             newnode.set_properties( node.get_properties() )
 
-        newnode.set_text_file( replacement_path )
+        # keep a sha1 sum if the node had one
+        sha1 = ""
+        if node.has_sha1():
+            sha1 = "calc"
+        newnode.set_text_file( replacement_path, sha1=sha1 )
 
         return newnode
 
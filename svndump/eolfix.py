@@ -26,7 +26,7 @@ import re
 from svndump import __version
 from file import SvnDumpFile
 from node import SvnDumpNode
-from common import sdt_md5
+from common import MultiDigest
 
 __doc__ = """Classes and functions for fixing EOL's in a dump file."""
 
@@ -280,6 +280,8 @@ class SvnDumpEolFix:
         if hasrev:
             if not self.__dry_run:
                 dstdmp = SvnDumpFile()
+                # copy sources may be fixed too
+                dstdmp.set_copy_source_checksums( False )
                 if srcdmp.get_rev_nr() == 0:
                     # create new dump with revision 0
                     dstdmp.create_with_rev_0( self.__out_file,
@@ -392,7 +394,12 @@ class SvnDumpEolFix:
             outfilename = self.__temp_file_name()
             outfile = open( outfilename, "wb" )
             outlen = 0
-            md = sdt_md5()
+            # the sums are calculated while converting, sha1 only if the
+            # original node had one
+            if node.has_sha1():
+                md = MultiDigest( [ "md5", "sha1" ] )
+            else:
+                md = MultiDigest( [ "md5" ] )
             data = node.text_read( handle )
             carry = ""
             warning_printed = False
@@ -446,7 +453,11 @@ class SvnDumpEolFix:
                                        node.get_copy_from_rev() )
             if node.has_properties():
                 newnode.set_properties( node.get_properties() )
-            newnode.set_text_file( outfilename, outlen, md.hexdigest() )
+            sha1 = ""
+            if node.has_sha1():
+                sha1 = md.hexdigest( "sha1" )
+            newnode.set_text_file( outfilename, outlen, md.hexdigest( "md5" ),
+                                   sha1=sha1 )
         else:
             newnode = node
 
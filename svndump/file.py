@@ -20,16 +20,328 @@
 #
 #===============================================================================
 
+import cPickle
+import mmap
+import os
+import tempfile
+
 from common import *
+from compress import open_input_file, open_output_file
+from delta import DeltaResolver, DeltaWriter, DELTA_CACHE_SIZE
+from blobcache import BlobCache, BLOB_CACHE_SIZE
 from node import SvnDumpNode
+from index import SvnDumpIndex, load_dump_index
+from history import NodeHistory, history_file_name
 
 __doc__ = """SvnDumpFile class."""
 
+# default for the usemmap parameter of SvnDumpFile.open()
+default_use_mmap = False
+
+def set_default_mmap( usemmap ):
+    """
+    Sets the default for the usemmap parameter of SvnDumpFile.open().
+
+    @type usemmap: bool
+    @param usemmap: True to memory map dump files opened for reading.
+    """
+    global default_use_mmap
+    default_use_mmap = usemmap
+
+# default for SvnDumpFile.set_write_index()
+default_write_index = False
+
+def set_default_write_index( writeindex ):
+    """
+    Sets the default for SvnDumpFile.set_write_index().
+
+    @type writeindex: bool
+    @param writeindex: True to write an index after reading a whole dump.
+    """
+    global default_write_index
+    default_write_index = writeindex
+
+# default for SvnDumpFile.set_line_counting()
+default_line_counting = False
+
+def set_default_line_counting( counting ):
+    """
+    Sets the default for SvnDumpFile.set_line_counting().
+
+    @type counting: bool
+    @param counting: True to count lines for error messages.
+    """
+    global default_line_counting
+    default_line_counting = counting
+
+# default for SvnDumpFile.set_write_deltas()
+default_write_deltas = False
+
+def set_default_write_deltas( deltas ):
+    """
+    Sets the default for SvnDumpFile.set_write_deltas().
+
+    @type deltas: bool
+    @param deltas: True to write dump files with text deltas.
+    """
+    global default_write_deltas
+    default_write_deltas = deltas
+
+# default for SvnDumpFile.set_write_buffer_size()
+default_write_buffer_size = 1024 * 1024
+
+def set_default_write_buffer_size( size ):
+    """
+    Sets the default for SvnDumpFile.set_write_buffer_size().
+
+    @type size: integer
+    @param size: Size of the write buffer in bytes.
+    """
+    global default_write_buffer_size
+    default_write_buffer_size = size
+
+class StreamReader:
+    """
+    A forward-only reader for non-seekable input like pipes.
+
+    Counts the bytes read so tell() works, seek() can only skip forward.
+    """
+
+    def __init__( self, fileobj ):
+        """
+        Initialize.
+
+        @type fileobj: file object
+        @param fileobj: A file object opened for reading.
+        """
+        self.__file = fileobj
+        self.__pos = 0
+
+    def readline( self ):
+        """
+        Reads one line.
+
+        @rtype: string
+        @return: The line including the LF.
+        """
+        line = self.__file.readline()
+        self.__pos += len( line )
+        return line
+
+    def read( self, length ):
+        """
+        Reads some bytes.
+
+        @type length: integer
+        @param length: Count of bytes to read.
+        @rtype: string
+        @return: The data read.
+        """
+        data = self.__file.read( length )
+        self.__pos += len( data )
+        return data
+
+    def tell( self ):
+        """
+        Returns the count of bytes read so far.
+
+        @rtype: integer
+        @return: The current position.
+        """
+        return self.__pos
+
+    def seek( self, offset ):
+        """
+        Skips forward to the given offset.
+
+        @type offset: integer
+        @param offset: The new position, must not be before the current one.
+        """
+        if offset < self.__pos:
+            raise SvnDumpException, \
+                    "cannot seek backwards in a stream (from %d to %d)" % \
+                    ( self.__pos, offset )
+        while self.__pos < offset:
+            if len( self.read( min( offset - self.__pos, 65536 ) ) ) == 0:
+                break
+
+def _scan_tags_mmap( mm, pos ):
+    """
+    Reads the tag list of a record from a memory map.
+
+    @type mm: mmap
+    @param mm: The memory map.
+    @type pos: integer
+    @param pos: Offset of the tag list (after empty lines).
+    @rtype: ( dict, integer )
+    @return: The tags and the offset after the empty line ending them.
+    """
+
+    end = mm.find( "\n\n", pos )
+    if end < 0:
+        raise SvnDumpException, "unexpected end of file (offset %d)" % pos
+    tags = {}
+    for line in mm[pos:end].split( "\n" ):
+        words = line.split( " ", 1 )
+        if len( words ) != 2:
+            raise SvnDumpException, "illegal Tag line '%s' (offset %d)" % \
+                    ( line, pos )
+        tags[words[0]] = words[1]
+    return tags, end + 2
+
+def _scan_tags_file( infile, line, pos ):
+    """
+    Reads the tag list of a record from a file.
+
+    @type infile: file object
+    @param infile: The file positioned after the first tag line.
+    @type line: string
+    @param line: The first tag line.
+    @type pos: integer
+    @param pos: Offset of the tag list.
+    @rtype: ( dict, integer )
+    @return: The tags and the offset after the empty line ending them.
+    """
+
+    tags = {}
+    while line != "\n":
+        if len( line ) == 0:
+            raise SvnDumpException, "unexpected end of file (offset %d)" % pos
+        words = line[:-1].split( " ", 1 )
+        if len( words ) != 2:
+            raise SvnDumpException, "illegal Tag line '%s' (offset %d)" % \
+                    ( line[:-1], pos )
+        tags[words[0]] = words[1]
+        line = infile.readline()
+    return tags, infile.tell()
+
+def scan_dump_file( filename, usemmap=None ):
+    """
+    Finds the revision and node records of a dump file without parsing
+    their properties and texts.
+
+    Only the tag lists of the records are read, the properties and texts
+    are skipped using the length tags. Seekable files are skipped by
+    seeking (or memory mapped), compressed files and pipes have to be
+    read and are scanned at the speed of reading them.
+
+    For each record a tuple ( kind, offset, bodyoffset, tags ) is
+    returned, kind is 'R' for revisions and 'N' for nodes, offset is the
+    offset of the tag list, bodyoffset the offset of the properties and
+    tags the dict of tag name (with colon) -> value.
+
+    The header (format version and UUID) is checked but not returned.
+
+    @type filename: string
+    @param filename: Name of the dump file or '-' for stdin.
+    @type usemmap: bool
+    @param usemmap: Memory map the file, None for the default set by
+        set_default_mmap().
+    @rtype: iterator( tuple )
+    @return: The records of the dump file.
+    """
+
+    if usemmap == None:
+        usemmap = default_use_mmap
+    rawfile = open_input_file( filename )
+    infile = rawfile
+    mm = None
+    try:
+        try:
+            rawfile.tell()
+        except IOError:
+            # not seekable, skipping means reading
+            infile = StreamReader( rawfile )
+            size = -1
+            usemmap = False
+        else:
+            rawfile.seek( 0, 2 )
+            size = rawfile.tell()
+            rawfile.seek( 0 )
+        if usemmap and size > 0:
+            mm = mmap.mmap( rawfile.fileno(), 0, access=mmap.ACCESS_READ )
+        pos = 0
+        first = True
+        while True:
+            # skip empty lines
+            if mm != None:
+                while pos < size and mm[pos] == "\n":
+                    pos += 1
+                if pos >= size:
+                    break
+                tags, bodyoffset = _scan_tags_mmap( mm, pos )
+            else:
+                if pos != infile.tell():
+                    infile.seek( pos )
+                line = infile.readline()
+                while line == "\n":
+                    pos += 1
+                    line = infile.readline()
+                if len( line ) == 0:
+                    break
+                tags, bodyoffset = _scan_tags_file( infile, line, pos )
+            if first:
+                if not tags.has_key( "SVN-fs-dump-format-version:" ):
+                    raise SvnDumpException, "not a svn dump file ???"
+                first = False
+                pos = bodyoffset
+                continue
+            if tags.has_key( "Content-length:" ):
+                length = int( tags["Content-length:"] )
+            else:
+                length = int( tags.get( "Prop-content-length:", 0 ) ) + \
+                         int( tags.get( "Text-content-length:", 0 ) )
+            if tags.has_key( "Revision-number:" ):
+                yield "R", pos, bodyoffset, tags
+            elif tags.has_key( "Node-path:" ):
+                yield "N", pos, bodyoffset, tags
+            elif not tags.has_key( "UUID:" ):
+                raise SvnDumpException, \
+                        "neither revision nor node (offset %d)" % pos
+            pos = bodyoffset + length
+            if size >= 0 and pos > size:
+                raise SvnDumpException, \
+                        "unexpected end of file (offset %d)" % pos
+    finally:
+        if mm != None:
+            mm.close()
+        rawfile.close()
+
+def create_dump_index( filename ):
+    """
+    Creates the revision offset index of a dump file with
+    scan_dump_file().
+
+    @type filename: string
+    @param filename: Name of the dump file.
+    @rtype: SvnDumpIndex
+    @return: The index (not saved).
+    """
+
+    index = SvnDumpIndex()
+    rev = None
+    nodes = 0
+    for kind, offset, bodyoffset, tags in scan_dump_file( filename ):
+        if kind == "N":
+            nodes += 1
+            continue
+        if rev != None:
+            index.add_rev( rev[0], rev[1], rev[2], nodes )
+        rev = ( int( tags["Revision-number:"] ), offset, bodyoffset )
+        nodes = 0
+    if rev != None:
+        index.add_rev( rev[0], rev[1], rev[2], nodes )
+    return index
+
 class SvnDumpFile:
     """
     A class for reading and writing svn dump files.
     """
 
+    # headers of the copy source and delta base checksums of a node
+    CHECKSUM_TAGS = ( "Text-copy-source-md5", "Text-copy-source-sha1",
+                      "Text-delta-base-md5", "Text-delta-base-sha1" )
+
     def __init__( self ):
         # states
         self.ST_NONE    =  0
@@ -44,26 +356,242 @@ class SvnDumpFile:
         self.__filename = ""
         # the file object to read from/write to
         self.__file = None
+        # the memory map of the file or None
+        self.__mmap = None
+        # the object to read from, either __file, __mmap or a StreamReader
+        self.__input = None
+        # spool file for the node texts when reading a stream
+        self.__spool = None
+        # tags of the next revision already read from a stream
+        self.__lookahead = None
+        # offset and length of the current revision header and properties
+        # or None if the revision can't be copied raw
+        self.__rev_raw = None
+        # the revision properties as read, to detect modifications
+        self.__rev_raw_props = None
+        # offset and length of the revision properties not parsed yet
+        self.__rev_prop_span = None
+        # dump file whose current revision is added by add_rev_from_dump()
+        self.__raw_rev_dump = None
         # end of file
         self.__file_eof = 0
+        # size of the input file (not known for streams)
+        self.__file_size = 0
         # UUID of the repository
         self.__uuid = None
+        # dump format version
+        self.__format_version = 2
         # curent revision number
         self.__rev_nr = 0
         # date of the revision
         self.__rev_date = (0,0)
         # start offset of the next revision
         self.__rev_start_offset = 0
+        # start offset of the first revision
+        self.__first_rev_offset = 0
+        # revision offset index, loaded on demand
+        self.__index = None
+        self.__index_loaded = False
+        # write an index when reading reaches EOF
+        self.__write_index = default_write_index
+        # the index built while reading or None
+        self.__new_index = None
         # revision properties
         self.__rev_props = {}
         # nodes of the revision (files, dirs)
         self.__nodes = ListDict()
         # offset of a tag list
         self.__tag_start_offset = 0
-        # count lines for debugging
-        self.__line__counting = 1
+        # count lines for debugging (slow, texts have to be read)
+        self.__line__counting = 0
+        if default_line_counting:
+            self.__line__counting = 1
         self.__line_nr = 0
         self.__tag_start_line_nr = 0
+        # reconstructs the deltas when reading format version 3
+        self.__deltas = None
+        # creates the deltas when writing format version 3
+        self.__delta_writer = None
+        # write format version 3 with text deltas
+        self.__write_deltas = default_write_deltas
+        # size of the fulltext cache used for deltas
+        self.__delta_cache_size = DELTA_CACHE_SIZE
+        # size of the buffer of the output file
+        self.__write_buffer_size = default_write_buffer_size
+        # write the copy source checksums of copied nodes
+        self.__copy_source_checksums = True
+        # finds the texts read so far by their checksums, or None
+        self.__blobs = None
+        # ( cachesize, spill ) of the blob cache, None to disable it
+        self.__blob_params = None
+
+    def set_line_counting( self, counting ):
+        """
+        Turns counting of lines on or off.
+
+        Without line counting error messages report byte offsets only
+        and texts are skipped by seeking. With line counting they also
+        report the line number but every text has to be read.
+
+        @type counting: bool
+        @param counting: True to count lines.
+        """
+
+        if counting:
+            self.__line__counting = 1
+        else:
+            self.__line__counting = 0
+
+    def set_write_deltas( self, deltas ):
+        """
+        Turns writing of text deltas (dump format version 3) on or off.
+
+        Has to be called before creating the dump file. The texts are
+        written as deltas against the previous text of the path (or the
+        copy source), which is kept in a cache of the size set by
+        set_delta_cache_size(). Texts whose delta base has been dropped
+        from the cache and texts bigger than DELTA_MAX_TEXT_SIZE are
+        written as fulltext. Properties are always written in full.
+
+        @type deltas: bool
+        @param deltas: True to write deltas.
+        """
+
+        self.__write_deltas = deltas
+
+    def set_delta_cache_size( self, size ):
+        """
+        Sets the size of the cache for the fulltexts (and properties)
+        needed to apply or create deltas.
+
+        Has to be called before opening or creating the dump file.
+
+        @type size: integer
+        @param size: Size in bytes.
+        """
+
+        self.__delta_cache_size = size
+
+    def set_write_buffer_size( self, size ):
+        """
+        Sets the size of the write buffer of the output file.
+
+        Has to be called before creating the dump file. A big buffer
+        saves system calls when writing lots of small nodes. Compressed
+        dump files are written in the chunks of the compressor.
+
+        @type size: integer
+        @param size: Size of the write buffer in bytes.
+        """
+
+        self.__write_buffer_size = size
+
+    def set_copy_source_checksums( self, write ):
+        """
+        Turns writing of the copy source checksums of nodes on or off.
+
+        Commands changing texts have to turn them off: the checksums
+        (Text-copy-source-md5 and Text-copy-source-sha1) of a changed copy
+        source are wrong and svnadmin load rejects the node. Nodes with
+        such checksums are then not copied raw.
+
+        @type write: bool
+        @param write: False to drop the copy source checksums.
+        """
+
+        self.__copy_source_checksums = write
+
+    def set_blob_cache( self, enable, cachesize=BLOB_CACHE_SIZE,
+                        spill=False ):
+        """
+        Turns the blob cache on or off.
+
+        Has to be called before reading the first revision. The blob cache
+        records the location of every text read which has a md5 sum, so
+        get_text_by_digest() can return texts of earlier revisions
+        without reading the dump again. The texts are kept in memory up
+        to cachesize bytes. With spill the texts which are expensive to
+        get again (reconstructed from deltas) are written to a temp file
+        when they're dropped from memory.
+
+        When reading a stream all texts are kept in the spool file.
+
+        @type enable: bool
+        @param enable: True to enable the blob cache.
+        @type cachesize: integer
+        @param cachesize: Size of the in-memory cache in bytes.
+        @type spill: bool
+        @param spill: Spill expensive texts to a temp file.
+        """
+
+        if enable:
+            self.__blob_params = ( cachesize, spill )
+        else:
+            self.__blob_params = None
+        if self.__state == self.ST_READ:
+            # already opened
+            if self.__blobs != None:
+                self.__blobs.close()
+                self.__blobs = None
+            if enable:
+                self.__blobs = BlobCache( self.__read_blob, cachesize, spill )
+
+    def get_blob_cache( self ):
+        """
+        Returns the blob cache of this dump file.
+
+        @rtype: BlobCache
+        @return: The blob cache or None if it is not enabled.
+        """
+
+        return self.__blobs
+
+    def get_text_by_digest( self, digest ):
+        """
+        Returns a text read from this dump file by its checksum.
+
+        @type digest: string
+        @param digest: The md5 or sha1 sum of the text.
+        @rtype: string
+        @return: The text or None if it is not known.
+        """
+
+        if self.__blobs == None:
+            raise SvnDumpException, "blob cache not enabled"
+        return self.__blobs.get_text( digest )
+
+    def __read_blob( self, location ):
+        """
+        Reads a text for the blob cache.
+
+        @type location: tuple
+        @param location: ( offset, length ) of a text or ( DeltaResolver,
+            key ) of a text reconstructed from a delta.
+        @rtype: string
+        @return: The text.
+        """
+
+        if isinstance( location[0], DeltaResolver ):
+            return location[0].get_text( location[1] )
+        return self.__read_span( location[0], location[1] )
+
+    def __error( self, msg ):
+        """
+        Returns a SvnDumpException with the current position appended.
+
+        @type msg: string
+        @param msg: The error message.
+        @rtype: SvnDumpException
+        @return: The exception to raise.
+        """
+
+        try:
+            pos = "offset %d" % self.__input.tell()
+        except ( IOError, ValueError ):
+            pos = "unknown offset"
+        if self.__line__counting != 0:
+            pos = "%s, line %d" % ( pos, self.__line_nr )
+        return SvnDumpException( "%s (%s)" % ( msg, pos ) )
 
     def __read_line( self, raiseEof ):
         """
@@ -75,7 +603,7 @@ class SvnDumpFile:
         @return: (eof, line), line without LF.
         """
 
-        line = self.__file.readline()
+        line = self.__input.readline()
         if self.__line__counting != 0:
             self.__line_nr = self.__line_nr + 1
         if len( line ) != 0:
@@ -83,22 +611,7 @@ class SvnDumpFile:
         self.__file_eof = 1
         if not raiseEof:
             return True, ""
-        raise SvnDumpException, "unexpected end of file"
-
-    def __read_bin( self, length ):
-        """
-        Read some  bytes.
-
-        @type length: integer
-        @param length: Count of bytes to read.
-        @rtype: string
-        @return: The data read.
-        """
-
-        data = self.__file.read( length )
-        if self.__line__counting != 0:
-            self.__line_nr = self.__line_nr + data.count( "\n" )
-        return data
+        raise self.__error( "unexpected end of file" )
 
     def __skip_bin( self, length ):
         """
@@ -108,17 +621,140 @@ class SvnDumpFile:
         @param length: Count of bytes to skip.
         """
 
+        if self.__input.tell() + length > self.__file_size:
+            raise self.__error( "unexpected end of file" )
         if self.__line__counting == 0:
-            self.__file.seek( self.__file.tell() + length )
+            self.__input.seek( self.__input.tell() + length )
+            return
+        if self.__mmap != None:
+            pos = self.__mmap.tell()
+            self.__line_nr += self.__mmap[pos:pos+length].count( "\n" )
+            self.__mmap.seek( pos + length )
             return
         nBytes = 4096
         while length > 0:
             if length < 4096:
                 nBytes = length
-            data = self.__file.read( nBytes )
+            data = self.__input.read( nBytes )
             self.__line_nr = self.__line_nr + data.count( "\n" )
             length = length - nBytes
 
+    def __spool_bin( self, length ):
+        """
+        Copy some bytes from the input to the spool file.
+
+        @type length: integer
+        @param length: Count of bytes to copy.
+        @rtype: integer
+        @return: Offset of the data in the spool file.
+        """
+
+        # texts may have been read from the spool file since
+        self.__spool.seek( 0, 2 )
+        offset = self.__spool.tell()
+        while length > 0:
+            data = self.__input.read( min( length,
+                                           get_read_chunk_size() ) )
+            if len( data ) == 0:
+                raise self.__error( "unexpected end of file" )
+            if self.__line__counting != 0:
+                self.__line_nr = self.__line_nr + data.count( "\n" )
+            self.__spool.write( data )
+            length -= len( data )
+        return offset
+
+    def __skip_content( self, length ):
+        """
+        Skips properties or text, spooling them when reading a stream.
+
+        @type length: integer
+        @param length: Count of bytes to skip.
+        @rtype: integer
+        @return: Offset to read the data from later, in the spool file
+            when reading a stream.
+        """
+
+        if self.__spool != None:
+            return self.__spool_bin( length )
+        offset = self.__input.tell()
+        self.__skip_bin( length )
+        return offset
+
+    def __read_span( self, offset, length ):
+        """
+        Reads data of the dump file, or of the spool file when reading
+        a stream.
+
+        @type offset: integer
+        @param offset: Offset of the data.
+        @type length: integer
+        @param length: Length of the data.
+        @rtype: string
+        @return: The data.
+        """
+
+        if self.__mmap != None:
+            return self.__mmap[offset:offset+length]
+        fileobj = self.__file
+        if self.__spool != None:
+            fileobj = self.__spool
+        fileobj.seek( offset )
+        return fileobj.read( length )
+
+    def __load_rev_props( self ):
+        """
+        Parses the properties of the current revision if not done yet.
+        """
+
+        if self.__rev_props != None:
+            return
+        if self.__rev_prop_span == None:
+            self.__rev_props = ListDict()
+        else:
+            offset, length = self.__rev_prop_span
+            if self.__mmap != None:
+                self.__rev_props = parse_properties( self.__mmap, offset,
+                                                     length )
+            else:
+                if self.__spool != None:
+                    fileobj = self.__spool
+                else:
+                    fileobj = self.__file
+                fileobj.seek( offset )
+                self.__rev_props = parse_properties( fileobj.read( length ),
+                                                     0, length )
+        if self.__rev_raw != None:
+            self.__rev_raw_props = self.__rev_props.copy()
+        if not self.__rev_props.has_key("svn:log"):
+            self.__rev_props["svn:log"] = ""
+        if not self.__rev_props.has_key("svn:author"):
+            self.__rev_props["svn:author"] = ""
+        if self.__rev_props.has_key("svn:date"):
+            self.set_rev_date(self.__rev_props["svn:date"] )
+        else:
+            self.set_rev_date( "" )
+        if self.__rev_raw != None and \
+                self.__rev_props != self.__rev_raw_props:
+            # normalized, the raw revision would differ
+            self.__rev_raw = None
+
+    def __copy_raw( self, outfile, span ):
+        """
+        Copy a span of the input to a file.
+
+        @type outfile: file object
+        @param outfile: A file object opened for writing.
+        @type span: tuple( integer, integer )
+        @param span: Offset and length of the data to copy.
+        """
+
+        offset, length = span
+        if self.__mmap != None:
+            outfile.write( buffer( self.__mmap, offset, length ) )
+            return
+        self.__file.seek( offset )
+        read_chunks( self.__file, length, outfile.write )
+
     def __skip_empty_line( self ):
         """
         Read one line from the dump file and check that it is empty.
@@ -126,7 +762,7 @@ class SvnDumpFile:
 
         eof, line = self.__read_line( False )
         if eof or len( line ) != 0:
-            raise SvnDumpException, "expected empty line, found '%s'" % line
+            raise self.__error( "expected empty line, found '%s'" % line )
         return
 
     def __get_tag( self, raiseEof ):
@@ -144,7 +780,7 @@ class SvnDumpFile:
             return []
         words = line.split( " ", 1 )
         if len( words ) != 2:
-            raise SvnDumpException, "illegal Tag line '%s'" % line
+            raise self.__error( "illegal Tag line '%s'" % line )
         return words
 
     def __get_tag_list( self ):
@@ -155,14 +791,16 @@ class SvnDumpFile:
         @return: A dict containing the tags.
         """
 
+        if self.__mmap != None:
+            return self.__get_tag_list_mmap()
         tags = {}
-        self.__tag_start_offset = self.__file.tell()
+        self.__tag_start_offset = self.__input.tell()
         self.__tag_start_line_nr = self.__line_nr
         tag = self.__get_tag( False )
         while len( tag ) == 0:
             if self.__file_eof:
                 return tags
-            self.__tag_start_offset = self.__file.tell()
+            self.__tag_start_offset = self.__input.tell()
             self.__tag_start_line_nr = self.__line_nr
             tag = self.__get_tag( False )
         while len( tag ) == 2:
@@ -170,71 +808,105 @@ class SvnDumpFile:
             tag = self.__get_tag( True )
         return tags
 
-    def __get_prop_list( self ):
+    def __get_tag_list_mmap( self ):
         """
-        Get a list of properties.
+        Get a list of tags directly from the memory map.
+
+        Same as __get_tag_list() but searches the end of the tag list
+        with find() and splits it in one go.
 
         @rtype: dict( string -> string )
-        @return: A dict containing the properties.
-        """
-
-        props = ListDict()
-        eof, line = self.__read_line( True )
-        while line != "PROPS-END":
-            # key
-            words = line.split()
-            if len( words ) != 2 or (words[0] != "K" and words[0] != "D"):
-                raise SvnDumpException, "illegal proprty key ???"
-            key = self.__read_bin( int(words[1]) )
-            self.__skip_empty_line()
-            # value
-            value = None
-            if words[0] == "K":
-                eof, line = self.__read_line( True )
-                words = line.split()
-                if len( words ) != 2 or words[0] != "V":
-                    raise SvnDumpException, "illegal proprty value ???"
-                value = self.__read_bin( int(words[1]) )
-                self.__skip_empty_line()
-            # set property
-            props[key] = value
-            # next line...
-            eof, line = self.__read_line( True )
-        return props
+        @return: A dict containing the tags.
+        """
 
+        mm = self.__mmap
+        pos = mm.tell()
+        size = len( mm )
+        # skip empty lines
+        while pos < size and mm[pos] == "\n":
+            pos += 1
+            if self.__line__counting != 0:
+                self.__line_nr += 1
+        self.__tag_start_offset = pos
+        self.__tag_start_line_nr = self.__line_nr
+        if pos >= size:
+            mm.seek( pos )
+            self.__file_eof = 1
+            return {}
+        end = mm.find( "\n\n", pos )
+        if end < 0:
+            raise self.__error( "unexpected end of file" )
+        tags = {}
+        for line in mm[pos:end].split( "\n" ):
+            words = line.split( " ", 1 )
+            if len( words ) != 2:
+                raise self.__error( "illegal Tag line '%s'" % line )
+            tags[ words[0] ] = words[1]
+        if self.__line__counting != 0:
+            self.__line_nr += mm[pos:end].count( "\n" ) + 2
+        mm.seek( end + 2 )
+        return tags
 
-    def __create_prop_string( self, properties ):
+    def __create_prop_list( self, properties ):
         """
-        Create a string from a dict containing properties.
+        Create a list of strings from a dict containing properties.
+
+        The values are not copied, so writing the list with writelines()
+        is linear in the size of the properties.
 
         @type properties: dict( string -> string )
         @param properties: A dict containing the properties.
-        @rtype: string
-        @return: A string containing the properties.
-        """
-
-        propStr = ""
-        if properties != None:
-            for key, val in properties.items():
-                if val != None:
-                    # add/change property
-                    propStr = propStr + ("K %d"%len(key)) + "\n" + key + "\n"
-                    propStr = propStr + ("V %d"%len(val)) + "\n" + val + "\n"
-                else:
-                    # delete property
-                    propStr = propStr + ("D %d"%len(key)) + "\n" + key + "\n"
-            propStr = propStr + "PROPS-END\n"
-        return propStr
+        @rtype: tuple( list( string ), integer )
+        @return: A list of strings containing the properties and
+            their total length.
+        """
+
+        if properties == None:
+            return [], 0
+        parts = []
+        for key, val in properties.items():
+            if val != None:
+                # add/change property
+                parts.append( "K %d\n%s\nV %d\n" % ( len(key), key, len(val) ) )
+                parts.append( val )
+                parts.append( "\n" )
+            else:
+                # delete property
+                parts.append( "D %d\n%s\n" % ( len(key), key ) )
+        parts.append( "PROPS-END\n" )
+        return parts, sum( map( len, parts ) )
 
 
     #------------------------------------------------------------
     #  open / create / close
 
-    def open( self, filename ):
+    def open( self, filename, usemmap=None ):
         """
         Open a dump file for reading and read the header.
+
+        If usemmap is True the file is memory mapped and parsed directly
+        from the map, node texts are then read from the map too.
+
+        If the file is not seekable (a pipe, or '-' for stdin) it is read
+        as a stream: the texts of the nodes of the current revision are
+        spooled to a temp file which is reused for each revision.
+
+        Files compressed with gzip, bzip2 or xz are detected by their
+        magic bytes and decompressed while reading, as a stream.
+
+        Dump files with deltas (format version 3, 'svnadmin dump --deltas')
+        are supported, the texts and properties of the nodes are
+        reconstructed when they are accessed. This needs the revisions
+        containing the delta bases, so seek_rev() doesn't use the index
+        and reconstructing fails for deltas whose base is in a revision
+        skipped by set_next_rev_offset(). When reading a stream all texts
+        are kept in the spool file.
+
         @type filename: string
-        @param filename: Name of an existing dump file.
+        @param filename: Name of an existing dump file or '-' for stdin.
+        @type usemmap: bool
+        @param usemmap: Memory map the file, None for the default set by
+            set_default_mmap().
         """
 
         # check state
@@ -244,32 +916,71 @@ class SvnDumpFile:
 
         # set parameters
         self.__filename = filename
+        if usemmap == None:
+            usemmap = default_use_mmap
 
         # open the file for reading
-        self.__file = open( filename, "rb" )
+        self.__file = open_input_file( filename )
+        self.__input = self.__file
+        try:
+            self.__file.tell()
+        except IOError:
+            # not seekable, read it as a stream
+            self.__input = StreamReader( self.__file )
+            self.__spool = tempfile.TemporaryFile()
+            self.__write_index = False
+            usemmap = False
+        if self.__spool == None:
+            self.__file.seek( 0, 2 )
+            self.__file_size = self.__file.tell()
+            self.__file.seek( 0 )
+            if usemmap and self.__file_size > 0:
+                self.__mmap = mmap.mmap( self.__file.fileno(), 0,
+                                         access=mmap.ACCESS_READ )
+                self.__input = self.__mmap
 
         # check that it is a svn dump file
         tag = self.__get_tag( True )
         if tag[0] != "SVN-fs-dump-format-version:":
             raise SvnDumpException, "not a svn dump file ???"
-        if tag[1] != "2":
-            raise SvnDumpException, "wrong svn dump file version (expected 2 found %s)" % ( tag[1] )
+        if tag[1] == "3":
+            self.__deltas = DeltaResolver( self.__read_span,
+                                           self.__delta_cache_size )
+        elif tag[1] != "2":
+            raise SvnDumpException, "wrong svn dump file version (expected 2 or 3 found %s)" % ( tag[1] )
+        self.__format_version = int( tag[1] )
+        if self.__blob_params != None:
+            self.__blobs = BlobCache( self.__read_blob,
+                                      self.__blob_params[0],
+                                      self.__blob_params[1] )
         self.__skip_empty_line()
 
         # get UUID
-        fileoffset = self.__file.tell()
-        tag = self.__get_tag( True )
-        if len( tag ) < 1 or tag[0] != "UUID:":
-            # back to start of revision
-            self.__file.seek( fileoffset )
-            self.__uuid = None
+        fileoffset = self.__input.tell()
+        if self.__spool != None:
+            # can't go back in a stream, read the whole tag list
+            tags = self.__get_tag_list()
+            if tags.has_key( "UUID:" ):
+                self.__uuid = tags["UUID:"]
+            else:
+                self.__uuid = None
+                self.__lookahead = tags
         else:
-            # set UUID
-            self.__uuid = tag[1]
-            self.__skip_empty_line()
+            tag = self.__get_tag( True )
+            if len( tag ) < 1 or tag[0] != "UUID:":
+                # back to start of revision
+                self.__input.seek( fileoffset )
+                self.__uuid = None
+            else:
+                # set UUID
+                self.__uuid = tag[1]
+                self.__skip_empty_line()
 
         # done initializing
-        self.__rev_start_offset = self.__file.tell()
+        self.__rev_start_offset = self.__input.tell()
+        self.__first_rev_offset = self.__rev_start_offset
+        if self.__write_index:
+            self.__new_index = SvnDumpIndex()
         self.__state = self.ST_READ
 
     def create_with_rev_0( self, filename, uuid, rev0date ):
@@ -297,10 +1008,12 @@ class SvnDumpFile:
         rev0date = self.set_rev_date( rev0date )
 
         # open file for writing
-        self.__file = open( filename, "wb" )
+        self.__file = open_output_file( filename,
+                                        self.__write_buffer_size )
 
         # write header and uuid
-        self.__file.writelines( [ "SVN-fs-dump-format-version: 2\n", "\n" ] )
+        self.__file.writelines( [ "SVN-fs-dump-format-version: %d\n" %
+                                  self.__create_delta_writer(), "\n" ] )
         if self.__uuid != None:
             self.__file.writelines( [ "UUID: " + self.__uuid + "\n", "\n" ] )
 
@@ -346,16 +1059,31 @@ class SvnDumpFile:
         self.__rev_nr = firstRevNr - 1
 
         # open file for writing
-        self.__file = open( filename, "wb" )
+        self.__file = open_output_file( filename,
+                                        self.__write_buffer_size )
 
         # write header and uuid
-        self.__file.writelines( [ "SVN-fs-dump-format-version: 2\n", "\n" ] )
+        self.__file.writelines( [ "SVN-fs-dump-format-version: %d\n" %
+                                  self.__create_delta_writer(), "\n" ] )
         if self.__uuid != None:
             self.__file.writelines( [ "UUID: " + self.__uuid + "\n", "\n" ] )
 
         # done initializing
         self.__state = self.ST_CREATE
 
+    def __create_delta_writer( self ):
+        """
+        Creates the delta writer if deltas are written.
+
+        @rtype: integer
+        @return: The dump format version.
+        """
+
+        if not self.__write_deltas:
+            return 2
+        self.__delta_writer = DeltaWriter( self.__delta_cache_size )
+        return 3
+
     def create_like( self, filename, srcfile ):
         """
         Creates this dump file like srcfile.
@@ -396,6 +1124,14 @@ class SvnDumpFile:
 
         # close only if state != ST_NONE
         if self.__state != self.ST_NONE:
+            if self.__mmap != None:
+                self.__mmap.close()
+                self.__mmap = None
+            if self.__spool != None:
+                self.__spool.close()
+                self.__spool = None
+            self.__lookahead = None
+            self.__input = None
             self.__file.close()
             self.__line_nr = 0
             self.__file_eof = 0
@@ -403,7 +1139,16 @@ class SvnDumpFile:
             self.__uuid = None
             self.__file = None
             self.__rev_props = None
+            self.__rev_prop_span = None
             self.__nodes.clear()
+            self.__index = None
+            self.__index_loaded = False
+            self.__new_index = None
+            self.__deltas = None
+            self.__delta_writer = None
+            if self.__blobs != None:
+                self.__blobs.close()
+                self.__blobs = None
             self.__state = self.ST_NONE
 
     #------------------------------------------------------------
@@ -425,27 +1170,45 @@ class SvnDumpFile:
         # check for end of file
         if self.__file_eof:
             self.__state = self.ST_EOF
+            if self.__new_index != None:
+                self.__new_index.save( self.__filename )
+                self.__index = self.__new_index
+                self.__index_loaded = True
+                self.__new_index = None
             return False
 
-        # go to start of revision
-        if self.__rev_start_offset != self.__file.tell():
-            self.__file.seek( self.__rev_start_offset )
-
-        # get rev tags
-        tags = self.__get_tag_list()
+        if self.__lookahead != None:
+            # rev tags have already been read from the stream
+            tags = self.__lookahead
+            self.__lookahead = None
+        else:
+            # go to start of revision
+            if self.__rev_start_offset != self.__input.tell():
+                self.__input.seek( self.__rev_start_offset )
+            # get rev tags
+            tags = self.__get_tag_list()
         self.__rev_nr = int( tags["Revision-number:"] )
-
-        # read revision properties
-        self.__rev_props = self.__get_prop_list()
+        revoffset = self.__tag_start_offset
+        revpropoffset = self.__input.tell()
+
+        if self.__spool != None and self.__deltas == None and \
+                self.__blobs == None:
+            # texts of the previous revision are not needed anymore,
+            # deltas and the blob cache may need texts of any earlier
+            # revision so then the spool grows to the size of the dump
+            self.__spool.seek( 0 )
+            self.__spool.truncate()
+
+        # skip revision properties, they're parsed by __load_rev_props()
+        self.__rev_props = None
+        self.__rev_prop_span = None
+        if tags.has_key( "Prop-content-length:" ):
+            proplen = int( tags["Prop-content-length:"] )
+            self.__rev_prop_span = ( self.__skip_content( proplen ), proplen )
+        self.__rev_raw = None
+        if self.__spool == None:
+            self.__rev_raw = ( revoffset, self.__input.tell() - revoffset )
         self.__skip_empty_line()
-        if not self.__rev_props.has_key("svn:log"):
-            self.__rev_props["svn:log"] = ""
-        if not self.__rev_props.has_key("svn:author"):
-            self.__rev_props["svn:author"] = ""
-        if self.__rev_props.has_key("svn:date"):
-            self.set_rev_date(self.__rev_props["svn:date"] )
-        else:
-            self.set_rev_date( "" )
 
         # read nodes (files, dirs)
         self.__nodes.clear()
@@ -454,20 +1217,28 @@ class SvnDumpFile:
         while len(tags) != 0:
             # check that it's not the next revision
             if tags.has_key( "Revision-number:" ):
-                # go back to start of tag list
-                self.__file.seek( self.__tag_start_offset )
-                self.__line_nr = self.__tag_start_line_nr
+                if self.__spool != None:
+                    # keep the tags for the next call
+                    self.__lookahead = tags
+                else:
+                    # go back to start of tag list
+                    self.__input.seek( self.__tag_start_offset )
+                    self.__line_nr = self.__tag_start_line_nr
                 break
-            # get node properties
+            nodeoffset = self.__tag_start_offset
+            # skip node properties, they're parsed when needed
             if tags.has_key( "Prop-content-length:" ):
-                properties = self.__get_prop_list()
+                proplen = int( tags["Prop-content-length:"] )
+                propoffset = self.__skip_content( proplen )
             else:
-                properties = None
+                propoffset = -1
+                proplen = -1
+            rawend = self.__input.tell()
             # skip node data
             if tags.has_key( "Text-content-length:" ):
                 tags["Text-content-length:"] = int( tags["Text-content-length:"] )
-                offset = self.__file.tell()
-                self.__skip_bin( tags["Text-content-length:"] )
+                offset = self.__skip_content( tags["Text-content-length:"] )
+                rawend = self.__input.tell()
                 self.__skip_empty_line()
             else:
                 offset = 0
@@ -478,8 +1249,23 @@ class SvnDumpFile:
             if tags.has_key( "Node-kind:" ):
                 kind = tags["Node-kind:"]
             node = SvnDumpNode( path, action, kind )
-            if properties != None:
-                node.set_properties( properties )
+            textdelta = tags.get( "Text-delta:" ) == "true"
+            propdelta = tags.get( "Prop-delta:" ) == "true"
+            if self.__deltas != None:
+                key = self.__record_deltas( path, action, tags, offset,
+                                            propoffset, proplen )
+            if proplen < 0:
+                pass
+            elif propdelta:
+                node.set_properties_delta( self.__deltas, key )
+            elif self.__mmap != None:
+                node.set_properties_buffer( self.__mmap, propoffset, proplen )
+            elif self.__spool != None:
+                node.set_properties_fileobj( self.__spool, propoffset,
+                                             proplen )
+            else:
+                node.set_properties_fileobj( self.__file, propoffset,
+                                             proplen )
             if tags.has_key( "Node-copyfrom-path:" ):
                 node.set_copy_from( tags["Node-copyfrom-path:"].lstrip('/'),
                                     int(tags["Node-copyfrom-rev:"]) )
@@ -487,18 +1273,241 @@ class SvnDumpFile:
               md5 = tags["Text-content-md5:"]
             else:
               md5 = ""
+            if tags.has_key( "Text-content-sha1:" ):
+              sha1 = tags["Text-content-sha1:"]
+            else:
+              sha1 = ""
             if tags.has_key( "Text-content-length:" ):
-                node.set_text_fileobj( self.__file, offset,
-                                       int(tags["Text-content-length:"]),
-                                       md5 )
+                if textdelta:
+                    node.set_text_delta( self.__deltas, key, md5, sha1 )
+                elif self.__mmap != None:
+                    node.set_text_buffer( self.__mmap, offset,
+                                          tags["Text-content-length:"], md5,
+                                          sha1 )
+                elif self.__spool != None:
+                    node.set_text_fileobj( self.__spool, offset,
+                                           tags["Text-content-length:"],
+                                           md5, sha1 )
+                else:
+                    node.set_text_fileobj( self.__file, offset,
+                                           tags["Text-content-length:"],
+                                           md5, sha1 )
+            for name in self.CHECKSUM_TAGS:
+                if tags.has_key( name + ":" ):
+                    node.set_checksum( name, tags[name + ":"] )
+            if self.__blobs != None and len( md5 ) > 0:
+                if textdelta:
+                    self.__blobs.add_text( md5, sha1, -1,
+                                           ( self.__deltas, key ), True )
+                elif tags.has_key( "Text-content-length:" ):
+                    length = tags["Text-content-length:"]
+                    self.__blobs.add_text( md5, sha1, length,
+                                           ( offset, length ) )
+            if textdelta or propdelta:
+                # the delta bases may differ in the output
+                pass
+            elif self.__mmap != None:
+                node.set_raw_buffer( self.__mmap, nodeoffset,
+                                     rawend - nodeoffset )
+            elif self.__spool == None:
+                node.set_raw_fileobj( self.__file, nodeoffset,
+                                      rawend - nodeoffset )
             upath = ( action[0].upper(), path )
             self.__nodes[upath] = node
             # next one...
             tags = self.__get_tag_list()
 
-        self.__rev_start_offset = self.__file.tell()
+        if self.__new_index != None:
+            self.__new_index.add_rev( self.__rev_nr, revoffset, revpropoffset,
+                                      len( self.__nodes ) )
+        if self.__lookahead != None:
+            self.__rev_start_offset = self.__tag_start_offset
+        else:
+            self.__rev_start_offset = self.__input.tell()
         return True
 
+    def __record_deltas( self, path, action, tags, textoffset, propoffset,
+                         proplen ):
+        """
+        Records the text and properties of a node in the delta resolver.
+
+        @type path: string
+        @param path: Path of the node.
+        @type action: string
+        @param action: Action of the node.
+        @type tags: dict
+        @param tags: The tags of the node.
+        @type textoffset: integer
+        @param textoffset: Offset of the text.
+        @type propoffset: integer
+        @param propoffset: Offset of the properties.
+        @type proplen: integer
+        @param proplen: Length of the properties or -1.
+        @rtype: integer
+        @return: The key of the node.
+        """
+
+        copyfrom = None
+        if tags.has_key( "Node-copyfrom-path:" ):
+            copyfrom = ( tags["Node-copyfrom-path:"].lstrip('/'),
+                         int( tags["Node-copyfrom-rev:"] ) )
+        text = None
+        if tags.has_key( "Text-content-length:" ):
+            text = ( textoffset, tags["Text-content-length:"],
+                     tags.get( "Text-delta:" ) == "true" )
+        props = None
+        if proplen >= 0:
+            props = ( propoffset, proplen,
+                      tags.get( "Prop-delta:" ) == "true" )
+        return self.__deltas.add_node( self.__rev_nr, path, action,
+                                       copyfrom, text, props )
+
+    def seek_rev( self, revnr ):
+        """
+        Seek to the given revision and read it.
+
+        If the revision does not exist the next one after it is read.
+
+        The revision offset index of the dump file is used if it has a
+        valid one (see get_index()), else the revisions are read one by one,
+        starting over at the first revision if revnr is not after the
+        current revision. Streams can only seek forward.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: bool
+        @return: False if EOF occured.
+        """
+
+        # check state
+        if self.__state != self.ST_READ and self.__state != self.ST_EOF:
+            raise SvnDumpException, "invalid state %d (should be %d or %d)" % \
+                        ( self.__state, self.ST_READ, self.ST_EOF )
+
+        # jumping around makes the offsets collected so far useless
+        self.__new_index = None
+        index = None
+        if self.__spool == None and self.__deltas == None:
+            # with deltas the revisions before are needed as delta bases
+            index = self.get_index()
+        if index != None:
+            i = index.get_rev_index( revnr )
+            if i < 0:
+                self.__state = self.ST_EOF
+                return False
+            self.__rev_start_offset = index.get_rev_offset( i )
+            self.__file_eof = 0
+            self.__line_nr = 0
+            self.__state = self.ST_READ
+            return self.read_next_rev()
+
+        # no index, read sequentially
+        if self.__state == self.ST_EOF or ( self.__rev_nr >= revnr and
+                self.__rev_start_offset != self.__first_rev_offset ):
+            if self.__spool != None:
+                raise SvnDumpException, \
+                        "cannot seek backwards in a stream (to r%d)" % revnr
+            self.__rev_start_offset = self.__first_rev_offset
+            self.__file_eof = 0
+            self.__line_nr = 0
+            self.__state = self.ST_READ
+            self.__reset_deltas()
+        while self.read_next_rev():
+            if self.__rev_nr >= revnr:
+                return True
+        return False
+
+    def __reset_deltas( self ):
+        """
+        Forgets the texts and properties recorded for resolving deltas.
+        """
+
+        if self.__deltas != None:
+            self.__deltas = DeltaResolver( self.__read_span,
+                                           self.__delta_cache_size )
+
+    def is_stream( self ):
+        """
+        Returns True if the dump file is read as a stream.
+
+        Pipes, stdin and compressed files are read as streams, they
+        can't be memory mapped or positioned.
+
+        @rtype: bool
+        @return: True for streams.
+        """
+
+        return self.__spool != None
+
+    def get_next_rev_offset( self ):
+        """
+        Returns the offset of the revision read by the next call to
+        read_next_rev(), or the size of the dump after the last one.
+
+        @rtype: integer
+        @return: Offset in the (uncompressed) dump file.
+        """
+
+        return self.__rev_start_offset
+
+    def set_next_rev_offset( self, offset ):
+        """
+        Sets the offset of the revision read by the next call to
+        read_next_rev().
+
+        The offset has to be one returned by get_next_rev_offset().
+        Streams can't be positioned.
+
+        @type offset: integer
+        @param offset: Offset of a revision or the size of the dump.
+        """
+
+        # check state
+        if self.__state != self.ST_READ and self.__state != self.ST_EOF:
+            raise SvnDumpException, "invalid state %d (should be %d or %d)" % \
+                        ( self.__state, self.ST_READ, self.ST_EOF )
+        if self.__spool != None:
+            raise SvnDumpException, "cannot set the offset of a stream"
+
+        # jumping around makes the offsets collected so far useless
+        self.__new_index = None
+        self.__reset_deltas()
+        self.__rev_start_offset = offset
+        self.__file_eof = 0
+        if offset >= self.__file_size:
+            self.__file_eof = 1
+        self.__line_nr = 0
+        self.__state = self.ST_READ
+
+    def get_index( self ):
+        """
+        Returns the revision offset index of this dump file.
+
+        The index is loaded on the first call. An index file which does
+        not match the dump file is ignored.
+
+        @rtype: SvnDumpIndex
+        @return: The index or None if there is no valid index.
+        """
+
+        if not self.__index_loaded:
+            self.__index_loaded = True
+            self.__index = load_dump_index( self.__filename )
+        return self.__index
+
+    def set_write_index( self, writeindex ):
+        """
+        Write an index when reading reaches EOF.
+
+        Has to be called before open(). The index is not written if
+        seek_rev() has been called.
+
+        @type writeindex: bool
+        @param writeindex: True to write an index.
+        """
+
+        self.__write_index = writeindex
+
     def has_revision( self ):
         """
         Returns false when EOF occured.
@@ -508,6 +1517,15 @@ class SvnDumpFile:
         """
         return self.__state == self.ST_READ or self.__state == self.ST_WRITE
 
+    def get_format_version( self ):
+        """
+        Returns the format version of the dump file read.
+
+        @rtype: integer
+        @return: 2, or 3 for dumps with deltas.
+        """
+        return self.__format_version
+
     def get_uuid( self ):
         """
         Returns the UUID of this dump file.
@@ -517,6 +1535,15 @@ class SvnDumpFile:
         """
         return self.__uuid
 
+    def get_state( self ):
+        """
+        Returns the state of this dump file.
+
+        @rtype: integer
+        @return: One of the ST_* constants.
+        """
+        return self.__state
+
     def get_rev_nr( self ):
         """
         Returns the current revision number.
@@ -533,6 +1560,7 @@ class SvnDumpFile:
         @rtype: list( integer )
         @return: The revision date.
         """
+        self.__load_rev_props()
         return self.__rev_date
 
     def get_rev_date_str( self ):
@@ -542,6 +1570,7 @@ class SvnDumpFile:
         @rtype: string
         @return: The revision date.
         """
+        self.__load_rev_props()
         return self.__rev_props["svn:date"]
 
     def get_rev_author( self ):
@@ -551,6 +1580,7 @@ class SvnDumpFile:
         @rtype: string
         @return: Author of the current revision.
         """
+        self.__load_rev_props()
         return self.__rev_props["svn:author"]
 
     def get_rev_log( self ):
@@ -560,6 +1590,7 @@ class SvnDumpFile:
         @rtype: string
         @return: The log message.
         """
+        self.__load_rev_props()
         return self.__rev_props["svn:log"]
 
     def get_rev_prop_names( self ):
@@ -569,6 +1600,7 @@ class SvnDumpFile:
         @rtype: list( string )
         @return: A list of revision property names.
         """
+        self.__load_rev_props()
         return self.__rev_props.keys()
 
     def has_rev_prop( self, name ):
@@ -578,6 +1610,7 @@ class SvnDumpFile:
         @rtype: bool
         @return: True if the revision has that property.
         """
+        self.__load_rev_props()
         return self.__rev_props.has_key(name)
 
     def get_rev_props( self ):
@@ -587,6 +1620,7 @@ class SvnDumpFile:
         @rtype: dict( string -> string )
         @return: The revision properties.
         """
+        self.__load_rev_props()
         return self.__rev_props
 
     def get_rev_prop_value( self, name ):
@@ -598,6 +1632,7 @@ class SvnDumpFile:
         @rtype: string
         @return: The value of the revision property.
         """
+        self.__load_rev_props()
         return self.__rev_props[name]
 
     def get_node_count( self ):
@@ -661,6 +1696,7 @@ class SvnDumpFile:
         @rtype: string
         @return: A svn date string.
         """
+        self.__load_rev_props()
         self.__rev_date = parse_svn_date_str( dateStr )
         self.__rev_props["svn:date"] = create_svn_date_str( self.__rev_date )
         return self.__rev_props["svn:date"]
@@ -672,6 +1708,7 @@ class SvnDumpFile:
         @type author: string
         @param author: The author to set for this revision.
         """
+        self.__load_rev_props()
         self.__rev_props["svn:author"] = author
 
     def set_rev_log( self, logMsg):
@@ -681,6 +1718,7 @@ class SvnDumpFile:
         @type logMsg: string
         @param logMsg: The log message to set for this revision.
         """
+        self.__load_rev_props()
         self.__rev_props["svn:log"] = logMsg
 
     def set_rev_prop_value( self, name, value ):
@@ -692,6 +1730,7 @@ class SvnDumpFile:
         @type value: string
         @param value: Value of the property.
         """
+        self.__load_rev_props()
         if name == "svn:date":
             self.set_rev_date(value)
         else:
@@ -709,6 +1748,8 @@ class SvnDumpFile:
     def add_rev_from_dump( self, dump ):
         """
         Add the current revision of the specified SvnDumpFile to this one.
+
+        Revision header and unmodified nodes are copied raw if possible.
         
         @type dump: SvnDumpFile
         @param dump: A dump file.
@@ -716,7 +1757,11 @@ class SvnDumpFile:
 
         # check of state is done in add_rev
         # add revision and revprops
-        self.add_rev( dump.get_rev_props() )
+        self.__raw_rev_dump = dump
+        try:
+            self.add_rev( dump.get_rev_props() )
+        finally:
+            self.__raw_rev_dump = None
 
         # add nodes
         index = 0
@@ -749,14 +1794,22 @@ class SvnDumpFile:
             revProps["svn:log"] = ""
         self.__rev_props = revProps
 
-        propStr = self.__create_prop_string( revProps )
+        rawdump = self.__raw_rev_dump
+        if rawdump != None and rawdump.__rev_raw != None and \
+                rawdump.__rev_nr == self.__rev_nr and \
+                revProps == rawdump.__rev_raw_props:
+            # unmodified revision of add_rev_from_dump(), copy it raw
+            rawdump.__copy_raw( self.__file, rawdump.__rev_raw )
+            self.__file.write( "\n" )
+            self.__state = self.ST_WRITE
+            return
+
+        props, proplen = self.__create_prop_list( revProps )
         # write revision
-        self.__file.writelines( [ "Revision-number: %d\n" % self.__rev_nr,
-                                "Prop-content-length: %d\n" % len(propStr),
-                                "Content-length: %d\n" % len(propStr),
-                                "\n",
-                                propStr,
-                                "\n" ] )
+        self.__file.write( "".join( [ "Revision-number: %d\n" % self.__rev_nr,
+                                      "Prop-content-length: %d\n" % proplen,
+                                      "Content-length: %d\n\n" % proplen ]
+                                    + props + [ "\n" ] ) )
 
         # we have a revision now
         self.__state = self.ST_WRITE
@@ -776,68 +1829,115 @@ class SvnDumpFile:
             raise SvnDumpException, "invalid state %d (should be %d)" % \
                         ( self.__state, self.ST_WRITE )
 
-        # write the node
-        self.__file.write( "Node-path: " + node.get_path() + "\n" )
+        # svndiff data and md5 of the delta base if writing a delta
+        delta = None
+        if self.__delta_writer != None:
+            delta = self.__delta_writer.add_node( self.__rev_nr, node )
+        elif node.has_raw() and ( self.__copy_source_checksums or
+                len( node.get_checksum( self.CHECKSUM_TAGS[0] ) ) +
+                len( node.get_checksum( self.CHECKSUM_TAGS[1] ) ) == 0 ):
+            # unmodified node, copy it raw and add the empty lines
+            # the code below would write
+            node.write_raw_to_file( self.__file )
+            if node.get_action() == "delete":
+                pass
+            elif node.has_properties() or node.has_text():
+                self.__file.write( "\n\n" )
+            else:
+                self.__file.write( "\n" )
+            return
+
+        # the node is assembled in one buffer, except for the text
+        parts = [ "Node-path: ", node.get_path(), "\n" ]
+        append = parts.append
 
         # write kind if we know it (cvs2svn emits add's with copy-from
         # without kind so we do this here independent of the action)
         kind = node.get_kind()
         if len(kind) > 0:
-            self.__file.write( "Node-kind: %s\n" % kind )
+            append( "Node-kind: %s\n" % kind )
 
         action = node.get_action()
-        self.__file.write( "Node-action: " + action + "\n" )
+        append( "Node-action: %s\n" % action )
         if action != "delete":
             # copied ?
-            if node.get_copy_from_rev() != 0:
-                self.__file.write( "Node-copyfrom-rev: %d\n" % \
-                            node.get_copy_from_rev() )
-                self.__file.write( "Node-copyfrom-path: " + \
-                            node.get_copy_from_path() + "\n" )
+            cfrev = node.get_copy_from_rev()
+            if cfrev != 0:
+                append( "Node-copyfrom-rev: %d\n" % cfrev )
+                append( "Node-copyfrom-path: %s\n" %
+                        node.get_copy_from_path() )
+            # checksums of the copy source
+            if self.__copy_source_checksums:
+                for name in self.CHECKSUM_TAGS[:2]:
+                    checksum = node.get_checksum( name )
+                    if len( checksum ) > 0:
+                        append( "%s: %s\n" % ( name, checksum ) )
             # calculate length's of properties text and total
-            propstr = self.__create_prop_string( node.get_properties() )
-            proplen = len( propstr )
+            props = node.get_raw_properties()
+            if props != None:
+                # not parsed so not modified
+                props, proplen = [ props ], len( props )
+            else:
+                props, proplen = self.__create_prop_list(
+                                            node.get_properties() )
+            hastext = node.has_text()
             textlen = node.get_text_length()
-            if node.has_text():
+            if delta != None:
+                textlen = len( delta[0] )
+            if hastext:
                 totlen = proplen + textlen
             else:
                 totlen = proplen
             # write length's of properties text and total
             if proplen > 0:
-                self.__file.write( "Prop-content-length: %d\n" % proplen )
-            if node.has_text():
-                self.__file.write( "Text-content-length: %d\n" % textlen )
-            if node.has_md5():
-                self.__file.write( "Text-content-md5: %s\n" % node.get_text_md5() )
-            if proplen > 0 or node.has_text():
-                self.__file.write( "Content-length: %d\n" % totlen )
-                self.__file.write( "\n" )
+                append( "Prop-content-length: %d\n" % proplen )
+            if delta != None:
+                append( "Text-delta: true\n" )
+                if len( delta[1] ) > 0:
+                    append( "Text-delta-base-md5: %s\n" % delta[1] )
+            if hastext:
+                append( "Text-content-length: %d\n" % textlen )
+            md5 = node.get_text_md5()
+            if len( md5 ) > 0:
+                append( "Text-content-md5: %s\n" % md5 )
+            sha1 = node.get_text_sha1()
+            if len( sha1 ) > 0:
+                append( "Text-content-sha1: %s\n" % sha1 )
+            if proplen > 0 or hastext:
+                append( "Content-length: %d\n\n" % totlen )
             # write properties
             if proplen > 0:
-                self.__file.write( propstr )
+                parts.extend( props )
             # write text
-            if node.has_text():
+            if delta != None:
+                append( delta[0] )
+            elif hastext:
+                self.__file.write( "".join( parts ) )
                 node.write_text_to_file( self.__file )
-            self.__file.write( "\n" )
+                del parts[:]
+            append( "\n" )
         # CR after each node
-        self.__file.write( "\n" )
+        append( "\n" )
+        self.__file.write( "".join( parts ) )
 
 
 class SvnDumpFileWithHistory( SvnDumpFile ):
 
+    # errors
+    ERR_REV_DATE_OLDER      = 1
+    ERR_NODE_MD5_FAIL       = 2
+    ERR_NODE_EXISTS         = 3
+    ERR_NODE_NO_PARENT      = 4
+    ERR_NODE_PARENT_NOT_DIR = 5
+    ERR_NODE_NO_COPY_SRC    = 6
+    ERR_NODE_GONE           = 7
+    ERR_NODE_SHA1_FAIL      = 8
+
     def __init__( self ):
         SvnDumpFile.__init__( self )
-        # errors
-        self.ERR_REV_DATE_OLDER      = 1
-        self.ERR_NODE_MD5_FAIL       = 2
-        self.ERR_NODE_EXISTS         = 3
-        self.ERR_NODE_NO_PARENT      = 4
-        self.ERR_NODE_PARENT_NOT_DIR = 5
-        self.ERR_NODE_NO_COPY_SRC    = 6
-        self.ERR_NODE_GONE           = 7
         # node history for this
         self.__enable_nodehist = False
-        self.__nodehist = {}
+        self.__nodehist = NodeHistory()
         # check actions
         self.__enable_check_node_actions = False
         # check dates
@@ -847,6 +1947,10 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
         self.__enable_check_node_md5 = False
         # revision errors
         self.__rev_errors = {}
+        # name of the dump file
+        self.__filename = None
+        # number of the last revision read or resumed after
+        self.__last_rev_nr = -1
 
     def set_enable_node_history( self, enable ):
         """
@@ -893,6 +1997,116 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
 
         self.__enable_check_node_md5 = docheck
 
+    def save_history( self, filename=None ):
+        """
+        Saves the state of the checks after the current revision.
+
+        The state contains the node history, the date of the last revision
+        and the offset of the next revision so the checks can be continued
+        by resume_history() after revisions have been appended to the dump.
+
+        @type filename: string
+        @param filename: Name of the state file, None for the name returned
+            by history_file_name().
+        """
+
+        if self.is_stream():
+            raise SvnDumpException, "cannot save the history of a stream"
+        if filename == None:
+            filename = history_file_name( self.__filename )
+        offset = self.get_next_rev_offset()
+        state = {
+            "version":  1,
+            "uuid":     self.get_uuid(),
+            "revnr":    self.__last_rev_nr,
+            "offset":   offset,
+            "stamp":    self.__get_stamp( offset ),
+            "date":     self.__prev_date,
+            "history":  None,
+        }
+        if self.__enable_nodehist:
+            state["history"] = self.__nodehist.get_state()
+        # write a temp file first so an interrupted save loses nothing
+        tmpname = filename + ".tmp"
+        outfile = open( tmpname, "wb" )
+        try:
+            cPickle.dump( state, outfile, cPickle.HIGHEST_PROTOCOL )
+        finally:
+            outfile.close()
+        if os.path.exists( filename ):
+            os.remove( filename )
+        os.rename( tmpname, filename )
+
+    def resume_history( self, filename=None ):
+        """
+        Continues the checks after the revision saved by save_history().
+
+        Has to be called right after open(). The state is ignored if it
+        doesn't match the dump file, if the start of the dump has been
+        modified or if it has been saved without node history but node
+        history is enabled now.
+
+        @type filename: string
+        @param filename: Name of the state file, None for the name returned
+            by history_file_name().
+        @rtype: integer
+        @return: The revision number the checks continue after or -1 if
+            there's no usable state.
+        """
+
+        if self.is_stream():
+            raise SvnDumpException, "cannot resume the history of a stream"
+        if filename == None:
+            filename = history_file_name( self.__filename )
+        if not os.path.isfile( filename ):
+            return -1
+        infile = open( filename, "rb" )
+        try:
+            try:
+                state = cPickle.load( infile )
+            except Exception:
+                return -1
+        finally:
+            infile.close()
+        if type( state ) != dict or state.get( "version" ) != 1:
+            return -1
+        if state["uuid"] != self.get_uuid():
+            return -1
+        if self.__enable_nodehist and state["history"] == None:
+            return -1
+        if self.__get_stamp( state["offset"] ) != state["stamp"]:
+            return -1
+        self.set_next_rev_offset( state["offset"] )
+        self.__last_rev_nr = state["revnr"]
+        self.__prev_date = state["date"]
+        if self.__enable_nodehist:
+            self.__nodehist.set_state( state["history"] )
+        return self.__last_rev_nr
+
+    def __get_stamp( self, offset ):
+        """
+        Returns a checksum of the data of the dump file before an offset.
+
+        Only the last 64KB are used, enough to notice a replaced dump.
+
+        @type offset: integer
+        @param offset: Offset in the dump file.
+        @rtype: string
+        @return: The md5 sum or None if the file is shorter.
+        """
+
+        infile = open( self.__filename, "rb" )
+        try:
+            infile.seek( 0, 2 )
+            if infile.tell() < offset:
+                return None
+            start = max( 0, offset - 65536 )
+            infile.seek( start )
+            md = sdt_md5()
+            md.update( infile.read( offset - start ) )
+            return md.hexdigest()
+        finally:
+            infile.close()
 
     def get_rev_errors( self, revnr = None ):
         """
@@ -908,6 +2122,7 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
                 - A list of error information:
                     - for ERR_REV_DATE_OLDER: [ revdatestr, prevdatestr ]
                     - for ERR_NODE_MD5_FAIL: [ path, md5calc, md5node ]
+                    - for ERR_NODE_SHA1_FAIL: [ path, sha1calc, sha1node ]
                     - for ERR_NODE_XXXX: [ path, action, ... ]
                         - for ERR_NODE_NO_PARENT: [ path, action, parentpath ]
                         - for ERR_NODE_PARENT_NOT_DIR: [ path, action, parentpath ]
@@ -954,34 +2169,36 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
 
     def __check_node_md5( self, node ):
         """
-        Check the md5sum for the current node
+        Check the md5sum and, if the node has one, the sha1sum for the
+        current node
+
+        Both sums are calculated while reading the text once.
 
         @type node: SvnDumpNode
         @param node: Current node
         """
         if self.__enable_check_node_md5 and node.has_text():
-            md = sdt_md5()
-            handle = node.text_open()
-            data = node.text_read( handle )
-            n = 0
-            while len(data) > 0:
-                n = n + len(data)
-                md.update( data )
-                data = node.text_read( handle )
-            node.text_close( handle )
-            md5sum = md.hexdigest()
-            if node.get_text_md5() != md5sum:
+            names = [ "md5" ]
+            if node.has_sha1():
+                names.append( "sha1" )
+            digests = node.calculate_digests( names )
+            if node.get_text_md5() != digests["md5"]:
                 self.__add_rev_error( self.get_rev_nr(),
                         [ self.ERR_NODE_MD5_FAIL,
-                        [ node.get_path(), md5sum, node.get_text_md5() ] ], )
+                        [ node.get_path(), digests["md5"],
+                          node.get_text_md5() ] ], )
+            if node.has_sha1() and node.get_text_sha1() != digests["sha1"]:
+                self.__add_rev_error( self.get_rev_nr(),
+                        [ self.ERR_NODE_SHA1_FAIL,
+                        [ node.get_path(), digests["sha1"],
+                          node.get_text_sha1() ] ], )
 
     def __nodehist_init( self ):
         """
         Initialize the node history
         """
 
-        # the root always exists and is a directory
-        self.__nodehist = { "": [ "D", [ 0, 999999999 ] ] }
+        self.__nodehist = NodeHistory()
         self.__rev_errors.clear()
 
     def nodehist_get_kind( self, revnr, path ):
@@ -1008,31 +2225,7 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
         @rtype: string
         @return: "D" for dirs, "F" for files or None.
         """
-        if not self.__nodehist.has_key( path ):
-            return None
-        nodehist = self.__nodehist[ path ]
-        i = self.__nodehist_get_rev_index( nodehist, revnr )
-        if i == None:
-            return None
-        return nodehist[0][0]
-
-    def __nodehist_get_rev_index( self, nodehist, revnr ):
-        """
-        Returns the index into the node history or None.
-
-        @type nodehist: list
-        @param nodehist: History of a node.
-        @type revnr: int
-        @param revnr: Current revision number.
-        """
-        i = len(nodehist) - 1
-        while i > 0 and revnr < nodehist[i][0]:
-            i -= 1
-        if i == 0:
-            return None
-        if revnr > nodehist[i][1] and nodehist[i][1] >= 0:
-            return None
-        return i
+        return self.__nodehist.get_kind( revnr, path )
 
     def __nodehist_add_node( self, revnr, node ):
         """
@@ -1043,64 +2236,15 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
         @type node: SvnDumpNode
         @param node: Node to add.
         """
-        path = node.get_path()
-        if not self.__nodehist.has_key( path ):
-            # create revision list for path
-            kind = "D"
-            if node.get_kind() == "file":
-                kind = "F"
-            self.__nodehist[ path ] = [ ( kind ) ]
-        # add revision range
-        self.__nodehist[ path ].append( [ revnr, -1 ] )
-        kind = self.__nodehist[ path ][0][0]
-        # continue only if it's a dir with copy-from
-        if kind == "F" or not node.has_copy_from():
-            return
-        # recursive copy
-        cfpath = node.get_copy_from_path() + "/"
-        cfpathlen = len(cfpath)
-        cfrev = node.get_copy_from_rev()
-        path += "/"
-        for cfnodepath in self.__nodehist.keys()[:]:
-            if cfnodepath.startswith( cfpath ):
-                cfnodehist = self.__nodehist[cfnodepath]
-                i = self.__nodehist_get_rev_index( cfnodehist, cfrev )
-                if i != None:
-                    npath = path + cfnodepath[cfpathlen:]
-                    # add new path
-                    if not self.__nodehist.has_key( npath ):
-                        # create revision list for npath
-                        kind = "D"
-                        if node.get_kind() == "file":
-                            kind = "F"
-                        self.__nodehist[ npath ] = [ cfnodehist[0] ]
-                    # add revision range
-                    self.__nodehist[ npath ].append( [ revnr, -1 ] )
-
-
-    def __nodehist_delete_node( self, revnr, node ):
-        """
-        Deletes a node from the history, recursively if it is a directory.
-
-        @type revnr: int
-        @param revnr: Current revision number.
-        @type node: SvnDumpNode
-        @param node: Node to add.
-        """
-        # set end revision
-        path = node.get_path()
-        self.__nodehist[ path ][-1][1] = revnr - 1
-        kind = self.__nodehist[ path ][0][0]
-        # continue only if it's a dir
-        if kind == "F":
-            return
-        # recursive delete
-        path += "/"
-        for nodepath in self.__nodehist.keys()[:]:
-            if nodepath.startswith( path ):
-                nodehist = self.__nodehist[nodepath]
-                if nodehist[-1][1] == -1:
-                    nodehist[-1][1] = revnr - 1
+        kind = "D"
+        if node.get_kind() == "file":
+            kind = "F"
+        if node.has_copy_from():
+            self.__nodehist.add( revnr, node.get_path(), kind,
+                                 node.get_copy_from_rev(),
+                                 node.get_copy_from_path() )
+        else:
+            self.__nodehist.add( revnr, node.get_path(), kind )
 
     def __nodehist_process_node( self, node ):
         """
@@ -1148,7 +2292,7 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
                                     [ self.ERR_NODE_NO_COPY_SRC,
                                     [ path, action, cfrev, cfpath ] ], )
                             err = True
-            if not err or self.__state == self.ST_WRITE:
+            if not err or self.get_state() == self.ST_WRITE:
                 self.__nodehist_add_node( revnr, node )
         elif action == "delete":
             if self.__enable_check_node_actions:
@@ -1157,8 +2301,8 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
                     self.__add_rev_error( revnr,
                             [ self.ERR_NODE_GONE, [ path, action ] ], )
                     err = True
-            if not err or self.__state == self.ST_WRITE:
-                self.__nodehist_delete_node( revnr, node )
+            if not err or self.get_state() == self.ST_WRITE:
+                self.__nodehist.delete( revnr, path )
         else:
             if self.__enable_check_node_actions:
                 # path must exist
@@ -1168,8 +2312,8 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
                     err = True
             # replace = delete & add; changes can be ignored
             if action == "replace" and node.has_copy_from():
-                if not err or self.__state == self.ST_WRITE:
-                    self.__nodehist_delete_node( revnr, node )
+                if not err or self.get_state() == self.ST_WRITE:
+                    self.__nodehist.delete( revnr, path )
                     self.__nodehist_add_node( revnr, node )
 
     def open( self, filename ):
@@ -1180,6 +2324,8 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
         """
 
         SvnDumpFile.open( self, filename )
+        self.__filename = filename
+        self.__last_rev_nr = -1
         self.__nodehist_init()
 
     def create_with_rev_0( self, filename, uuid, rev0date ):
@@ -1220,7 +2366,7 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
         SvnDumpFile.close( self )
         # +++ maybe close should call a protected _close() function which
         # does this here? (clearing things too often doesn't hurt too much)
-        self.__nodehist = {}
+        self.__nodehist = NodeHistory()
         self.__rev_errors.clear()
         self.__prev_date = (0,0)
 
@@ -1232,11 +2378,14 @@ class SvnDumpFileWithHistory( SvnDumpFile ):
         @return: False if EOF occured.
         """
 
-        SvnDumpFile.read_next_rev( self )
+        if not SvnDumpFile.read_next_rev( self ):
+            return False
+        self.__last_rev_nr = self.get_rev_nr()
         self.__check_rev_dates()
         for node in self.get_nodes_iter():
             self.__check_node_md5( node )
             self.__nodehist_process_node( node )
+        return True
 
     def add_rev( self, revProps ):
         """
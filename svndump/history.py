@@ -0,0 +1,452 @@
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+from bisect import bisect_right
+
+from common import *
+
+__doc__ = """Node history of a dump file."""
+
+def history_file_name( dumpfilename ):
+    """
+    Returns the name of the file the check state of a dump is saved in.
+
+    @type dumpfilename: string
+    @param dumpfilename: Name of the dump file.
+    @rtype: string
+    @return: Name of the state file.
+    """
+    return dumpfilename + ".sdthist"
+
+class HistoryNode( object ):
+    """
+    One path in the NodeHistory trie.
+
+    The revision ranges in which the path exists are stored in parallel
+    lists sorted by start revision, an end of -1 means the path still
+    exists. A range of a directory created by a copy can have a source,
+    the directory it was copied from and the copy-from revision. In that
+    range all children which are not in the trie come from the source.
+    """
+
+    __slots__ = ( "children", "kind", "starts", "ends", "sources" )
+
+    def __init__( self ):
+        """
+        Initialize.
+        """
+
+        # child nodes, name -> HistoryNode, or None
+        self.children = None
+        # "D" for dirs, "F" for files, None if the path never existed
+        self.kind = None
+        # start revisions of the ranges
+        self.starts = []
+        # end revisions of the ranges
+        self.ends = []
+        # ( HistoryNode, revnr ) or None for each range,
+        # None if no range has a source
+        self.sources = None
+
+    def range_index( self, revnr ):
+        """
+        Returns the index of the range containing the given revision.
+
+        @type revnr: integer
+        @param revnr: A revision number.
+        @rtype: integer
+        @return: Index of the range or -1 if the path doesn't exist.
+        """
+
+        i = bisect_right( self.starts, revnr ) - 1
+        if i < 0:
+            return -1
+        end = self.ends[i]
+        if end >= 0 and revnr > end:
+            return -1
+        return i
+
+    def exists( self, revnr ):
+        """
+        Returns True if the path exists in the given revision.
+
+        @type revnr: integer
+        @param revnr: A revision number.
+        @rtype: bool
+        @return: True if the path exists.
+        """
+
+        return self.range_index( revnr ) >= 0
+
+    def add_range( self, start, end, source ):
+        """
+        Adds a revision range.
+
+        @type start: integer
+        @param start: Start revision.
+        @type end: integer
+        @param end: End revision or -1.
+        @type source: ( HistoryNode, integer )
+        @param source: Copy source and revision or None.
+        """
+
+        if source != None and self.sources == None:
+            self.sources = [ None ] * len( self.starts )
+        self.starts.append( start )
+        self.ends.append( end )
+        if self.sources != None:
+            self.sources.append( source )
+
+    def get_source( self, i ):
+        """
+        Returns the copy source of a range.
+
+        @type i: integer
+        @param i: Index of the range.
+        @rtype: ( HistoryNode, integer )
+        @return: Copy source and revision or None.
+        """
+
+        if self.sources == None:
+            return None
+        return self.sources[i]
+
+class NodeHistory:
+    """
+    Keeps track of the revisions in which the paths of a dump exist.
+
+    The paths are stored in a trie so copying or deleting a directory
+    only touches the nodes below that directory. Copied directories
+    share the subtree of their source, the paths below them are only
+    added to the trie when one of them is modified.
+    """
+
+    def __init__( self ):
+        """
+        Initialize.
+        """
+
+        # the root always exists and is a directory
+        self.__root = HistoryNode()
+        self.__root.kind = "D"
+        self.__root.add_range( 0, -1, None )
+
+    def __resolve( self, path, revnr ):
+        """
+        Returns the trie node of a path in a revision.
+
+        Paths below copied directories are looked up in the copy source,
+        so the returned trie node may belong to another path and the
+        revision number may be an older one.
+
+        @type path: string
+        @param path: Path of a node.
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: ( HistoryNode, integer )
+        @return: The trie node and the revision number in which it has
+            to be looked at, the node is None if the path doesn't exist.
+        """
+
+        hnode = self.__root
+        if len( path ) == 0:
+            return hnode, revnr
+        for name in path.split( "/" ):
+            while True:
+                child = None
+                if hnode.children != None:
+                    child = hnode.children.get( name )
+                    if child != None and child.exists( revnr ):
+                        break
+                i = hnode.range_index( revnr )
+                if i >= 0 and hnode.get_source( i ) != None:
+                    # not modified since the copy, look at the source
+                    hnode, revnr = hnode.get_source( i )
+                elif child != None:
+                    break
+                else:
+                    return None, revnr
+            hnode = child
+        if hnode.kind == None or not hnode.exists( revnr ):
+            return None, revnr
+        return hnode, revnr
+
+    def __get_children( self, hnode, revnr ):
+        """
+        Returns the children of a trie node existing in a revision.
+
+        @type hnode: HistoryNode
+        @param hnode: The trie node.
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: dict( string -> ( HistoryNode, integer ) )
+        @return: Name -> trie node and revision number to look at it.
+        """
+
+        children = {}
+        while True:
+            i = hnode.range_index( revnr )
+            if i < 0:
+                break
+            if hnode.children != None:
+                for name, child in hnode.children.iteritems():
+                    if child.kind != None and not children.has_key( name ) \
+                            and child.exists( revnr ):
+                        children[name] = ( child, revnr )
+            source = hnode.get_source( i )
+            if source == None:
+                break
+            hnode, revnr = source
+        return children
+
+    def __expand( self, hnode, revnr ):
+        """
+        Adds the children a copied directory shares with its source
+        to the trie.
+
+        @type hnode: HistoryNode
+        @param hnode: Trie node of the directory.
+        @type revnr: integer
+        @param revnr: Current revision number.
+        """
+
+        i = hnode.range_index( revnr )
+        if i < 0 or hnode.get_source( i ) == None:
+            return
+        cfnode, cfrev = hnode.sources[i]
+        hnode.sources[i] = None
+        if hnode.children == None:
+            hnode.children = {}
+        start = hnode.starts[i]
+        end = hnode.ends[i]
+        for name, source in self.__get_children( cfnode, cfrev ).iteritems():
+            child = hnode.children.get( name )
+            if child == None:
+                child = HistoryNode()
+                hnode.children[name] = child
+            if child.kind == None:
+                child.kind = source[0].kind
+            if child.kind == "F":
+                source = None
+            child.add_range( start, end, source )
+
+    def __find( self, path, revnr ):
+        """
+        Returns the trie node of a path to be modified.
+
+        Missing trie nodes are created, copied directories above the
+        path are expanded.
+
+        @type path: string
+        @param path: Path of a node.
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @rtype: HistoryNode
+        @return: The trie node.
+        """
+
+        hnode = self.__root
+        if len( path ) == 0:
+            return hnode
+        for name in path.split( "/" ):
+            child = None
+            if hnode.children != None:
+                child = hnode.children.get( name )
+            if child == None or not child.exists( revnr ):
+                # the child may be shared with a copy source
+                self.__expand( hnode, revnr )
+                if hnode.children == None:
+                    hnode.children = {}
+                child = hnode.children.get( name )
+                if child == None:
+                    child = HistoryNode()
+                    hnode.children[name] = child
+            hnode = child
+        return hnode
+
+    def get_kind( self, revnr, path ):
+        """
+        Returns the kind of a node if it exists, else None.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @type path: string
+        @param path: Path of a node.
+        @rtype: string
+        @return: "D" for dirs, "F" for files or None.
+        """
+
+        hnode, revnr = self.__resolve( path, revnr )
+        if hnode == None:
+            return None
+        return hnode.kind
+
+    def get_paths( self, revnr ):
+        """
+        Returns all paths existing in a revision.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: list( string )
+        @return: Unsorted list of the paths, without the root.
+        """
+
+        paths = []
+        stack = [ ( "", self.__root, revnr ) ]
+        while len( stack ) > 0:
+            prefix, hnode, revnr = stack.pop()
+            children = self.__get_children( hnode, revnr )
+            for name, ( child, childrev ) in children.iteritems():
+                path = prefix + name
+                paths.append( path )
+                if child.kind == "D":
+                    stack.append( ( path + "/", child, childrev ) )
+        return paths
+
+    def add( self, revnr, path, kind, cfrev=None, cfpath=None ):
+        """
+        Adds a path, recursively if it is a dir with copy-from path/rev.
+
+        The kind of a path is set when it's added the first time.
+
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        @type kind: string
+        @param kind: "D" for dirs, "F" for files.
+        @type cfrev: integer
+        @param cfrev: Copy-from revision or None.
+        @type cfpath: string
+        @param cfpath: Copy-from path or None.
+        """
+
+        hnode = self.__find( path, revnr )
+        if hnode.kind == None:
+            hnode.kind = kind
+        source = None
+        # only dirs with copy-from share a subtree
+        if hnode.kind == "D" and cfpath != None and cfrev < revnr:
+            cfnode, cfrev = self.__resolve( cfpath, cfrev )
+            if cfnode != None and cfnode.kind == "D":
+                source = ( cfnode, cfrev )
+        hnode.add_range( revnr, -1, source )
+
+    def delete( self, revnr, path ):
+        """
+        Deletes a path, recursively if it is a directory.
+
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type path: string
+        @param path: Path of the node.
+        """
+
+        hnode = self.__find( path, revnr )
+        if len( hnode.ends ) == 0:
+            return
+        # set end revision
+        hnode.ends[-1] = revnr - 1
+        # continue only if it's a dir
+        if hnode.kind == "F":
+            return
+        # recursive delete, shared children end with the copy
+        stack = [ hnode ]
+        while len( stack ) > 0:
+            hnode = stack.pop()
+            if hnode.children == None:
+                continue
+            for child in hnode.children.itervalues():
+                if len( child.ends ) > 0 and child.ends[-1] == -1:
+                    child.ends[-1] = revnr - 1
+                stack.append( child )
+
+    def get_state( self ):
+        """
+        Returns the history as a tuple of flat lists, suitable for pickle.
+
+        The trie nodes are numbered breadth first, the root is 0.
+
+        @rtype: tuple
+        @return: The state, see set_state().
+        """
+
+        nodes = [ self.__root ]
+        numbers = { id( self.__root ): 0 }
+        parents = [ -1 ]
+        names = [ "" ]
+        i = 0
+        while i < len( nodes ):
+            children = nodes[i].children
+            if children != None:
+                for name, child in children.iteritems():
+                    numbers[id( child )] = len( nodes )
+                    nodes.append( child )
+                    parents.append( i )
+                    names.append( name )
+            i += 1
+        kinds = []
+        ranges = []
+        sources = []
+        for hnode in nodes:
+            kinds.append( hnode.kind )
+            ranges.append( ( hnode.starts, hnode.ends ) )
+            if hnode.sources == None:
+                sources.append( None )
+            else:
+                nodesources = []
+                for source in hnode.sources:
+                    if source != None:
+                        source = ( numbers[id( source[0] )], source[1] )
+                    nodesources.append( source )
+                sources.append( nodesources )
+        return ( parents, names, kinds, ranges, sources )
+
+    def set_state( self, state ):
+        """
+        Replaces the history by one returned by get_state().
+
+        @type state: tuple
+        @param state: The state.
+        """
+
+        parents, names, kinds, ranges, sources = state
+        nodes = []
+        for i in range( len( parents ) ):
+            hnode = HistoryNode()
+            hnode.kind = kinds[i]
+            hnode.starts, hnode.ends = ranges[i]
+            nodes.append( hnode )
+            if parents[i] >= 0:
+                parent = nodes[parents[i]]
+                if parent.children == None:
+                    parent.children = {}
+                parent.children[names[i]] = hnode
+        for i in range( len( nodes ) ):
+            if sources[i] != None:
+                nodesources = []
+                for source in sources[i]:
+                    if source != None:
+                        source = ( nodes[source[0]], source[1] )
+                    nodesources.append( source )
+                nodes[i].sources = nodesources
+        self.__root = nodes[0]
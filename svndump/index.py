@@ -0,0 +1,258 @@
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+from array import array
+from bisect import bisect_left
+import os
+
+from common import *
+
+__doc__ = """Revision offset index of a dump file."""
+
+# first line of an index file
+INDEX_MAGIC = "SVNDUMPTOOL-INDEX 1"
+
+def index_file_name( dumpfilename ):
+    """
+    Returns the name of the index file of a dump file.
+
+    @type dumpfilename: string
+    @param dumpfilename: Name of the dump file.
+    @rtype: string
+    @return: Name of the index file.
+    """
+    return dumpfilename + ".sdtidx"
+
+def dump_file_stamp( dumpfilename ):
+    """
+    Returns size and modification time of a dump file.
+
+    @type dumpfilename: string
+    @param dumpfilename: Name of the dump file.
+    @rtype: tuple( integer, integer )
+    @return: Size and mtime (in microseconds) of the file.
+    """
+    st = os.stat( dumpfilename )
+    return ( int( st.st_size ), int( st.st_mtime * 1000000 ) )
+
+class SvnDumpIndex:
+    """
+    Revision offset index of a dump file.
+
+    For each revision the index stores the offset of the revision header,
+    the offset of the revision properties and the count of nodes. The
+    index is saved next to the dump file (see index_file_name()) together
+    with size and mtime of the dump so a stale index can be detected.
+    """
+
+    def __init__( self ):
+        """
+        Initialize.
+        """
+
+        # revision numbers
+        self.__revnrs = array( "l" )
+        # offsets of the revision headers (doubles are exact up to 2**53
+        # while a C long may have only 32 bits)
+        self.__offsets = array( "d" )
+        # offsets of the revision properties
+        self.__prop_offsets = array( "d" )
+        # node counts
+        self.__node_counts = array( "l" )
+        # True if the revision numbers have no gaps
+        self.__contiguous = True
+
+    def add_rev( self, revnr, offset, propoffset, nodecount ):
+        """
+        Adds a revision to the index.
+
+        Revisions have to be added in ascending order.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @type offset: integer
+        @param offset: Offset of the revision header.
+        @type propoffset: integer
+        @param propoffset: Offset of the revision properties.
+        @type nodecount: integer
+        @param nodecount: Count of nodes.
+        """
+
+        n = len( self.__revnrs )
+        if n > 0:
+            if revnr <= self.__revnrs[-1]:
+                raise SvnDumpException, "revision %d after r%d in index" % \
+                        ( revnr, self.__revnrs[-1] )
+            if revnr != self.__revnrs[-1] + 1:
+                self.__contiguous = False
+        self.__revnrs.append( revnr )
+        self.__offsets.append( offset )
+        self.__prop_offsets.append( propoffset )
+        self.__node_counts.append( nodecount )
+
+    def get_rev_count( self ):
+        """
+        Returns the count of revisions in the index.
+
+        @rtype: integer
+        @return: Count of revisions.
+        """
+        return len( self.__revnrs )
+
+    def get_rev_index( self, revnr ):
+        """
+        Returns the index of the first revision >= revnr.
+
+        @type revnr: integer
+        @param revnr: Revision number.
+        @rtype: integer
+        @return: An index or -1 if there is no such revision.
+        """
+
+        n = len( self.__revnrs )
+        if n == 0:
+            return -1
+        if self.__contiguous:
+            i = revnr - self.__revnrs[0]
+            if i < 0:
+                i = 0
+        else:
+            i = bisect_left( self.__revnrs, revnr )
+        if i >= n:
+            return -1
+        return i
+
+    def get_rev_nr( self, index ):
+        """
+        Returns the revision number at the given index.
+
+        @type index: integer
+        @param index: Index of the revision.
+        @rtype: integer
+        @return: Revision number.
+        """
+        return self.__revnrs[index]
+
+    def get_rev_offset( self, index ):
+        """
+        Returns the offset of the revision header at the given index.
+
+        @type index: integer
+        @param index: Index of the revision.
+        @rtype: integer
+        @return: Offset of the revision.
+        """
+        return int( self.__offsets[index] )
+
+    def get_rev_prop_offset( self, index ):
+        """
+        Returns the offset of the revision properties at the given index.
+
+        @type index: integer
+        @param index: Index of the revision.
+        @rtype: integer
+        @return: Offset of the revision properties.
+        """
+        return int( self.__prop_offsets[index] )
+
+    def get_node_count( self, index ):
+        """
+        Returns the node count of the revision at the given index.
+
+        @type index: integer
+        @param index: Index of the revision.
+        @rtype: integer
+        @return: Count of nodes.
+        """
+        return self.__node_counts[index]
+
+    def save( self, dumpfilename ):
+        """
+        Saves the index of the given dump file.
+
+        @type dumpfilename: string
+        @param dumpfilename: Name of the dump file.
+        """
+
+        size, mtime = dump_file_stamp( dumpfilename )
+        lines = [ INDEX_MAGIC + "\n",
+                  "size %d\n" % size,
+                  "mtime %d\n" % mtime,
+                  "revs %d\n" % len( self.__revnrs ) ]
+        for i in xrange( len( self.__revnrs ) ):
+            lines.append( "%d %d %d %d\n" % ( self.__revnrs[i],
+                    int( self.__offsets[i] ), int( self.__prop_offsets[i] ),
+                    self.__node_counts[i] ) )
+        # write a temp file first so readers never see a partial index
+        idxname = index_file_name( dumpfilename )
+        tmpname = idxname + ".tmp"
+        idxfile = open( tmpname, "wb" )
+        idxfile.writelines( lines )
+        idxfile.close()
+        if os.path.exists( idxname ):
+            os.remove( idxname )
+        os.rename( tmpname, idxname )
+
+def load_dump_index( dumpfilename ):
+    """
+    Loads the index of the given dump file.
+
+    An index which does not exist, is damaged or does not match size
+    and mtime of the dump file is ignored.
+
+    @type dumpfilename: string
+    @param dumpfilename: Name of the dump file.
+    @rtype: SvnDumpIndex
+    @return: The index or None.
+    """
+
+    idxname = index_file_name( dumpfilename )
+    if not os.path.isfile( idxname ):
+        return None
+    idxfile = open( idxname, "rb" )
+    try:
+        try:
+            if idxfile.readline().rstrip( "\n" ) != INDEX_MAGIC:
+                return None
+            header = {}
+            for name in ( "size", "mtime", "revs" ):
+                words = idxfile.readline().split()
+                if len( words ) != 2 or words[0] != name:
+                    return None
+                header[name] = int( words[1] )
+            if ( header["size"], header["mtime"] ) != \
+                    dump_file_stamp( dumpfilename ):
+                # stale index
+                return None
+            index = SvnDumpIndex()
+            for line in idxfile:
+                revnr, offset, propoffset, nodecount = line.split()
+                index.add_rev( int( revnr ), int( offset ),
+                               int( propoffset ), int( nodecount ) )
+            if index.get_rev_count() != header["revs"]:
+                return None
+            return index
+        except ( ValueError, SvnDumpException ):
+            return None
+    finally:
+        idxfile.close()
+
@@ -21,15 +21,19 @@
 #===============================================================================
 
 import sys
-import re
+from heapq import heappush, heappop, heapreplace
 from optparse import OptionParser
 
 from svndump import __version
 from file import SvnDumpFile
 from node import SvnDumpNode
+from rename import PathRenamer
 
 __doc__ = """Clases and functions for merging dump files."""
 
+# default count of input dump files kept open at the same time
+MAX_OPEN_FILES = 256
+
 class SvnDumpMerge:
     """
     A class for merging svn dump files.
@@ -56,18 +60,23 @@ class SvnDumpMerge:
         # variables used for input dump files
         # file names
         self.__in_files = []
-        # path renames [ [ ( from, to ), ... ], ... ]
-        self.__in_renames = []
-        # path regex substitutions [ [ ( search, replace ), ... ], ... ]
-        self.__in_regex_subs = []
-        # mkdir excludes [ {}, ... ]
-        self.__in_excludes = []
+        # path renames, regex substitutions and mkdir excludes
+        # [ PathRenamer, ... ]
+        self.__in_renamers = []
         # revision number mappings [ {}, ... ]
         self.__in_rev_nr_maps = []
-        # dump files (class SvnDumpFile)
+        # dump files (class SvnDumpFile), None if closed
         self.__in_dumps = []
-        # revision dates of the dumps
-        self.__in_rev_dates = []
+        # offsets of the current revisions for reopening the dump files
+        self.__in_offsets = []
+        # queue keys of the current revisions
+        self.__in_keys = []
+        # indexes of the open dump files which can be reopened { index: None }
+        self.__open_dumps = {}
+        # maximal count of open dump files in the pool
+        self.__max_open_files = MAX_OPEN_FILES
+        # heap of the pending revisions [ ( date, index, revnr ), ... ]
+        self.__queue = []
 
 
     def set_output_file( self, filename, startRev=0 ):
@@ -95,9 +104,7 @@ class SvnDumpMerge:
 
         index = len( self.__in_files )
         self.__in_files = self.__in_files + [ filename ]
-        self.__in_renames = self.__in_renames + [ [] ]
-        self.__in_regex_subs = self.__in_regex_subs + [ [] ]
-        self.__in_excludes = self.__in_excludes + [ {} ]
+        self.__in_renamers = self.__in_renamers + [ PathRenamer() ]
         self.__in_rev_nr_maps = self.__in_rev_nr_maps + [ {} ]
         return index
 
@@ -113,19 +120,7 @@ class SvnDumpMerge:
         @param prefixTo: To-path prefix (directory).
         """
 
-        # make sure that prefixFrom starts and ends with a /
-        if prefixFrom[0:1] == "/":
-            prefixFrom = prefixFrom[1:]
-        if prefixFrom[len(prefixFrom)-1:] != "/":
-            prefixFrom = prefixFrom + "/"
-        # make sure that prefixTo starts and ends with a /
-        if prefixTo[0:1] == "/":
-            prefixTo = prefixTo[1:]
-        if prefixTo[len(prefixTo)-1:] != "/":
-            prefixTo = prefixTo + "/"
-        # add the rename
-        self.__in_renames[index] = self.__in_renames[index] + \
-                                [ (prefixFrom, prefixTo ) ]
+        self.__in_renamers[index].add_rename( prefixFrom, prefixTo )
 
     def add_regex_sub( self, index, reSearch, reReplace ):
         """
@@ -139,11 +134,7 @@ class SvnDumpMerge:
         @param reReplace: Replace regular expression.
         """
 
-        # compile regex object
-        reSearch = re.compile(reSearch)
-        # add the rename
-        self.__in_regex_subs[index] = self.__in_regex_subs[index] + \
-                                [ (reSearch, reReplace ) ]
+        self.__in_renamers[index].add_regex_sub( reSearch, reReplace )
 
     def add_mkdir_exclude( self, index, dirName ):
         """
@@ -155,8 +146,21 @@ class SvnDumpMerge:
         @param dirName: Name of the directory.
         """
 
-        # add the mkdir exclude
-        self.__in_excludes[index][dirName] = None
+        self.__in_renamers[index].add_exclude( dirName )
+
+    def set_max_open_files( self, count ):
+        """
+        Sets the count of input dump files kept open at the same time.
+
+        If more dump files are needed the one whose revision is merged last
+        is closed and reopened when its revision is merged. Streams and
+        dumps with deltas can't be reopened and are always kept open.
+
+        @type count: integer
+        @param count: Maximal count of open input files (at least 1).
+        """
+
+        self.__max_open_files = max( count, 1 )
 
     def add_directory( self, dirName ):
         """
@@ -192,83 +196,159 @@ class SvnDumpMerge:
             print "merge: no output file specified"
             return
 
-        # open input dump files
-        for inFile in self.__in_files:
-            inDump = SvnDumpFile()
-            inDump.open( inFile )
-            inDump.read_next_rev();
-            self.__in_dumps = self.__in_dumps + [ inDump ]
+        # open input dump files and read their first revision
+        inCount = len( self.__in_files )
+        self.__in_dumps = [ None ] * inCount
+        self.__in_offsets = [ -1 ] * inCount
+        self.__in_keys = [ None ] * inCount
+        hasRevs = False
+        uuid = None
+        for index in range( inCount ):
+            inDump = self.__open_input( index )
+            if not self.__read_next_rev( index ):
+                self.__close_input( index )
+                continue
+            if not hasRevs:
+                hasRevs = True
+                uuid = inDump.get_uuid()
             if inDump.get_rev_date_str() < self.__out_r0_date:
                 self.__out_r0_date = inDump.get_rev_date_str()
-
-        # remove empty dumps
-        dumpCount = self.__remove_empty_dumps()
-        if dumpCount == 0:
+            # skip revision 0
+            if inDump.get_rev_nr() == 0:
+                # +++ what about r0 revprops?
+                if not self.__read_next_rev( index ):
+                    self.__close_input( index )
+                    continue
+            key = ( inDump.get_rev_date(), index, inDump.get_rev_nr() )
+            self.__in_keys[index] = key
+            heappush( self.__queue, key )
+
+        # all dumps empty?
+        if not hasRevs:
             return
 
         # open output file
         self.outDump = SvnDumpFile()
         if self.outStartRev == 0:
-            self.outDump.create_with_rev_0( self.__out_file,
-                self.__in_dumps[0].get_uuid(), self.__out_r0_date )
+            self.outDump.create_with_rev_0( self.__out_file, uuid,
+                                            self.__out_r0_date )
         else:
-            self.outDump.create_with_rev_n( self.__out_file,
-                self.__in_dumps[0].get_uuid(), self.outStartRev )
-
-        # skip revision 0 of all dumps
-        for inDump in self.__in_dumps:
-            if inDump.get_rev_nr() == 0:
-                # +++ what about r0 revprops?
-                inDump.read_next_rev()
+            self.outDump.create_with_rev_n( self.__out_file, uuid,
+                                            self.outStartRev )
 
-        # remove empty dumps
-        dumpCount = self.__remove_empty_dumps()
-        if dumpCount == 0:
+        # all dumps empty?
+        if len( self.__queue ) == 0:
             self.outDump.close()
             return
 
-        # get revision dates
-        oldest = None
-        oldestStr = ""
-        for index in range(len(self.__in_dumps)):
-            revDat = self.__in_dumps[index].get_rev_date()
-            self.__in_rev_dates.append( revDat )
-            if oldest == None or revDat < oldest:
-                oldest = revDat
-                oldestStr = self.__in_dumps[index].get_rev_date_str()
-
         # add additional directories
         if len(self.__out_dirs) > 0:
+            inDump = self.__get_input( self.__queue[0][1] )
             self.outDump.add_rev( { "svn:log" : self.__out_message,
                                     "svn:author" : self.__out_author,
-                                    "svn:date" : oldestStr } )
+                                    "svn:date" : inDump.get_rev_date_str() } )
             for dirName in self.__out_dirs:
                 node = SvnDumpNode( dirName, "add", "dir" )
                 self.outDump.add_node( node )
 
-        # loop over all revisions
-        while dumpCount > 0:
-            # find index of the oldest revision
-            oldestIndex = 0
-            for index in range( 1, dumpCount ):
-                if self.__in_rev_dates[index] < self.__in_rev_dates[oldestIndex]:
-                    oldestIndex = index
+        # loop over all revisions, oldest first
+        queue = self.__queue
+        while len( queue ) > 0:
+            oldestIndex = queue[0][1]
+            srcDump = self.__get_input( oldestIndex )
             # copy revision
             self.__copy_revision( oldestIndex )
             print "Revision: %-8d from r%-8d %s" % ( self.outDump.get_rev_nr(),
-                self.__in_dumps[oldestIndex].get_rev_nr(),
-                self.__in_files[oldestIndex] )
+                srcDump.get_rev_nr(), self.__in_files[oldestIndex] )
             # read next revision
-            srcDump = self.__in_dumps[oldestIndex]
-            if srcDump.read_next_rev():
-                self.__in_rev_dates[oldestIndex] = srcDump.get_rev_date()
+            if self.__read_next_rev( oldestIndex ):
+                key = ( srcDump.get_rev_date(), oldestIndex,
+                        srcDump.get_rev_nr() )
+                self.__in_keys[oldestIndex] = key
+                heapreplace( queue, key )
             else:
-                dumpCount = self.__remove_empty_dumps()
+                heappop( queue )
+                self.__close_input( oldestIndex )
 
         # close output
         print "created %d revisions" % self.outDump.get_rev_nr()
         self.outDump.close()
-            
+
+    def __open_input( self, dumpIndex ):
+        """
+        Opens an input dump file.
+
+        Dump files which can be positioned are added to the pool of open
+        files. If it is full the dump file whose revision is merged last
+        is closed, it's known from the queue. Streams and dumps with deltas
+        stay open until EOF.
+
+        @type dumpIndex: integer
+        @param dumpIndex: Index of the input dump file.
+        @rtype: SvnDumpFile
+        @return: The dump file.
+        """
+
+        if len( self.__open_dumps ) >= self.__max_open_files:
+            keys = self.__in_keys
+            latest = max( self.__open_dumps.keys(),
+                          key=lambda index: keys[index] )
+            del self.__open_dumps[latest]
+            self.__in_dumps[latest].close()
+            self.__in_dumps[latest] = None
+        inDump = SvnDumpFile()
+        inDump.open( self.__in_files[dumpIndex] )
+        self.__in_dumps[dumpIndex] = inDump
+        if not inDump.is_stream() and inDump.get_format_version() == 2:
+            self.__open_dumps[dumpIndex] = None
+        return inDump
+
+    def __get_input( self, dumpIndex ):
+        """
+        Returns an input dump file positioned at its current revision,
+        reopening it if it has been closed by the pool.
+
+        @type dumpIndex: integer
+        @param dumpIndex: Index of the input dump file.
+        @rtype: SvnDumpFile
+        @return: The dump file.
+        """
+
+        inDump = self.__in_dumps[dumpIndex]
+        if inDump != None:
+            return inDump
+        inDump = self.__open_input( dumpIndex )
+        inDump.set_next_rev_offset( self.__in_offsets[dumpIndex] )
+        inDump.read_next_rev()
+        return inDump
+
+    def __read_next_rev( self, dumpIndex ):
+        """
+        Reads the next revision of an open input dump file and remembers
+        its offset for reopening the file.
+
+        @type dumpIndex: integer
+        @param dumpIndex: Index of the input dump file.
+        @rtype: bool
+        @return: False if EOF occured.
+        """
+
+        inDump = self.__in_dumps[dumpIndex]
+        self.__in_offsets[dumpIndex] = inDump.get_next_rev_offset()
+        return inDump.read_next_rev()
+
+    def __close_input( self, dumpIndex ):
+        """
+        Closes an input dump file which reached EOF.
+
+        @type dumpIndex: integer
+        @param dumpIndex: Index of the input dump file.
+        """
+
+        if self.__open_dumps.has_key( dumpIndex ):
+            del self.__open_dumps[dumpIndex]
+        self.__in_dumps[dumpIndex].close()
+        self.__in_dumps[dumpIndex] = None
 
     def __copy_revision( self, dumpIndex ):
         """
@@ -310,7 +390,7 @@ class SvnDumpMerge:
         path = node.get_path()
         # mkdir exclude check
         if node.get_kind() == "dir" and node.get_action() == "add":
-            if path in self.__in_excludes[dumpIndex]:
+            if self.__in_renamers[dumpIndex].is_excluded( path ):
                 return None
         fromPath = ""
         fromRev = 0
@@ -318,13 +398,14 @@ class SvnDumpMerge:
             fromPath = node.get_copy_from_path()
             fromRev = node.get_copy_from_rev()
         change = 0
-        newPath = self.__rename_path( path, dumpIndex )
+        renamer = self.__in_renamers[dumpIndex]
+        newPath = renamer.rename( path )
         newFromPath = fromPath
         newFromRev = fromRev
         if path != newPath:
             change = 1
         if fromRev > 0:
-            newFromPath = self.__rename_path( fromPath, dumpIndex )
+            newFromPath = renamer.rename( fromPath )
             if fromPath != newFromPath:
                 change = 1
             newFromRev = self.__in_rev_nr_maps[dumpIndex][fromRev]
@@ -345,62 +426,6 @@ class SvnDumpMerge:
             newNode.set_text_node( node )
         return newNode
 
-    def __rename_path( self, path, dumpIndex ):
-        """
-        Applies the renames to the path and returns the new path.
-
-        @type path: string
-        @param path: A path.
-        @type renames: list( ( string, string ) )
-        @param renames: List of rename tuples.
-        @rtype: string
-        @return Renamed path.
-        """
-
-        # ensure that path does not have a leading slash
-        if len(path) > 1 and path[0:1] == "/":
-            path = path[1:]
-        sPath = path + "/"
-        for sPfx, dPfx in self.__in_renames[dumpIndex]:
-            sLen = len( sPfx )
-            if sPfx == "/":
-                return dPfx + path
-            elif sPath[:sLen] == sPfx:
-                if len(path) <= len(sPfx):
-                    # it's the full path
-                    return dPfx[0:len(dPfx)-1]
-                else:
-                    # there's a suffix
-                    return dPfx + path[sLen:]
-        for reSearch, sReplace in self.__in_regex_subs[dumpIndex]:
-            path = reSearch.sub(sReplace, path, count=1)
-        return path
-
-    def __remove_empty_dumps( self ):
-        """
-        Removes dump files which reached EOF and returns the count of dumps.
-
-        @rtype: integer
-        @return: Count of remaining input dump files.
-        """
-
-        index = 0
-        while index < len( self.__in_dumps ):
-            inDump = self.__in_dumps[index]
-            if inDump.has_revision():
-                index = index + 1
-            else:
-                inDump.close()
-                eidx = index + 1
-                self.__in_files[index:eidx] = []
-                self.__in_renames[index:eidx] = []
-                self.__in_regex_subs[index:eidx] = []
-                self.__in_excludes[index:eidx] = []
-                self.__in_rev_nr_maps[index:eidx] = []
-                self.__in_dumps[index:eidx] = []
-                self.__in_rev_dates[index:eidx] = []
-        return index
-
 
 def __svndump_merge_opt_i( option, opt, value, parser, *args ):
     """
@@ -553,6 +578,11 @@ def svndump_merge_cmdline( appname, args ):
                        nargs=1, type="string",
                        dest="msg",
                        help="logmessage for the directory creating revision." )
+    parser.add_option( "--max-open-files",
+                       action="store", type="int",
+                       dest="maxopen", default=MAX_OPEN_FILES,
+                       help="keep at most MAXOPEN input files open "
+                            "(default %d)." % MAX_OPEN_FILES )
     parser.add_option( "--example",
                        action="callback", callback=__svndump_merge_example,
                        callback_args=cbargs,
@@ -561,6 +591,7 @@ def svndump_merge_cmdline( appname, args ):
                        help="show a little usage example." )
     (options, args) = parser.parse_args( args )
 
+    merge.set_max_open_files( options.maxopen )
     merge.merge()
     return 0
 
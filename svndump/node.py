@@ -20,18 +20,73 @@
 #
 #===============================================================================
 
+import atexit
 from os import stat, remove
 from stat import ST_SIZE
+import weakref
 
 from common import *
 
 __doc__ = """SvnDumpNode class."""
 
-class SvnDumpNode:
+# temp files are deleted when the last node using them is gone:
+# weak reference to a node -> name of the temp file
+_temp_file_refs = {}
+# name of the temp file -> count of nodes using it
+_temp_file_users = {}
+
+def _release_temp_file( ref ):
+    """
+    Releases a temp file of a node and deletes it if no node uses it anymore.
+
+    Used as callback of the weak references in _temp_file_refs.
+
+    @type ref: weakref
+    @param ref: Weak reference to the node.
+    """
+    filename = _temp_file_refs.pop( ref, None )
+    if filename == None:
+        return
+    users = _temp_file_users[filename] - 1
+    if users > 0:
+        _temp_file_users[filename] = users
+        return
+    del _temp_file_users[filename]
+    try:
+        remove( filename )
+    except OSError:
+        pass
+
+def _remove_temp_files():
+    """
+    Deletes the temp files of the nodes still alive at exit.
+    """
+    for filename in _temp_file_users.keys():
+        try:
+            remove( filename )
+        except OSError:
+            pass
+    _temp_file_users.clear()
+    _temp_file_refs.clear()
+
+atexit.register( _remove_temp_files )
+
+class SvnDumpNode( object ):
     """
     A node of a svn dump file.
+
+    Read_next_rev() creates one per node so the attributes are slots.
     """
 
+    __slots__ = ( "__path", "__action", "__kind", "__properties",
+                  "__raw_props", "__prop_obj", "__prop_buf", "__prop_offset",
+                  "__prop_len", "__prop_delta", "__text_delta",
+                  "__text_len", "__text_md5", "__text_sha1", "__checksums",
+                  "__copy_from_path",
+                  "__copy_from_rev", "__file_offset", "__file_name",
+                  "__temp_ref", "__file_obj", "__text_buf", "__raw_obj",
+                  "__raw_buf", "__raw_offset", "__raw_len", "__weakref__" )
+
     def __init__( self, path, action, kind ):
         """
         Initializes a new SvnDumpNode.
@@ -66,15 +121,35 @@ class SvnDumpNode:
         # path of this node relative to the repository root
         self.__path = path
         # action: 'add', 'change', 'delete' or 'replace'
-        self.__action = action
+        self.__action = intern( action )
         # kind: 'file', 'dir' or 'node' if not known
-        self.__kind = kind
+        self.__kind = intern( kind )
         # list of properties name=>value pairs
         self.__properties = None
+        # the properties as parsed while the node has a raw span, to detect
+        # modifications of the dict returned by get_properties()
+        self.__raw_props = None
+        # the property block not parsed yet: file object or buffer,
+        # offset and length (-1 if there is none)
+        self.__prop_obj = None
+        self.__prop_buf = None
+        self.__prop_offset = 0
+        self.__prop_len = -1
+        # ( resolver, key ) of properties which are a delta, see
+        # set_properties_delta()
+        self.__prop_delta = None
+        # [ resolver, key ] of a text which is a delta, see set_text_delta(),
+        # the resolver is None once the fulltext has been reconstructed
+        self.__text_delta = None
         # length of the text (file data)
         self.__text_len = -1
         # md5 hash of the text
         self.__text_md5 = ""
+        # sha1 hash of the text
+        self.__text_sha1 = ""
+        # copy source and delta base checksums, header name -> value,
+        # or None if there are none
+        self.__checksums = None
         # the from path if copied else ""
         self.__copy_from_path = ""
         # the from revision if copied else 0
@@ -83,18 +158,18 @@ class SvnDumpNode:
         self.__file_offset = -1
         # name of the (temp) file
         self.__file_name = ""
-        # delete the temp file
-        self.__file_delete = False
+        # weak reference registered in _temp_file_refs if it's a temp file
+        self.__temp_ref = None
         # the file object to read from
         self.__file_obj = None
-
-    def __del__( self ):
-        """
-        Delete method, cleanup temp file if needed.
-        """
-        if self.__file_delete and self.__file_name != "":
-            # delete temp file
-            remove(self.__file_name)
+        # the buffer (memory map) to read from
+        self.__text_buf = None
+        # the unmodified node as read from a dump file: file object or
+        # buffer, offset and length (-1 if there is none)
+        self.__raw_obj = None
+        self.__raw_buf = None
+        self.__raw_offset = 0
+        self.__raw_len = -1
 
     def get_path( self ):
         """
@@ -112,6 +187,7 @@ class SvnDumpNode:
         @type path: string
         @param path: New path of this node."""
         self.__path = path
+        self.__raw_len = -1
 
     def get_name( self ):
         """
@@ -151,6 +227,8 @@ class SvnDumpNode:
         @rtype: string
         @return: Value of the property.
         """
+        if self.__prop_len >= 0 or self.__prop_delta != None:
+            self.__parse_properties()
         if self.__properties != None and self.__properties.has_key( name ):
             return self.__properties[name]
         else:
@@ -163,7 +241,8 @@ class SvnDumpNode:
         @rtype: bool
         @return: True if this node has properties.
         """
-        return self.__properties != None
+        return self.__properties != None or self.__prop_len >= 0 or \
+               self.__prop_delta != None
 
     def get_properties( self ):
         """
@@ -172,8 +251,48 @@ class SvnDumpNode:
         @rtype: dict( string -> string )
         @return: The properties of this node.
         """
+        if self.__prop_len >= 0 or self.__prop_delta != None:
+            self.__parse_properties()
         return self.__properties
 
+    def get_raw_properties( self ):
+        """
+        Returns the property block if it has not been parsed yet.
+
+        @rtype: string
+        @return: The property block as read from the dump file or None.
+        """
+        if self.__prop_len < 0:
+            return None
+        if self.__prop_buf != None:
+            return self.__prop_buf[self.__prop_offset:
+                                   self.__prop_offset+self.__prop_len]
+        self.__prop_obj.seek( self.__prop_offset )
+        return self.__prop_obj.read( self.__prop_len )
+
+    def __parse_properties( self ):
+        """
+        Parses the property block set with set_properties_fileobj() or
+        set_properties_buffer(), or applies the delta set with
+        set_properties_delta().
+        """
+        if self.__prop_delta != None:
+            resolver, key = self.__prop_delta
+            self.__properties = resolver.get_properties( key )
+            self.__prop_delta = None
+            return
+        if self.__prop_buf != None:
+            self.__properties = parse_properties( self.__prop_buf,
+                    self.__prop_offset, self.__prop_len )
+        else:
+            self.__properties = parse_properties( self.get_raw_properties(),
+                    0, self.__prop_len )
+        if self.__raw_len >= 0:
+            self.__raw_props = self.__properties.copy()
+        self.__prop_obj = None
+        self.__prop_buf = None
+        self.__prop_len = -1
+
     def has_text( self ):
         """
         Returns true when this node has text.
@@ -190,8 +309,25 @@ class SvnDumpNode:
         @rtype: integer
         @return: Length of the text.
         """
+        if self.__text_delta != None:
+            self.__resolve_text()
         return self.__text_len
 
+    def get_text_offset( self ):
+        """
+        Returns the offset of the text in the file object or buffer given
+        to set_text_fileobj() or set_text_buffer().
+
+        @rtype: integer
+        @return: Offset of the text or -1 if it's not in such a file
+            object or buffer or if it has been reconstructed from a delta.
+        """
+        if self.__file_obj == None and self.__text_buf == None:
+            return -1
+        if self.__text_delta != None:
+            return -1
+        return self.__file_offset
+
     def has_md5( self ):
         """
         Returns true when this node has a MD5 sum.
@@ -210,6 +346,81 @@ class SvnDumpNode:
         """
         return self.__text_md5
 
+    def has_sha1( self ):
+        """
+        Returns true when this node has a SHA1 sum.
+
+        @rtype: bool
+        @return: True when this node has a SHA1 sum.
+        """
+        return len( self.__text_sha1 ) > 0
+
+    def get_text_sha1( self ):
+        """
+        Returns the SHA1 hash of the text.
+
+        @rtype: string
+        @return: SHA1 sum of the text or an empty string.
+        """
+        return self.__text_sha1
+
+    def get_checksums( self ):
+        """
+        Returns the copy source and delta base checksums.
+
+        The keys are the header names without colon, for example
+        'Text-copy-source-md5' or 'Text-delta-base-sha1'.
+
+        @rtype: dict( string -> string )
+        @return: Header name -> checksum.
+        """
+        if self.__checksums == None:
+            return {}
+        return self.__checksums.copy()
+
+    def get_checksum( self, name ):
+        """
+        Returns a copy source or delta base checksum.
+
+        @type name: string
+        @param name: Header name without colon, see get_checksums().
+        @rtype: string
+        @return: The checksum or an empty string.
+        """
+        if self.__checksums == None:
+            return ""
+        return self.__checksums.get( name, "" )
+
+    def set_checksum( self, name, value ):
+        """
+        Sets a copy source or delta base checksum.
+
+        @type name: string
+        @param name: Header name without colon, see get_checksums().
+        @type value: string
+        @param value: The checksum, an empty string deletes it.
+        """
+        if self.__checksums == None:
+            self.__checksums = {}
+        if len( value ) > 0:
+            self.__checksums[name] = value
+        elif self.__checksums.has_key( name ):
+            del self.__checksums[name]
+        self.__raw_len = -1
+
+    def __clear_checksums( self, prefix ):
+        """
+        Deletes the checksums whose name starts with the given prefix.
+
+        @type prefix: string
+        @param prefix: 'Text-copy-source-' or 'Text-delta-base-'.
+        """
+        if self.__checksums == None:
+            return
+        for name in self.__checksums.keys():
+            if name.startswith( prefix ):
+                del self.__checksums[name]
+
     def has_copy_from( self ):
         """
         Returns True when this node has copy-from-path and copy-from-rev.
@@ -255,6 +466,8 @@ class SvnDumpNode:
                     % self.__action
         self.__copy_from_path = path
         self.__copy_from_rev = revnr
+        self.__clear_checksums( "Text-copy-source-" )
+        self.__raw_len = -1
 
     def set_kind( self, kind ):
         """
@@ -269,7 +482,8 @@ class SvnDumpNode:
             raise SvnDumpException, "Cannot change node kind"
         if kind != "file" and kind != "dir":
             raise SvnDumpException, "Unknown kind '%s'" % kind
-        self.__kind = kind
+        self.__kind = intern( kind )
+        self.__raw_len = -1
 
     def set_property( self, name, value ):
         """
@@ -286,9 +500,12 @@ class SvnDumpNode:
         if self.__action == "delete":
             raise SvnDumpException, "Cannot set properties for action '%s'" \
                     % self.__action
+        if self.__prop_len >= 0 or self.__prop_delta != None:
+            self.__parse_properties()
         if self.__properties == None:
             self.__properties = {}
         self.__properties[name] = value
+        self.__raw_len = -1
 
     def del_property( self, name ):
         """
@@ -300,11 +517,14 @@ class SvnDumpNode:
         if self.__action == "delete":
             raise SvnDumpException, "Cannot delete properties for action '%s'" \
                     % self.__action
+        if self.__prop_len >= 0 or self.__prop_delta != None:
+            self.__parse_properties()
         if self.__properties != None:
             if self.__properties.has_key( name ):
                 del self.__properties[name]
                 if len( self.__properties ) == 0:
                     self.__properties = None
+                self.__raw_len = -1
 
     def set_properties( self, properties ):
         """
@@ -318,8 +538,69 @@ class SvnDumpNode:
             raise SvnDumpException, "Cannot set properties for action '%s'" \
                     % self.__action
         self.__properties = properties
+        self.__prop_obj = None
+        self.__prop_buf = None
+        self.__prop_len = -1
+        self.__prop_delta = None
+        self.__raw_len = -1
 
-    def set_text_file( self, filename, length=-1, md5="", delete=False ):
+    def set_properties_fileobj( self, fileobj, offset, length ):
+        """
+        Sets the properties for this node.
+
+        The property block is read from the file object and parsed when
+        the properties are accessed the first time.
+
+        @type fileobj: file object
+        @param fileobj: A file object opened for reading.
+        @type offset: integer
+        @param offset: Offset of the property block.
+        @type length: integer
+        @param length: Length of the property block.
+        """
+
+        self.set_properties( None )
+        self.__prop_obj = fileobj
+        self.__prop_offset = offset
+        self.__prop_len = length
+
+    def set_properties_buffer( self, buf, offset, length ):
+        """
+        Sets the properties for this node.
+
+        Same as set_properties_fileobj() but for memory mapped dump files.
+
+        @type buf: buffer or mmap
+        @param buf: An object supporting slicing and find().
+        @type offset: integer
+        @param offset: Offset of the property block.
+        @type length: integer
+        @param length: Length of the property block.
+        """
+
+        self.set_properties( None )
+        self.__prop_buf = buf
+        self.__prop_offset = offset
+        self.__prop_len = length
+
+    def set_properties_delta( self, resolver, key ):
+        """
+        Sets the properties for this node.
+
+        The properties are a delta read from a dump file with format
+        version 3, they are reconstructed when accessed the first time.
+
+        @type resolver: DeltaResolver
+        @param resolver: The resolver of the dump file.
+        @type key: integer
+        @param key: Key of the node returned by the resolver.
+        """
+
+        self.set_properties( None )
+        self.__prop_delta = ( resolver, key )
+
+    def set_text_file( self, filename, length=-1, md5="", delete=False,
+                       sha1="" ):
         """
         Sets the text for this node.
 
@@ -333,6 +614,8 @@ class SvnDumpNode:
         @param md5: MD5 sum of the text if known.
         @type delete: bool
         @param delete: When True delete the file.
+        @type sha1: string, optional
+        @param sha1: SHA1 sum of the text if known, 'calc' to calculate it.
         """
 
         if self.__action == "delete":
@@ -341,18 +624,27 @@ class SvnDumpNode:
         if self.__kind != "file":
             raise SvnDumpException, "Cannot set text for kind '%s'" \
                     % self.__kind
+        self.__release_text()
         self.__file_name = filename
         self.__file_offset = 0
-        # hmm, no destructors, how to delete that damn temp file ? +++
-        self.__file_delete = delete
+        if delete:
+            self.__use_temp_file()
         if length == -1:
             length = stat( filename )[ST_SIZE]
         self.__text_len = length
         self.__text_md5 = md5
+        self.__text_sha1 = sha1
+        self.__clear_checksums( "Text-delta-base-" )
+        self.__raw_len = -1
+        digests = []
         if not is_valid_md5_string( md5 ):
-            self.__calculate_md5()
+            digests.append( "md5" )
+        if sha1 == "calc":
+            digests.append( "sha1" )
+        if len( digests ) > 0:
+            self.__calculate_digests( digests )
 
-    def set_text_fileobj( self, fileobj, offset, length, md5 ):
+    def set_text_fileobj( self, fileobj, offset, length, md5, sha1="" ):
         """
         Sets the text for this node.
 
@@ -367,6 +659,8 @@ class SvnDumpNode:
         @param length: Length of the text.
         @type md5: string
         @param md5: MD5 sum of the text.
+        @type sha1: string, optional
+        @param sha1: SHA1 sum of the text or an empty string.
         """
 
         if self.__action == "delete":
@@ -375,13 +669,98 @@ class SvnDumpNode:
         if self.__kind != "file":
             raise SvnDumpException, "Cannot set text for kind '%s'" \
                     % self.__kind
+        self.__release_text()
         self.__file_obj = fileobj
         self.__file_offset = offset
         self.__text_len = length
         self.__text_md5 = md5
+        self.__text_sha1 = sha1
+        self.__clear_checksums( "Text-delta-base-" )
+        self.__raw_len = -1
         #if !is_valid_md5_string( md5 ) or length == -1:
         #    self.__calculate_md5()
 
+    def set_text_buffer( self, buf, offset, length, md5, sha1="" ):
+        """
+        Sets the text for this node.
+
+        The text is a slice of the specified buffer, usually the memory
+        map of a dump file. Reading the text does not seek any file object.
+
+        @type buf: buffer or mmap
+        @param buf: An object supporting slicing and the buffer interface.
+        @type offset: integer
+        @param offset: Offset of the text.
+        @type length: integer
+        @param length: Length of the text.
+        @type md5: string
+        @param md5: MD5 sum of the text.
+        @type sha1: string, optional
+        @param sha1: SHA1 sum of the text or an empty string.
+        """
+
+        if self.__action == "delete":
+            raise SvnDumpException, "Cannot set text for action '%s'" \
+                    % self.__action
+        if self.__kind != "file":
+            raise SvnDumpException, "Cannot set text for kind '%s'" \
+                    % self.__kind
+        self.__release_text()
+        self.__text_buf = buf
+        self.__file_offset = offset
+        self.__text_len = length
+        self.__text_md5 = md5
+        self.__text_sha1 = sha1
+        self.__clear_checksums( "Text-delta-base-" )
+        self.__raw_len = -1
+
+    def set_text_delta( self, resolver, key, md5, sha1="" ):
+        """
+        Sets the text for this node.
+
+        The text is a delta read from a dump file with format version 3,
+        the fulltext is reconstructed when the text is accessed the first
+        time.
+
+        @type resolver: DeltaResolver
+        @param resolver: The resolver of the dump file.
+        @type key: integer
+        @param key: Key of the node returned by the resolver.
+        @type md5: string
+        @param md5: MD5 sum of the fulltext.
+        @type sha1: string, optional
+        @param sha1: SHA1 sum of the fulltext or an empty string.
+        """
+
+        if self.__action == "delete":
+            raise SvnDumpException, "Cannot set text for action '%s'" \
+                    % self.__action
+        if self.__kind != "file":
+            raise SvnDumpException, "Cannot set text for kind '%s'" \
+                    % self.__kind
+        self.__release_text()
+        self.__text_delta = [ resolver, key ]
+        # the length is known after reconstructing the text
+        self.__text_len = 0
+        self.__text_md5 = md5
+        self.__text_sha1 = sha1
+        self.__raw_len = -1
+
+    def __resolve_text( self ):
+        """
+        Reconstructs the text set with set_text_delta() if not done yet.
+        """
+
+        resolver, key = self.__text_delta
+        if resolver == None:
+            return
+        text = resolver.get_text( key )
+        self.__text_buf = text
+        self.__file_offset = 0
+        self.__text_len = len( text )
+        self.__text_delta[0] = None
+        self.__clear_checksums( "Text-delta-base-" )
+
     def set_text_node( self, node ):
         """
         Sets the text for this node.
@@ -398,13 +777,116 @@ class SvnDumpNode:
         if self.__kind != "file":
             raise SvnDumpException, "Cannot set text for kind '%s'" \
                     % self.__kind
+        if node.__text_delta != None:
+            node.__resolve_text()
+        self.__release_text()
         self.__file_name = node.__file_name
-        # dunno how to delete temp file so no special action here +++
-        self.__file_delete = node.__file_delete
+        if node.__temp_ref != None:
+            # the temp file is deleted when both nodes are gone
+            self.__use_temp_file()
         self.__file_obj = node.__file_obj
+        self.__text_buf = node.__text_buf
+        self.__text_delta = node.__text_delta
         self.__file_offset = node.__file_offset
         self.__text_len = node.__text_len
         self.__text_md5 = node.__text_md5
+        self.__text_sha1 = node.__text_sha1
+        self.__clear_checksums( "Text-delta-base-" )
+        self.__raw_len = -1
+
+    def set_raw_fileobj( self, fileobj, offset, length ):
+        """
+        Sets the span of the dump file this node has been read from.
+
+        As long as the node is not modified SvnDumpFile.add_node() copies
+        the span as it is instead of writing headers, properties and text.
+        All set_* methods and modifications of the dict returned by
+        get_properties() discard the span.
+
+        @type fileobj: file object
+        @param fileobj: The dump file.
+        @type offset: integer
+        @param offset: Offset of the node header.
+        @type length: integer
+        @param length: Length of header, properties and text.
+        """
+
+        self.__raw_obj = fileobj
+        self.__raw_buf = None
+        self.__raw_offset = offset
+        self.__raw_len = length
+
+    def set_raw_buffer( self, buf, offset, length ):
+        """
+        Sets the span of the dump file this node has been read from.
+
+        Same as set_raw_fileobj() but for memory mapped dump files.
+
+        @type buf: buffer or mmap
+        @param buf: An object supporting the buffer interface.
+        @type offset: integer
+        @param offset: Offset of the node header.
+        @type length: integer
+        @param length: Length of header, properties and text.
+        """
+
+        self.__raw_obj = None
+        self.__raw_buf = buf
+        self.__raw_offset = offset
+        self.__raw_len = length
+
+    def has_raw( self ):
+        """
+        Returns True if this node is unmodified and can be copied raw.
+
+        @rtype: bool
+        @return: True if the node has a raw span.
+        """
+        if self.__raw_props != None and \
+                self.__properties != self.__raw_props:
+            # the dict returned by get_properties() has been modified
+            self.__raw_len = -1
+            self.__raw_props = None
+        return self.__raw_len >= 0
+
+    def write_raw_to_file( self, outfile ):
+        """
+        Writes the raw span of this node to the given file object.
+
+        @type outfile: file object
+        @param outfile: A file object opened for writing.
+        """
+
+        if self.__raw_len == -1:
+            raise SvnDumpException, "Node %s has no raw data" % self.__path
+        if self.__raw_buf != None:
+            outfile.write( buffer( self.__raw_buf, self.__raw_offset,
+                                   self.__raw_len ) )
+            return
+        self.__raw_obj.seek( self.__raw_offset )
+        read_chunks( self.__raw_obj, self.__raw_len, outfile.write )
+
+    def __use_temp_file( self ):
+        """
+        Registers the text file of this node as temp file.
+        """
+        self.__temp_ref = weakref.ref( self, _release_temp_file )
+        _temp_file_refs[self.__temp_ref] = self.__file_name
+        _temp_file_users[self.__file_name] = \
+                _temp_file_users.get( self.__file_name, 0 ) + 1
+
+    def __release_text( self ):
+        """
+        Forgets the current text, deleting the temp file if it was the last
+        user of it.
+        """
+        if self.__temp_ref != None:
+            _release_temp_file( self.__temp_ref )
+            self.__temp_ref = None
+        self.__file_name = ""
+        self.__file_obj = None
+        self.__text_buf = None
+        self.__text_delta = None
 
     def write_text_to_file( self, outfile ):
         """
@@ -416,17 +898,17 @@ class SvnDumpNode:
 
         if self.__text_len == -1:
             raise SvnDumpException, "Node %s has no text" % self.__path
+        if self.__text_delta != None:
+            self.__resolve_text()
+        if self.__text_buf != None:
+            outfile.write( buffer( self.__text_buf, self.__file_offset,
+                                   self.__text_len ) )
+            return
         if len(self.__file_name) > 0:
             self.__file_obj = open( self.__file_name, "rb" )
         else:
             self.__file_obj.seek( self.__file_offset )
-        cnt = self.__text_len
-        while cnt > 0:
-            bcnt = cnt
-            if bcnt > 16384:
-                bcnt = 16384
-            outfile.write( self.__file_obj.read( bcnt ) )
-            cnt = cnt - bcnt
+        read_chunks( self.__file_obj, self.__text_len, outfile.write )
         if len(self.__file_name) > 0:
             self.__file_obj.close()
             self.__file_obj = None
@@ -451,10 +933,18 @@ class SvnDumpNode:
 
         if self.__text_len == -1:
             raise SvnDumpException, "node has no text"
+        if self.__text_delta != None:
+            self.__resolve_text()
 
         # create handle
         handle = {}
-        if len(self.__file_name) > 0:
+        if self.__text_buf != None:
+            handle["buffer"] = self.__text_buf
+            handle["close"] = False
+            handle["offset"] = self.__file_offset
+            handle["length"] = self.__text_len
+            handle["pos"] = 0
+        elif len(self.__file_name) > 0:
             handle["file_obj"] = open( self.__file_name, "rb" )
             handle["close"] = True
             handle["offset"] = 0
@@ -482,10 +972,11 @@ class SvnDumpNode:
         @param handle: A handle opened with text_open().
         """
 
-        handle["file_obj"].seek( handle["offset"] )
+        if not handle.has_key( "buffer" ):
+            handle["file_obj"].seek( handle["offset"] )
         handle["pos"] = 0
 
-    def text_read( self, handle, count=16384 ):
+    def text_read( self, handle, count=None ):
         """
         Read some text from a handle.
 
@@ -494,11 +985,15 @@ class SvnDumpNode:
         @type handle: handle
         @param handle: A handle opened with text_open().
         @type count: integer, optional
-        @param count: Count of bytes to read.
+        @param count: Count of bytes to read, default is the chunk size
+            set by set_read_chunk_size().
         @rtype: string
         @return: The data read.
         """
 
+        if count == None:
+            count = get_read_chunk_size()
+
         # end of text ?
         if handle["pos"] >= handle["length"]:
             return ""
@@ -507,7 +1002,11 @@ class SvnDumpNode:
         if (handle["pos"] + count) > handle["length"]:
             count = handle["length"] - handle["pos"]
         # read it
-        data = handle["file_obj"].read( count )
+        if handle.has_key( "buffer" ):
+            start = handle["offset"] + handle["pos"]
+            data = handle["buffer"][start:start+count]
+        else:
+            data = handle["file_obj"].read( count )
         handle["pos"] = handle["pos"] + count
         return data
 
@@ -524,21 +1023,37 @@ class SvnDumpNode:
         if handle["close"]:
             handle["file_obj"].close()
 
-    def __calculate_md5( self ):
+    def calculate_digests( self, names ):
         """
-        Calculates the md5 of the text of this node.
+        Calculates digests of the text of this node in one pass.
+
+        @type names: list( string )
+        @param names: Names of the digests: 'md5', 'sha1' or 'sha256'.
+        @rtype: dict( string -> string )
+        @return: Name -> digest as hex string.
         """
 
         handle = self.text_open()
-        md = sdt_md5()
-        data = self.text_read( handle )
-        n = 0
-        while len(data) > 0:
-            n = n + len(data)
-            md.update( data )
-            data = self.text_read( handle )
-        self.__text_md5 = md.hexdigest()
-        if self.__text_len == -1:
-            self.__text_len = n
+        md = MultiDigest( names )
+        if handle.has_key( "buffer" ):
+            md.update( buffer( handle["buffer"], handle["offset"],
+                               handle["length"] ) )
+        else:
+            read_chunks( handle["file_obj"], handle["length"], md.update )
         self.text_close( handle )
+        return md.hexdigests()
+
+    def __calculate_digests( self, names ):
+        """
+        Calculates the md5 and/or sha1 of the text of this node.
+
+        @type names: list( string )
+        @param names: 'md5' and/or 'sha1'.
+        """
+
+        digests = self.calculate_digests( names )
+        if "md5" in names:
+            self.__text_md5 = digests["md5"]
+        if "sha1" in names:
+            self.__text_sha1 = digests["sha1"]
 
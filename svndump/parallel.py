@@ -0,0 +1,181 @@
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+from os.path import getsize
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from common import *
+from file import SvnDumpFile, create_dump_index
+
+__doc__ = """Parsing revision ranges of a dump file in worker processes."""
+
+# count of revision ranges per worker, more ranges balance the load better
+RANGES_PER_JOB = 4
+
+def split_revisions( index, first, last, count, filesize ):
+    """
+    Splits the revisions of an index into ranges of about the same size.
+
+    @type index: SvnDumpIndex
+    @param index: The revision offset index.
+    @type first: integer
+    @param first: Index of the first revision.
+    @type last: integer
+    @param last: Index of the last revision.
+    @type count: integer
+    @param count: Wanted count of ranges.
+    @type filesize: integer
+    @param filesize: Size of the dump file.
+    @rtype: list( ( integer, integer ) )
+    @return: List of ( offset of the first revision, count of revisions ).
+    """
+
+    def end_offset( i ):
+        if i + 1 < index.get_rev_count():
+            return index.get_rev_offset( i + 1 )
+        return filesize
+
+    start = index.get_rev_offset( first )
+    size = end_offset( last ) - start
+    ranges = []
+    i = first
+    while i <= last:
+        # fill up to the next multiple of size/count
+        limit = start + size * ( len( ranges ) + 1 ) / count
+        j = i
+        while j < last and end_offset( j ) < limit:
+            j += 1
+        ranges.append( ( index.get_rev_offset( i ), j - i + 1 ) )
+        i = j + 1
+    return ranges
+
+def _map_range( task ):
+    """
+    Calls the function of a task for each revision of its range.
+
+    Runs in the worker processes.
+
+    @type task: tuple
+    @param task: ( dump file name, function, args, offset, count ).
+    @rtype: list( ( integer, object ) )
+    @return: Revision number and result for each revision.
+    """
+
+    filename, func, args, offset, count = task
+    dump = SvnDumpFile()
+    dump.set_write_index( False )
+    dump.open( filename )
+    results = []
+    try:
+        dump.set_next_rev_offset( offset )
+        while len( results ) < count and dump.read_next_rev():
+            results.append( ( dump.get_rev_nr(), func( dump, *args ) ) )
+    finally:
+        dump.close()
+    return results
+
+def map_revisions( filename, func, args=(), jobs=1, fromrev=0,
+                   torev=2000000000 ):
+    """
+    Calls a function for each revision of a dump file and returns the
+    results in revision order.
+
+    The function is called as func( dump, *args ) with the SvnDumpFile
+    positioned on the revision, it must not depend on other revisions.
+    With more than one job the revisions are split into ranges by the
+    revision offset index of the dump and the ranges are read by worker
+    processes, so func has to be a module level function and args and
+    the results have to be picklable.
+
+    If the dump has no valid index one is created with create_dump_index()
+    (but not saved). The revisions are read sequentially in this process if
+    there's only one job, the dump is a stream or has deltas, or the
+    multiprocessing module is not available.
+
+    @type filename: string
+    @param filename: Name of the dump file.
+    @type func: function( SvnDumpFile, ... ) -> object
+    @param func: The function to call.
+    @type args: tuple
+    @param args: Additional arguments for func.
+    @type jobs: integer
+    @param jobs: Count of worker processes.
+    @type fromrev: integer
+    @param fromrev: First revision.
+    @type torev: integer
+    @param torev: Last revision.
+    @rtype: iterator( ( integer, object ) )
+    @return: Revision number and result of each revision.
+    """
+
+    dump = SvnDumpFile()
+    dump.open( filename )
+    ranges = None
+    try:
+        if jobs > 1 and multiprocessing != None and not dump.is_stream() \
+                and dump.get_format_version() == 2:
+            index = dump.get_index()
+            if index == None:
+                # scanning the headers is much faster than reading
+                index = create_dump_index( filename )
+            if index.get_rev_count() > 0:
+                first = index.get_rev_index( fromrev )
+                last = index.get_rev_index( torev + 1 )
+                if last < 0:
+                    last = index.get_rev_count()
+                last -= 1
+                if first >= 0 and first <= last:
+                    ranges = split_revisions( index, first, last,
+                                              jobs * RANGES_PER_JOB,
+                                              getsize( filename ) )
+                else:
+                    ranges = []
+        if ranges == None:
+            if fromrev > 0:
+                hasrev = dump.seek_rev( fromrev )
+            else:
+                hasrev = dump.read_next_rev()
+            while hasrev and dump.get_rev_nr() <= torev:
+                yield dump.get_rev_nr(), func( dump, *args )
+                hasrev = dump.read_next_rev()
+            return
+    finally:
+        dump.close()
+
+    tasks = [ ( filename, func, args, offset, count )
+              for offset, count in ranges ]
+    pool = multiprocessing.Pool( jobs )
+    try:
+        for results in pool.imap( _map_range, tasks ):
+            for result in results:
+                yield result
+    except:
+        # error or the caller stopped iterating
+        pool.terminate()
+        pool.join()
+        raise
+    pool.close()
+    pool.join()
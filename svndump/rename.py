@@ -0,0 +1,276 @@
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+import re
+
+__doc__ = """Renaming paths by prefix renames and regex substitutions."""
+
+# count of renamed paths remembered by a PathRenamer
+RENAME_CACHE_SIZE = 100000
+
+# max count of regexes and of groups in a combined regex (python's limit
+# for groups is 100)
+_MAX_COMBINED = 64
+_MAX_GROUPS = 99
+
+# patterns referring to groups or with inline flags (which would apply to
+# all combined patterns) can't be combined
+_UNCOMBINABLE_RE = re.compile( r"\\[1-9]|\(\?P=|\(\?[iLmsux]+\)" )
+
+class PathRenamer:
+    """
+    Renames paths by a list of prefix renames and regex substitutions.
+
+    If a prefix rename matches the path it's renamed by the first such
+    rename added, else all regex substitutions are applied in the order
+    they were added.
+
+    The prefix renames are kept in a trie of path components, so finding
+    the matching renames takes one dict lookup per component of the path
+    no matter how many renames there are. Before the regex substitutions
+    are applied one by one, the path is searched with a few regexes
+    combining all of them, most paths usually match none. Renamed paths
+    are remembered, renaming the same path again is a dict lookup.
+    """
+
+    def __init__( self ):
+        """
+        Initialize.
+        """
+
+        # count of prefix renames added
+        self.__rename_count = 0
+        # rename of the root ( order, to-prefix ) or None
+        self.__root_rename = None
+        # trie of prefix renames, a node is
+        # [ { component: node }, ( order, to-prefix, from-length ) or None ]
+        self.__trie = [ {}, None ]
+        # regex substitutions [ ( search, replace ), ... ]
+        self.__regex_subs = []
+        # the regex substitutions in chunks with a combined search regex
+        # [ ( regex or None, [ ( search, replace ), ... ] ), ... ]
+        # or None if not compiled yet
+        self.__regex_chunks = None
+        # mkdir excludes { path: None }
+        self.__excludes = {}
+        # renamed paths { path: new path }
+        self.__cache = {}
+
+    def add_rename( self, prefixFrom, prefixTo ):
+        """
+        Adds a path prefix rename.
+
+        @type prefixFrom: string
+        @param prefixFrom: From-path prefix (directory).
+        @type prefixTo: string
+        @param prefixTo: To-path prefix (directory).
+        """
+
+        # make sure that prefixFrom doesn't start and does end with a /
+        if prefixFrom[0:1] == "/":
+            prefixFrom = prefixFrom[1:]
+        if prefixFrom[-1:] != "/":
+            prefixFrom = prefixFrom + "/"
+        # make sure that prefixTo doesn't start and does end with a /
+        if prefixTo[0:1] == "/":
+            prefixTo = prefixTo[1:]
+        if prefixTo[-1:] != "/":
+            prefixTo = prefixTo + "/"
+        # add the rename
+        order = self.__rename_count
+        self.__rename_count += 1
+        self.__cache = {}
+        if prefixFrom == "/":
+            if self.__root_rename == None:
+                self.__root_rename = ( order, prefixTo )
+            return
+        node = self.__trie
+        for name in prefixFrom[:-1].split( "/" ):
+            child = node[0].get( name )
+            if child == None:
+                child = [ {}, None ]
+                node[0][name] = child
+            node = child
+        if node[1] == None:
+            node[1] = ( order, prefixTo, len( prefixFrom ) )
+
+    def add_regex_sub( self, reSearch, reReplace ):
+        """
+        Adds a regex substitution.
+
+        @type reSearch: string
+        @param reSearch: Search regular expression.
+        @type reReplace: string
+        @param reReplace: Replace regular expression.
+        """
+
+        self.__regex_subs.append( ( re.compile( reSearch ), reReplace ) )
+        self.__regex_chunks = None
+        self.__cache = {}
+
+    def add_exclude( self, path ):
+        """
+        Adds a mkdir exclude.
+
+        @type path: string
+        @param path: Path of the directory.
+        """
+
+        self.__excludes[path] = None
+
+    def is_excluded( self, path ):
+        """
+        Returns True if the mkdir of a path is excluded.
+
+        @type path: string
+        @param path: Path of the directory.
+        @rtype: bool
+        @return: True if it is excluded.
+        """
+
+        return path in self.__excludes
+
+    def rename( self, path ):
+        """
+        Applies the renames to the path and returns the new path.
+
+        @type path: string
+        @param path: A path.
+        @rtype: string
+        @return: Renamed path.
+        """
+
+        newPath = self.__cache.get( path )
+        if newPath == None:
+            newPath = self.__rename( path )
+            if len( self.__cache ) >= RENAME_CACHE_SIZE:
+                self.__cache = {}
+            self.__cache[path] = newPath
+        return newPath
+
+    def __rename( self, path ):
+        """
+        Renames a path without looking at the cache.
+
+        @type path: string
+        @param path: A path.
+        @rtype: string
+        @return: Renamed path.
+        """
+
+        # ensure that path does not have a leading slash
+        if len(path) > 1 and path[0:1] == "/":
+            path = path[1:]
+        # find the first added rename matching the path
+        best = self.__root_rename
+        node = self.__trie
+        pos = 0
+        while True:
+            slash = path.find( "/", pos )
+            if slash < 0:
+                node = node[0].get( path[pos:] )
+            else:
+                node = node[0].get( path[pos:slash] )
+            if node == None:
+                break
+            rename = node[1]
+            if rename != None and ( best == None or rename[0] < best[0] ):
+                best = rename
+            if slash < 0:
+                break
+            pos = slash + 1
+        if best != None:
+            if len( best ) == 2:
+                # root
+                return best[1] + path
+            if len( path ) <= best[2]:
+                # it's the full path
+                return best[1][:-1]
+            # there's a suffix
+            return best[1] + path[best[2]:]
+        # regex substitutions
+        if self.__regex_chunks == None:
+            self.__regex_chunks = self.__compile_chunks()
+        for regex, subs in self.__regex_chunks:
+            if regex != None and regex.search( path ) == None:
+                # no substitution of the chunk changes the path
+                continue
+            for reSearch, sReplace in subs:
+                path = reSearch.sub(sReplace, path, count=1)
+        return path
+
+    def __compile_chunks( self ):
+        """
+        Splits the regex substitutions into chunks and combines the search
+        regexes of each chunk into one.
+
+        A path not matching the combined regex of a chunk is not changed by
+        its substitutions. Regexes with back references or inline flags are
+        not combined.
+
+        @rtype: list( ( regex, list( ( regex, string ) ) ) )
+        @return: The chunks.
+        """
+
+        chunks = []
+        subs = []
+        groups = 0
+        for sub in self.__regex_subs:
+            reSearch = sub[0]
+            if _UNCOMBINABLE_RE.search( reSearch.pattern ) != None or \
+                    reSearch.groups > _MAX_GROUPS:
+                chunks.extend( self.__combine( subs ) )
+                chunks.append( ( None, [ sub ] ) )
+                subs = []
+                groups = 0
+                continue
+            if len( subs ) >= _MAX_COMBINED or \
+                    groups + reSearch.groups > _MAX_GROUPS:
+                chunks.extend( self.__combine( subs ) )
+                subs = []
+                groups = 0
+            subs.append( sub )
+            groups += reSearch.groups
+        chunks.extend( self.__combine( subs ) )
+        return chunks
+
+    def __combine( self, subs ):
+        """
+        Combines the search regexes of some substitutions into one.
+
+        @type subs: list( ( regex, string ) )
+        @param subs: The substitutions.
+        @rtype: list( ( regex, list( ( regex, string ) ) ) )
+        @return: The chunk, no chunk for no substitutions or chunks of one
+            substitution each if the regexes can't be combined (for
+            example the same group name is used twice).
+        """
+
+        if len( subs ) == 0:
+            return []
+        if len( subs ) == 1:
+            return [ ( None, subs ) ]
+        patterns = [ "(?:%s)" % sub[0].pattern for sub in subs ]
+        try:
+            return [ ( re.compile( "|".join( patterns ) ), subs ) ]
+        except re.error:
+            return [ ( None, [ sub ] ) for sub in subs ]
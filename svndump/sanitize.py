@@ -121,8 +121,15 @@ class SanitizeDumpFile(object):
             origdatafile.close()
             os.remove(origname)
             # Set the new content.
-            node.set_text_file(newname, delete=True)
+            if node.has_sha1():
+                node.set_text_file(newname, delete=True, sha1="calc")
+            else:
+                node.set_text_file(newname, delete=True)
 
+        if self.__options.file_data_method != "none" and node.has_copy_from():
+            # the copy source has been sanitized too
+            node.set_checksum("Text-copy-source-md5", "")
+            node.set_checksum("Text-copy-source-sha1", "")
         if self.__options.filenames and node.get_path():
             node.set_path(self.sanitize_path(node.get_path()))
         if self.__options.filenames and node.has_copy_from():
@@ -21,11 +21,18 @@
 #===============================================================================
 
 import sys
+import threading
+from collections import deque
 from optparse import OptionParser
+from Queue import Queue
 
 from svndump import __version, copy_dump_file
-from common import create_svn_date_str
-from file import SvnDumpFileWithHistory, SvnDumpFile
+from common import create_svn_date_str, parse_svn_date_str, MultiDigest
+from common import sdt_md5, read_chunks
+from delta import ContentHistory, _MISSING
+from file import SvnDumpFileWithHistory, SvnDumpFile, create_dump_index
+from history import NodeHistory
+from parallel import map_revisions
 
 __doc__ = """Various tools."""
 
@@ -117,28 +124,161 @@ class SvnDumpExport:
         dump = SvnDumpFile()
         dump.open( dumpfilename )
 
-        while dump.read_next_rev():
-            revnr = dump.get_rev_nr()
-            if self.__exports.has_key( revnr ):
+        if dump.is_stream():
+            # a stream can't be read twice, export all files in one pass
+            dump.set_blob_cache( True )
+            self.__export_pass( dump, self.__exports )
+            dump.close()
+            return 0
+
+        # files not modified in their revision, { rev -> { path -> file } }
+        unmodified = {}
+        revnrs = self.__exports.keys()
+        revnrs.sort()
+        for revnr in revnrs:
+            if not dump.seek_rev( revnr ):
+                break
+            if dump.get_rev_nr() == revnr:
                 for path, filename in self.__exports[revnr].iteritems():
-                    print "r%-6d %s" % ( revnr, path )
-                    nodes = dump.get_nodes_by_path( path, "ACR" )
-                    saved = False
-                    for node in nodes:
-                        if node.has_text():
-                            outfile = open( filename, "wb" )
-                            node.write_text_to_file( outfile )
-                            outfile.close()
-                            saved = True
-                            print "  saved as %s" % filename
-                    if not saved:
-                        if len(nodes) == 0:
-                            print "  not found"
-                        else:
-                            print "  has no text"
+                    if not self.__export_node( dump, revnr, path, filename ):
+                        if not unmodified.has_key( revnr ):
+                            unmodified[revnr] = {}
+                        unmodified[revnr][path] = filename
         dump.close()
+        if len( unmodified ) > 0:
+            self.__export_unmodified( dumpfilename, unmodified )
         return 0
 
+    def __export_node( self, dump, revnr, path, filename ):
+        """
+        Exports a file modified in the current revision.
+
+        @type dump: SvnDumpFile
+        @param dump: The dump file positioned at the revision.
+        @type revnr: integer
+        @param revnr: The revision number.
+        @type path: string
+        @param path: Path of the file in the repository.
+        @type filename: string
+        @param filename: Name of the exported file.
+        @rtype: bool
+        @return: True if the file has been saved.
+        """
+
+        nodes = dump.get_nodes_by_path( path, "ACR" )
+        saved = False
+        for node in nodes:
+            if node.has_text():
+                if not saved:
+                    print "r%-6d %s" % ( revnr, path )
+                outfile = open( filename, "wb" )
+                node.write_text_to_file( outfile )
+                outfile.close()
+                saved = True
+                print "  saved as %s" % filename
+        return saved
+
+    def __export_unmodified( self, dumpfilename, exports ):
+        """
+        Exports files not modified in the revision they're exported from.
+
+        @type dumpfilename: string
+        @param dumpfilename: Name of the svn dump file.
+        @type exports: dict
+        @param exports: { rev -> { repos-path -> filename, ... }, ... }
+        """
+
+        dump = SvnDumpFile()
+        dump.set_blob_cache( True )
+        dump.open( dumpfilename )
+        self.__export_pass( dump, exports )
+        dump.close()
+
+    def __export_pass( self, dump, exports ):
+        """
+        Reads a dump from the start and exports files.
+
+        Files modified in their revision are saved from their node. For
+        the others the md5 sum of the text of each path is recorded in a
+        content history and the texts are taken from the blob cache of
+        the dump file.
+
+        @type dump: SvnDumpFile
+        @param dump: The dump file, opened with the blob cache enabled.
+        @type exports: dict
+        @param exports: { rev -> { repos-path -> filename, ... }, ... }
+        """
+
+        history = ContentHistory()
+        emptymd5 = sdt_md5().hexdigest()
+        lastrev = max( exports.keys() )
+        while dump.read_next_rev():
+            revnr = dump.get_rev_nr()
+            for node in dump.get_nodes_iter():
+                self.__record_node( history, revnr, node, emptymd5 )
+            if exports.has_key( revnr ):
+                for path, filename in exports[revnr].iteritems():
+                    if self.__export_node( dump, revnr, path, filename ):
+                        continue
+                    print "r%-6d %s" % ( revnr, path )
+                    md5, source = history.lookup( path, revnr )
+                    if md5 == None:
+                        print "  not found"
+                        continue
+                    if md5 == "":
+                        print "  has no text"
+                        continue
+                    text = None
+                    if md5 != _MISSING:
+                        text = dump.get_text_by_digest( md5 )
+                    if text == None and md5 == emptymd5:
+                        text = ""
+                    if text == None:
+                        print "  text not found"
+                        continue
+                    outfile = open( filename, "wb" )
+                    outfile.write( text )
+                    outfile.close()
+                    print "  saved as %s" % filename
+            if revnr >= lastrev:
+                break
+
+    def __record_node( self, history, revnr, node, emptymd5 ):
+        """
+        Records the md5 sum of the text of a node in the content history.
+
+        Directories are recorded with an empty md5 sum, texts whose
+        base is not known with _MISSING.
+
+        @type history: ContentHistory
+        @param history: The content history.
+        @type revnr: integer
+        @param revnr: Current revision number.
+        @type node: SvnDumpNode
+        @param node: The node.
+        @type emptymd5: string
+        @param emptymd5: The md5 sum of an empty text.
+        """
+
+        path = node.get_path()
+        action = node.get_action()
+        if action == "delete":
+            history.delete( revnr, path )
+            return
+        copyfrom = None
+        if node.has_copy_from():
+            copyfrom = ( node.get_copy_from_path(),
+                         node.get_copy_from_rev() )
+        md5, source = history.get_base( revnr, path, action, copyfrom )
+        if node.get_kind() == "dir":
+            md5 = ""
+        elif node.has_text():
+            md5 = node.get_text_md5()
+        elif md5 == None:
+            # new file without text
+            md5 = emptymd5
+        history.add( revnr, path, md5, source )
+
 def __svndump_export_opt_e( option, opt, value, parser, *args ):
     """
     Option parser callback for rename '-r from to'.
@@ -189,6 +329,128 @@ def svndump_export_cmdline( appname, args ):
 #-------------------------------------------------------------------------------
 # check
 
+class DigestPool:
+    """
+    Calculates md5 and sha1 sums of texts of a dump file in worker threads.
+
+    Each worker reads the texts with its own file handle, hashlib and
+    reading release the GIL so the workers run in parallel.
+    """
+
+    def __init__( self, filename, jobs ):
+        """
+        Initialize.
+
+        @type filename: string
+        @param filename: Name of the (uncompressed) dump file.
+        @type jobs: integer
+        @param jobs: Count of worker threads.
+        """
+
+        # texts to hash: ( offset, length, names, result ) or None to stop
+        self.__tasks = Queue()
+        # the worker threads
+        self.__threads = []
+        for i in range( jobs ):
+            thread = threading.Thread( target=self.__work,
+                                       args=( filename, ) )
+            thread.setDaemon( True )
+            thread.start()
+            self.__threads.append( thread )
+
+    def __work( self, filename ):
+        """
+        Hashes texts until None is taken from the queue.
+
+        @type filename: string
+        @param filename: Name of the dump file.
+        """
+
+        infile = open( filename, "rb" )
+        try:
+            while True:
+                task = self.__tasks.get()
+                if task == None:
+                    break
+                offset, length, names, result = task
+                try:
+                    md = MultiDigest( names )
+                    infile.seek( offset )
+                    read_chunks( infile, length, md.update )
+                    result[0] = md.hexdigests()
+                except Exception, e:
+                    result[1] = e
+                result[2].set()
+        finally:
+            infile.close()
+
+    def submit( self, offset, length, names ):
+        """
+        Queues a text for hashing.
+
+        @type offset: integer
+        @param offset: Offset of the text in the dump file.
+        @type length: integer
+        @param length: Length of the text.
+        @type names: list( string )
+        @param names: Names of the digests to calculate, see MultiDigest.
+        @rtype: list
+        @return: A handle for get_digests().
+        """
+
+        result = [ None, None, threading.Event() ]
+        self.__tasks.put( ( offset, length, names, result ) )
+        return result
+
+    def submit_node( self, node, names ):
+        """
+        Queues the text of a node for hashing.
+
+        Texts which are not in the dump file as they are (reconstructed
+        from deltas) are hashed right away.
+
+        @type node: SvnDumpNode
+        @param node: A node with text.
+        @type names: list( string )
+        @param names: Names of the digests to calculate, see MultiDigest.
+        @rtype: list
+        @return: A handle for get_digests().
+        """
+
+        if node.get_text_offset() < 0:
+            result = [ node.calculate_digests( names ), None,
+                       threading.Event() ]
+            result[2].set()
+            return result
+        return self.submit( node.get_text_offset(), node.get_text_length(),
+                            names )
+
+    def get_digests( self, handle ):
+        """
+        Waits for the digests of a text.
+
+        @type handle: list
+        @param handle: A handle returned by submit().
+        @rtype: dict( string -> string )
+        @return: Name -> digest as hex string.
+        """
+
+        handle[2].wait()
+        if handle[1] != None:
+            raise handle[1]
+        return handle[0]
+
+    def close( self ):
+        """
+        Stops the worker threads.
+        """
+
+        for thread in self.__threads:
+            self.__tasks.put( None )
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
 class SvnDumpCheck:
     """
     A class for checking svn dump files.
@@ -207,6 +469,10 @@ class SvnDumpCheck:
         self.__check_md5 = False
         # verbose output
         self.__verbose = False
+        # continue the last check and save the state
+        self.__resume = False
+        # count of threads calculating md5 sums
+        self.__jobs = 1
 
     def set_check_actions( self, docheck ):
         """
@@ -245,6 +511,29 @@ class SvnDumpCheck:
 
         self.__verbose = doverbose
 
+    def set_resume( self, doresume ):
+        """
+        Set the resume flag to the given value.
+
+        When set the check continues after the last revision checked by
+        the previous run and the state is saved when done.
+
+        @type doresume: bool
+        @param doresume: New value for the flag.
+        """
+
+        self.__resume = doresume
+
+    def set_jobs( self, jobs ):
+        """
+        Set the count of threads calculating md5 sums.
+
+        @type jobs: integer
+        @param jobs: Count of threads, 1 calculates them while reading.
+        """
+
+        self.__jobs = jobs
+
     def execute( self, dumpfilename ):
         """
         Check a dump file.
@@ -263,25 +552,97 @@ class SvnDumpCheck:
             dump.set_check_md5(True)
         dump.open( dumpfilename )
         rc = 0
-
-        while dump.read_next_rev():
-            self.__next_rev()
-            revnr = dump.get_rev_nr()
-            if self.__verbose:
-                self.__print_rev( revnr )
-            if self.__print_rev_errors( dump ):
-                rc = 1
-            for node in dump.get_nodes_iter():
-                self.__next_node()
-                if self.__verbose:
-                    self.__print_node( revnr, node )
-                    self.__print_action( node )
-                if self.__print_node_errors( dump, node ):
+        if self.__resume:
+            revnr = dump.resume_history()
+            if revnr >= 0:
+                print "Resuming after revision %d" % revnr
+
+        # md5 and sha1 sums are calculated by the pool while reading on, the
+        # revisions are printed when their sums are known
+        pool = None
+        if self.__check_md5 and self.__jobs > 1 and not dump.is_stream():
+            pool = DigestPool( dumpfilename, self.__jobs )
+            dump.set_check_md5( False )
+        pending = deque()
+        ntasks = 0
+        try:
+            while dump.read_next_rev():
+                errlist = dump.get_rev_errors()
+                if errlist is None:
+                    errlist = []
+                nodes = list( dump.get_nodes_iter() )
+                md5s = []
+                if pool != None:
+                    for node in nodes:
+                        if node.has_text():
+                            names = [ "md5" ]
+                            if node.has_sha1():
+                                names.append( "sha1" )
+                            md5s.append( ( node,
+                                    pool.submit_node( node, names ) ) )
+                pending.append( ( dump.get_rev_nr(), errlist, nodes, md5s ) )
+                ntasks += len( md5s )
+                while len( pending ) > 0 and \
+                        ( pool == None or ntasks > 64 * self.__jobs ):
+                    ntasks -= len( pending[0][3] )
+                    if self.__print_revision( pool, pending.popleft() ):
+                        rc = 1
+            while len( pending ) > 0:
+                if self.__print_revision( pool, pending.popleft() ):
                     rc = 1
+        finally:
+            if pool != None:
+                pool.close()
+        if self.__resume:
+            dump.save_history()
         dump.close()
         print [ "OK", "Not OK" ][ rc ]
         return rc
 
+    def __print_revision( self, pool, revision ):
+        """
+        Prints the errors of a revision.
+
+        @type pool: DigestPool
+        @param pool: The pool calculating the md5 and sha1 sums or None.
+        @type revision: tuple
+        @param revision: Revision number, error list, nodes and
+            ( node, digests handle ) tuples.
+        @rtype: bool
+        @return: True if there are errors.
+        """
+
+        revnr, errlist, nodes, md5s = revision
+        if len( md5s ) > 0:
+            # md5 errors come first, as when checked while reading
+            md5errs = []
+            for node, handle in md5s:
+                digests = pool.get_digests( handle )
+                if node.get_text_md5() != digests["md5"]:
+                    md5errs.append( [ SvnDumpFileWithHistory.ERR_NODE_MD5_FAIL,
+                            [ node.get_path(), digests["md5"],
+                              node.get_text_md5() ] ] )
+                if node.has_sha1() and \
+                        node.get_text_sha1() != digests["sha1"]:
+                    md5errs.append( [ SvnDumpFileWithHistory.ERR_NODE_SHA1_FAIL,
+                            [ node.get_path(), digests["sha1"],
+                              node.get_text_sha1() ] ] )
+            errlist = md5errs + errlist
+        rc = False
+        self.__next_rev()
+        if self.__verbose:
+            self.__print_rev( revnr )
+        if self.__print_rev_errors( revnr, errlist ):
+            rc = True
+        for node in nodes:
+            self.__next_node()
+            if self.__verbose:
+                self.__print_node( revnr, node )
+                self.__print_action( node )
+            if self.__print_node_errors( revnr, errlist, node ):
+                rc = True
+        return rc
+
     def __next_rev( self ):
         """
         Clears the rev_printed flag.
@@ -336,23 +697,21 @@ class SvnDumpCheck:
                         node.get_copy_from_path() )
             print actionmsg
 
-    def __print_rev_errors( self, dump ):
+    def __print_rev_errors( self, revnr, errlist ):
         """
         Prints all revision errors for the current dump revision
 
-        @type dump: SvnDumpFile
-        @param dump: Current dump file.
+        @type revnr: int
+        @param revnr: Current revision number.
+        @type errlist: list
+        @param errlist: Errors of the revision.
         """
 
         rc = 0
-        errlist = dump.get_rev_errors()
-        if errlist is None:
-            return rc
-        revnr = dump.get_rev_nr()
         for err in errlist:
-            if err[0] == SvnDumpFile.ERR_REV_DATE_OLDER:
+            if err[0] == SvnDumpFileWithHistory.ERR_REV_DATE_OLDER:
                 rc = 1
-                self.print_rev( revnr )
+                self.__print_rev( revnr )
                 revdate = parse_svn_date_str( err[1][0] )
                 prevdate = parse_svn_date_str( err[1][1] )
                 print "    rev date: %s  %10d.%06d" % (
@@ -361,36 +720,39 @@ class SvnDumpCheck:
                     err[1][1], prevdate[0], prevdate[1] )
         return rc
 
-    def __print_node_errors( self, dump, node ):
+    def __print_node_errors( self, revnr, errlist, node ):
         """
         Prints all node errors for the current dump node
 
-        @type dump: SvnDumpFile
-        @param dump: Current dump file.
+        @type revnr: int
+        @param revnr: Current revision number.
+        @type errlist: list
+        @param errlist: Errors of the revision.
+        @type node: SvnDumpNode
+        @param node: Current node.
         """
 
         rc = 0
-        errlist = dump.get_rev_errors()
-        if errlist is None:
-            return rc
-        revnr = dump.get_rev_nr()
         for err in errlist:
             if node.get_path() == err[1][0]:
                 rc = 1
                 self.__print_node( revnr, node )
-                if err[0] == SvnDumpFile.ERR_NODE_MD5_FAIL:
-                    print "      ERROR - md5 calc: %s" % err[1][0]
-                    print "        diff than md5 node: %s" % err[1][1]
-                if err[0] == SvnDumpFile.ERR_NODE_EXISTS:
+                if err[0] == SvnDumpFileWithHistory.ERR_NODE_MD5_FAIL:
+                    print "      ERROR - md5 calc: %s" % err[1][1]
+                    print "        diff than md5 node: %s" % err[1][2]
+                if err[0] == SvnDumpFileWithHistory.ERR_NODE_SHA1_FAIL:
+                    print "      ERROR - sha1 calc: %s" % err[1][1]
+                    print "        diff than sha1 node: %s" % err[1][2]
+                if err[0] == SvnDumpFileWithHistory.ERR_NODE_EXISTS:
                     print "      ERROR - Node already exists."
-                if err[0] == SvnDumpFile.ERR_NODE_NO_PARENT:
+                if err[0] == SvnDumpFileWithHistory.ERR_NODE_NO_PARENT:
                     print "      ERROR - Parent doesn't exist."
-                if err[0] == SvnDumpFile.ERR_NODE_PARENT_NOT_DIR:
+                if err[0] == SvnDumpFileWithHistory.ERR_NODE_PARENT_NOT_DIR:
                     print "      ERROR - Parent is not a directory."
-                if err[0] == SvnDumpFile.ERR_NODE_NO_COPY_SRC:
+                if err[0] == SvnDumpFileWithHistory.ERR_NODE_NO_COPY_SRC:
                     print "      ERROR - Copy-from path doesn't exist." \
                             "  r%d %s" % ( err[1][2], err[1][3] )
-                if err[0] == SvnDumpFile.ERR_NODE_GONE:
+                if err[0] == SvnDumpFileWithHistory.ERR_NODE_GONE:
                     print "      ERROR - Node doesn't exist."
         return rc
 
@@ -421,13 +783,20 @@ def svndump_check_cmdline( appname, args ):
                        help="check that svn:date increases" )
     parser.add_option( "-m", "--check-md5",
                        action="store_true", dest="check_md5", default=False,
-                       help="check md5 sums of the files" )
+                       help="check md5 and sha1 sums of the files" )
     parser.add_option( "-A", "--all-checks",
                        action="store_true", dest="check_all", default=False,
                        help="do all checks" )
     parser.add_option( "-v", "--verbose",
                        action="store_true", dest="verbose", default=False,
                        help="verbose output" )
+    parser.add_option( "-j", "--jobs",
+                       action="store", type="int", dest="jobs", default=1,
+                       help="calculate md5 and sha1 sums in JOBS threads" )
+    parser.add_option( "-r", "--resume",
+                       action="store_true", dest="resume", default=False,
+                       help="continue after the revision checked last "
+                            "and save the state" )
     (options, args) = parser.parse_args( args )
 
     checks = False
@@ -442,6 +811,12 @@ def svndump_check_cmdline( appname, args ):
         checks = True
     if options.verbose:
         check.set_verbose( True )
+    if options.resume:
+        check.set_resume( True )
+    if options.jobs < 1:
+        print "The count of jobs has to be at least 1."
+        return 1
+    check.set_jobs( options.jobs )
 
     if not checks:
         print "Please specify at least one check option."
@@ -464,10 +839,17 @@ class SvnDumpLs:
     def __init__( self, revNr ):
         """
         Initialize.
+
+        @type revNr: integer or list( integer )
+        @param revNr: Revision number(s) to list, -1 for HEAD.
         """
 
-        self.revNr = revNr
-        if revNr == -1:
+        if type( revNr ) == int:
+            revNr = [ revNr ]
+        self.revNrs = revNr
+        # read the dump up to this revision
+        self.revNr = max( revNr )
+        if -1 in revNr:
             self.revNr = 2000000000
 
     def execute( self, dumpfilename ):
@@ -478,76 +860,45 @@ class SvnDumpLs:
         @param dumpfilename: Name of the file to log.
         """
 
-        # pass 1: search copy-from revisions
         dump = SvnDumpFile()
         dump.open( dumpfilename )
-        copyfromrevs = {}
-        filedict = {}
+        # copied dirs share the subtree of the copy source
+        history = NodeHistory()
 
+        revnr = 0
         while dump.read_next_rev():
-            revnr = dump.get_rev_nr()
-            if revnr > self.revNr:
+            if dump.get_rev_nr() > self.revNr:
                 break
-            for node in dump.get_nodes_iter():
-                #action = actions[node.get_action()]
-                action = node.get_action()
-                path = node.get_path()
-                if path == "" or path[0] != "/":
-                    path = "/" + path
-                if action == "add" and node.has_copy_from():
-                    copyfromrevs[node.get_copy_from_rev()] = True
-        dump.close()
-
-        # pass 2: do the work
-        dump = SvnDumpFile()
-        dump.open( dumpfilename )
-        filedict = {}
-
-        prevrevnr = 0
-        while dump.read_next_rev():
             revnr = dump.get_rev_nr()
-            # loop over missing revisions
-            prevrevnr += 1
-            while prevrevnr < revnr:
-                if copyfromrevs.has_key(prevrevnr):
-                    copyfromrevs[prevrevnr] = filedict.keys()[:]
-                prevrevnr += 1
-            if revnr > self.revNr:
-                break
             for node in dump.get_nodes_iter():
                 action = node.get_action()
                 path = node.get_path()
-                if path == "" or path[0] != "/":
-                    path = "/" + path
-                if action == "add":
-                    filedict[path] = path
+                if action == "delete" or action == "replace":
+                    history.delete( revnr, path )
+                if action == "add" or action == "replace":
+                    kind = "D"
+                    if node.get_kind() == "file":
+                        kind = "F"
                     if node.has_copy_from():
-                        frompath = node.get_copy_from_path() + "/"
-                        if frompath[0] != "/":
-                            frompath = "/" + frompath
-                        fromlen = len(frompath)
-                        topath = path + "/"
-                        for path in copyfromrevs[node.get_copy_from_rev()]:
-                            if path.startswith( frompath ):
-                                newpath = topath + path[fromlen:]
-                                filedict[newpath] = newpath
-                elif action == "delete":
-                    del filedict[path]
-                    if path[-1] != "/":
-                        path = path + "/"
-                    for subpath in filedict.keys()[:]:
-                        if subpath.startswith( path ):
-                            del filedict[subpath]
-            if copyfromrevs.has_key(revnr):
-                copyfromrevs[revnr] = filedict.keys()[:]
+                        history.add( revnr, path, kind,
+                                     node.get_copy_from_rev(),
+                                     node.get_copy_from_path() )
+                    else:
+                        history.add( revnr, path, kind )
         dump.close()
 
-        filelist = []
-        for path in filedict:
-            filelist.append( path )
-        filelist.sort()
-        for path in filelist:
-            print path
+        # the history knows all revisions read, list them in one go
+        for listrev in self.revNrs:
+            if listrev == -1 or listrev > revnr:
+                listrev = revnr
+            if len( self.revNrs ) > 1:
+                print "Revision %d:" % listrev
+            filelist = []
+            for path in history.get_paths( listrev ):
+                filelist.append( "/" + path )
+            filelist.sort()
+            for path in filelist:
+                print path
 
         return 0
 
@@ -609,12 +960,23 @@ def svndump_ls_cmdline( appname, args ):
     usage = "usage: %s [options] dumpfiles..." % appname
     parser = OptionParser( usage=usage, version="%prog "+__version )
     parser.add_option( "-r", "--revision",
-                       action="store", type="int",
-                       dest="revnr", default=-1,
-                       help="revision number" )
+                       action="store", type="string",
+                       dest="revnr", default="HEAD",
+                       help="revision numbers separated by commas, "
+                            "HEAD for the last one" )
     (options, args) = parser.parse_args( args )
 
-    log = SvnDumpLs( options.revnr )
+    revnrs = []
+    for revnr in options.revnr.split( "," ):
+        revnr = revnr.strip()
+        if revnr.upper() == "HEAD":
+            revnrs.append( -1 )
+        elif revnr.isdigit():
+            revnrs.append( int( revnr ) )
+        else:
+            print "Invalid revision number '%s'." % revnr
+            return 1
+    log = SvnDumpLs( revnrs )
 
     if len(args) == 1:
         return log.execute( args[0] )
@@ -629,6 +991,48 @@ def svndump_ls_cmdline( appname, args ):
 #-------------------------------------------------------------------------------
 # log
 
+def _log_revision( dump, verbose ):
+    """
+    Returns the log of the current revision of a dump file.
+
+    Used with map_revisions() so it has to be a module level function.
+
+    @type dump: SvnDumpFile
+    @param dump: The dump file.
+    @type verbose: bool
+    @param verbose: List the changed paths.
+    @rtype: string
+    @return: The log output of the revision.
+    """
+
+    actions = { "add":"A", "change":"M", "delete":"D", "replace":"R" }
+    revnr = dump.get_rev_nr()
+    author = dump.get_rev_author()
+    date = dump.get_rev_date_str()
+    log = dump.get_rev_log()
+    linecnt = len( log.split( "\n" ) )
+    lines = "%d line" % linecnt
+    if linecnt > 1:
+        lines += "s"
+    out = [ "-" * 72,
+            "r%d | %s | %s | %s" % ( revnr, author, date, lines ) ]
+    if verbose:
+        out.append( "Changed paths:" )
+        for node in dump.get_nodes_iter():
+            action = actions[node.get_action()]
+            path = node.get_path()
+            if path == "" or path[0] != "/":
+                path = "/" + path
+            if node.has_copy_from():
+                fpath = node.get_copy_from_path()
+                frev = node.get_copy_from_rev()
+                if fpath == "" or fpath[0] != "/":
+                    fpath = "/" + fpath
+                path += " (from %s:%d)" % ( fpath, frev )
+            out.append( "   %s %s" % ( action, path ) )
+    out.append( "\n" + log.rstrip() + "\n" )
+    return "\n".join( out )
+
 class SvnDumpLog:
     """
     A class for checking svn dump files.
@@ -644,6 +1048,8 @@ class SvnDumpLog:
         # revision range
         self.__from_rev = -1
         self.__to_rev = 2000000000
+        # count of worker processes
+        self.__jobs = 1
 
     def set_verbose( self, verbose ):
         """
@@ -655,6 +1061,19 @@ class SvnDumpLog:
 
         self.__verbose = verbose
 
+    def set_jobs( self, jobs ):
+        """
+        Sets the count of worker processes reading the dump file.
+
+        Worker processes are only used for dump files with a revision
+        offset index, see map_revisions().
+
+        @type jobs: integer
+        @param jobs: Count of worker processes.
+        """
+
+        self.__jobs = jobs
+
     def set_revision( self, revision ):
         """
         Set the revision range to the given value.
@@ -700,40 +1119,13 @@ class SvnDumpLog:
         print "\n\n" + "=" * 72
         line = "-" * 72
         print "Dumpfile: " + dumpfilename
-        dump = SvnDumpFile()
-        dump.open( dumpfilename )
-        actions = { "add":"A", "change":"M", "delete":"D", "replace":"R" }
-
-        while dump.read_next_rev():
-            revnr = dump.get_rev_nr()
-            if revnr >= self.__from_rev and revnr <= self.__to_rev:
-                author = dump.get_rev_author()
-                date = dump.get_rev_date_str()
-                log = dump.get_rev_log()
-                linecnt = len( log.split( "\n" ) )
-                lines = "%d line" % linecnt
-                if linecnt > 1:
-                    lines += "s"
-                print line
-                print "r%d | %s | %s | %s" % ( revnr, author, date, lines )
-                if self.__verbose:
-                    print "Changed paths:"
-                    for node in dump.get_nodes_iter():
-                        action = actions[node.get_action()]
-                        path = node.get_path()
-                        if path == "" or path[0] != "/":
-                            path = "/" + path
-                        if node.has_copy_from():
-                            fpath = node.get_copy_from_path()
-                            frev = node.get_copy_from_rev()
-                            if fpath == "" or fpath[0] != "/":
-                                fpath = "/" + fpath
-                            path += " (from %s:%d)" % ( fpath, frev )
-                        print "   %s %s" % ( action, path )
-                print "\n" + log.rstrip() + "\n"
-
+        fromrev = max( 0, self.__from_rev )
+        for revnr, log in map_revisions( dumpfilename, _log_revision,
+                                         ( self.__verbose, ), self.__jobs,
+                                         fromrev, self.__to_rev ):
+            if revnr >= self.__from_rev:
+                print log
         print line
-        dump.close()
         return 0
 
 def svndump_log_cmdline( appname, args ):
@@ -762,9 +1154,15 @@ def svndump_log_cmdline( appname, args ):
     parser.add_option( "-v", "--verbose",
                        action="store_true", dest="verbose", default=False,
                        help="verbose output" )
+    parser.add_option( "-j", "--jobs",
+                       action="store", type="int",
+                       dest="jobs", default=1,
+                       help="read the dump in JOBS worker processes "
+                            "(uses the index)" )
     (options, args) = parser.parse_args( args )
 
     log.set_verbose( options.verbose )
+    log.set_jobs( options.jobs )
     if not log.set_revision( options.revision ):
         return 1
 
@@ -902,7 +1300,11 @@ def split_dumpfiles( inputfilename, outlist ):
         endrev = outlist[index][1]
         outfile = outlist[index][2]
         outdump = None
-        while indump.read_next_rev():
+        if startrev > 0:
+            hasrev = indump.seek_rev( startrev )
+        else:
+            hasrev = indump.read_next_rev()
+        while hasrev:
             revnr = indump.get_rev_nr()
             if outdump == None:
                 if revnr >= startrev:
@@ -932,6 +1334,7 @@ def split_dumpfiles( inputfilename, outlist ):
                     startrev = outlist[index][0]
                     endrev = outlist[index][1]
                     outfile = outlist[index][2]
+            hasrev = indump.read_next_rev()
         if outdump != None:
             outdump.close()
         indump.close()
@@ -973,3 +1376,53 @@ def svndump_split_cmdline( appname, args ):
 
     return split_dumpfiles( infile, outlist )
 
+
+#-------------------------------------------------------------------------------
+# index
+
+def index_dumpfile( filename ):
+    """
+    Creates the revision offset index of a dump file.
+
+    @type filename: string
+    @param filename: Name of the dump file.
+    @rtype: int
+    @return: 0 for success.
+    """
+
+    # only the headers are read, properties and texts are skipped
+    index = create_dump_index( filename )
+    index.save( filename )
+    print "%s: indexed %d revisions." % ( filename, index.get_rev_count() )
+    return 0
+
+def svndump_index_cmdline( appname, args ):
+    """
+    Parses the commandline and creates the indexes.
+
+    Usage:
+
+        >>> svndump_index_cmdline( sys.argv[0], sys.argv[1:] )
+
+    @type appname: string
+    @param appname: Name of the application (used in help text).
+    @type args: list( string )
+    @param args: Commandline arguments.
+    @rtype: integer
+    @return: Return code (0 = OK).
+    """
+
+    usage = "usage: %s dumpfiles..." % appname
+    parser = OptionParser( usage=usage, version="%prog "+__version )
+    (options, args) = parser.parse_args( args )
+
+    if len(args) == 0:
+        print "please specify at least one dump file."
+        return 1
+
+    rc = 0
+    for filename in args:
+        if index_dumpfile( filename ) != 0:
+            rc = 1
+    return rc
+
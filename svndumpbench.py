@@ -0,0 +1,838 @@
+#!/usr/bin/env python
+#===============================================================================
+#
+# Copyright (C) 2003 Martin Furter <mf@rola.ch>
+#
+# This file is part of SvnDumpTool
+#
+# SvnDumpTool is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2, or (at your option)
+# any later version.
+#
+# SvnDumpTool is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with SvnDumpTool; see the file COPYING.  If not, write to
+# the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#
+#===============================================================================
+
+#
+# Benchmarks for svndumptool.
+#
+# usage: svndumpbench.py [benchmarks [revisions]]
+#
+# benchmarks is a bitmask selecting the benchmarks to run (default all),
+# revisions the count of revisions of the generated dump (default 2000).
+#
+
+import sys
+from os import mkdir, listdir, remove, rmdir, urandom
+from os.path import isdir, isfile, abspath, getsize
+import gc
+import random
+import resource
+import shutil
+import time
+
+import svndump
+from svndump.common import sdt_md5, set_read_chunk_size, \
+        create_svn_date_str
+from svndump.node import SvnDumpNode
+from svndump.file import SvnDumpFile, set_default_mmap, \
+        set_default_write_buffer_size, scan_dump_file, create_dump_index
+from svndump.history import NodeHistory
+from svndump.merge import SvnDumpMerge
+from svndump.rename import PathRenamer
+from svndump.parallel import map_revisions
+from svndump.tools import svndump_check_cmdline
+
+def kill_dir( dir ):
+    """'rm -rf dir' in python ;-)"""
+    if isdir( dir ):
+        for d in listdir( dir ):
+            d = dir + "/" + d
+            if isdir( d ):
+                kill_dir( d )
+            else:
+                remove( d )
+        rmdir( dir )
+
+def create_text( rnd, size ):
+    """Create some test text of about size bytes."""
+
+    lines = []
+    n = 0
+    while n < size:
+        line = "line %d %s\n" % ( rnd.randint( 0, 1000000 ),
+                                  "x" * rnd.randint( 0, 60 ) )
+        lines.append( line )
+        n += len( line )
+    return "".join( lines )
+
+def create_bench_dump( filename, nrevs, tmpdir ):
+    """
+    Creates a dump file with nrevs revisions.
+
+    Each revision adds a few files and modifies a few existing ones,
+    every 50th revision creates a branch by copying trunk.
+    """
+
+    rnd = random.Random( 4711 )
+    dump = SvnDumpFile()
+    dump.create_with_rev_0( filename, "bench-uuid",
+                            "2009-01-01T00:00:00.000000Z" )
+    dirs = []
+    files = []
+    textfile = tmpdir + "/text"
+    for revnr in range( 1, nrevs + 1 ):
+        revprops = {}
+        revprops["svn:date"] = "2009-01-01T%02d:%02d:%02d.000000Z" % \
+                ( ( revnr / 3600 ) % 24, ( revnr / 60 ) % 60, revnr % 60 )
+        revprops["svn:author"] = "user%d" % ( revnr % 7 )
+        revprops["svn:log"] = "log message of revision %d\n" % revnr
+        dump.add_rev( revprops )
+        if revnr == 1:
+            for path in ( "trunk", "branches", "tags" ):
+                node = SvnDumpNode( path, "add", "dir" )
+                node.set_properties( {} )
+                dump.add_node( node )
+        nodes = []
+        if revnr % 50 == 0:
+            node = SvnDumpNode( "branches/b%d" % revnr, "add", "dir" )
+            node.set_copy_from( "trunk", revnr - 1 )
+            dump.add_node( node )
+        dirpath = "trunk/d%d" % ( revnr % 10 )
+        if not dirpath in dirs:
+            node = SvnDumpNode( dirpath, "add", "dir" )
+            node.set_properties( {} )
+            dump.add_node( node )
+            dirs.append( dirpath )
+        for i in range( 3 ):
+            nodes.append( ( "%s/f%d_%d.txt" % ( dirpath, revnr, i ), "add" ) )
+        for i in range( min( 3, len( files ) / 4 ) ):
+            nodes.append( ( files[rnd.randint( 0, len( files ) - 1 )],
+                            "change" ) )
+        for path, action in nodes:
+            node = SvnDumpNode( path, action, "file" )
+            if action == "add":
+                node.set_properties( { "svn:eol-style": "native" } )
+                files.append( path )
+            fileobj = open( textfile, "wb" )
+            fileobj.write( create_text( rnd, rnd.randint( 100, 8000 ) ) )
+            fileobj.close()
+            node.set_text_file( textfile )
+            dump.add_node( node )
+    dump.close()
+
+def create_big_rev_dump( filename, nnodes ):
+    """
+    Creates a dump file with one revision adding nnodes small files.
+
+    The file is written directly, SvnDumpFile would take too long.
+    """
+
+    text = "some text\n"
+    md = sdt_md5()
+    md.update( text )
+    textmd5 = md.hexdigest()
+    out = open( filename, "wb" )
+    out.write( "SVN-fs-dump-format-version: 2\n\nUUID: bench-uuid\n\n" )
+    props = "K 8\nsvn:date\nV 27\n2009-01-01T00:00:00.000000Z\nPROPS-END\n"
+    out.write( "Revision-number: 1\nProp-content-length: %d\n"
+               "Content-length: %d\n\n%s\n" % ( len( props ), len( props ),
+                                                 props ) )
+    out.write( "Node-path: vendor\nNode-kind: dir\nNode-action: add\n"
+               "Prop-content-length: 10\nContent-length: 10\n\n"
+               "PROPS-END\n\n\n" )
+    for i in xrange( nnodes ):
+        if i % 1000 == 0:
+            out.write( "Node-path: vendor/d%d\nNode-kind: dir\n"
+                       "Node-action: add\nProp-content-length: 10\n"
+                       "Content-length: 10\n\nPROPS-END\n\n\n" % ( i / 1000 ) )
+        out.write( "Node-path: vendor/d%d/f%d.c\nNode-kind: file\n"
+                   "Node-action: add\nProp-content-length: 10\n"
+                   "Text-content-length: %d\nText-content-md5: %s\n"
+                   "Content-length: %d\n\nPROPS-END\n%s\n\n" %
+                   ( i / 1000, i, len( text ), textmd5, len( text ) + 10,
+                     text ) )
+    out.close()
+
+def create_binary_dump( filename, nfiles, size ):
+    """
+    Creates a dump file with one revision per file, each adding a big
+    binary file of size bytes.
+
+    The file is written directly, SvnDumpFile would take too long.
+    """
+
+    block = urandom( 1024 * 1024 )
+    out = open( filename, "wb" )
+    out.write( "SVN-fs-dump-format-version: 2\n\nUUID: bench-uuid\n\n" )
+    props = "K 8\nsvn:date\nV 27\n2009-01-01T00:00:00.000000Z\nPROPS-END\n"
+    nodeprops = "K 13\nsvn:mime-type\nV 24\napplication/octet-stream\n" \
+                "PROPS-END\n"
+    for i in range( nfiles ):
+        prefix = "binary %d\n" % i
+        md = sdt_md5()
+        md.update( prefix )
+        n = size - len( prefix )
+        while n > 0:
+            md.update( block[:n] )
+            n -= len( block )
+        out.write( "Revision-number: %d\nProp-content-length: %d\n"
+                   "Content-length: %d\n\n%s\n" % ( i + 1, len( props ),
+                                                     len( props ), props ) )
+        out.write( "Node-path: bin%d.dat\nNode-kind: file\n"
+                   "Node-action: add\nProp-content-length: %d\n"
+                   "Text-content-length: %d\nText-content-md5: %s\n"
+                   "Content-length: %d\n\n%s" %
+                   ( i, len( nodeprops ), size, md.hexdigest(),
+                     len( nodeprops ) + size, nodeprops ) )
+        out.write( prefix )
+        n = size - len( prefix )
+        while n > 0:
+            out.write( block[:n] )
+            n -= len( block )
+        out.write( "\n\n" )
+    out.close()
+
+def create_project_dumps( dirname, ndumps, nrevs ):
+    """
+    Creates ndumps dump files dirname/projN.dmp with nrevs revisions each,
+    the revision dates of the dumps interleave and some of them are equal.
+
+    The files are written directly, SvnDumpFile would take too long.
+    """
+
+    text = "some text\n"
+    md = sdt_md5()
+    md.update( text )
+    textmd5 = md.hexdigest()
+    for i in range( ndumps ):
+        filename = "%s/proj%d.dmp" % ( dirname, i )
+        out = open( filename, "wb" )
+        out.write( "SVN-fs-dump-format-version: 2\n\nUUID: proj%d\n\n" % i )
+        for rev in range( 1, nrevs + 1 ):
+            date = create_svn_date_str( ( 1230768000 + rev * ndumps +
+                                          i * 7 % ndumps / 2, 0 ) )
+            props = "K 7\nsvn:log\nV %d\n%s\nK 8\nsvn:date\nV 27\n%s\n" \
+                    "PROPS-END\n" % ( len( filename ), filename, date )
+            out.write( "Revision-number: %d\nProp-content-length: %d\n"
+                       "Content-length: %d\n\n%s\n" % ( rev, len( props ),
+                                                         len( props ), props ) )
+            if rev == 1:
+                out.write( "Node-path: trunk\nNode-kind: dir\n"
+                           "Node-action: add\nProp-content-length: 10\n"
+                           "Content-length: 10\n\nPROPS-END\n\n\n" )
+            out.write( "Node-path: trunk/f%d.c\nNode-kind: file\n"
+                       "Node-action: add\nProp-content-length: 10\n"
+                       "Text-content-length: %d\nText-content-md5: %s\n"
+                       "Content-length: %d\n\nPROPS-END\n%s\n\n" %
+                       ( rev, len( text ), textmd5, len( text ) + 10, text ) )
+        out.close()
+
+def memory_usage():
+    """Returns the current (or if unknown the peak) memory usage in KB."""
+
+    try:
+        statm = open( "/proc/self/statm" ).read().split()
+        return int( statm[1] ) * resource.getpagesize() / 1024
+    except IOError:
+        return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+
+def bench_init( nrevs ):
+    """Initialize benchmarks."""
+
+    params = {}
+
+    # setup a few path variables
+    tempdir = abspath( "benchtmp" )
+    params["tempdir"] = tempdir
+
+    # create needed directories
+    if not isdir( tempdir ):
+        mkdir( tempdir )
+
+    # create the dump used by most benchmarks
+    dumpfile = "%s/bench-%d.dmp" % ( tempdir, nrevs )
+    if not isfile( dumpfile ):
+        print "creating %s" % dumpfile
+        create_bench_dump( dumpfile, nrevs, tempdir )
+    params["dumpfile"] = dumpfile
+
+    # add list for benchmark results
+    params["benchresult"] = []
+
+    return params
+
+def add_bench_result( params, funcname, descr, seconds, nbytes ):
+    """add the result of a benchmark to the list in params"""
+    params["benchresult"].append( ( funcname, descr, seconds, nbytes ) )
+
+def show_bench_results( params ):
+    """show benchmark results"""
+
+    print ""
+    print "=" * 80
+    print ""
+    print "Benchmark Results:"
+    for funcname, descr, seconds, nbytes in params["benchresult"]:
+        name = "%s: %s" % ( funcname, descr )
+        if nbytes > 0 and seconds > 0:
+            rate = "%8.2f MB/s" % ( nbytes / seconds / 1048576.0 )
+        else:
+            rate = ""
+        print "  %-50s %8.3f s %s" % ( name, seconds, rate )
+    print ""
+
+def bench_compress( params ):
+    """Benchmark 1: copy and check of raw and compressed dumps."""
+
+    tempdir = params["tempdir"]
+    dumpfile = params["dumpfile"]
+    nbytes = getsize( dumpfile )
+
+    for ext in ( "", ".gz", ".bz2", ".xz" ):
+        name = "raw" + ext
+        # write
+        outfile = "%s/compress.dmp%s" % ( tempdir, ext )
+        start = time.time()
+        svndump.copy_dump_file( dumpfile, outfile )
+        add_bench_result( params, "bench_compress", "copy raw -> " + name,
+                          time.time() - start, nbytes )
+        # read
+        copyfile = tempdir + "/compress-copy.dmp"
+        start = time.time()
+        svndump.copy_dump_file( outfile, copyfile )
+        add_bench_result( params, "bench_compress", "copy %s -> raw" % name,
+                          time.time() - start, nbytes )
+        start = time.time()
+        svndump_check_cmdline( "svndumpbench.py", [ "-A", outfile ] )
+        add_bench_result( params, "bench_compress", "check " + name,
+                          time.time() - start, nbytes )
+        remove( outfile )
+        remove( copyfile )
+    return 0
+
+class DirtyTransformer:
+    """Marks all nodes as modified so add_node() re-serializes them."""
+
+    def transform( self, dump ):
+        for node in dump.get_nodes_iter():
+            if node.get_action() != "delete":
+                node.set_properties( node.get_properties() )
+            else:
+                node.set_path( node.get_path() )
+
+def bench_copy( params ):
+    """Benchmark 2: copy with raw passthrough vs re-serialization."""
+
+    tempdir = params["tempdir"]
+    dumpfile = params["dumpfile"]
+    nbytes = getsize( dumpfile )
+    outfile = tempdir + "/copy.dmp"
+
+    start = time.time()
+    shutil.copyfile( dumpfile, outfile )
+    add_bench_result( params, "bench_copy", "shutil.copyfile",
+                      time.time() - start, nbytes )
+    for usemmap in ( False, True ):
+        set_default_mmap( usemmap )
+        name = [ "", " (mmap)" ][usemmap]
+        start = time.time()
+        svndump.copy_dump_file( dumpfile, outfile )
+        add_bench_result( params, "bench_copy", "raw passthrough" + name,
+                          time.time() - start, nbytes )
+        start = time.time()
+        svndump.copy_dump_file( dumpfile, outfile, DirtyTransformer() )
+        add_bench_result( params, "bench_copy", "re-serialize" + name,
+                          time.time() - start, nbytes )
+    set_default_mmap( False )
+    remove( outfile )
+    return 0
+
+def concat_prop_string( properties ):
+    """The old way of creating a property block, for comparison."""
+
+    propStr = ""
+    for key, val in properties.items():
+        propStr = propStr + ("K %d"%len(key)) + "\n" + key + "\n"
+        propStr = propStr + ("V %d"%len(val)) + "\n" + val + "\n"
+    propStr = propStr + "PROPS-END\n"
+    return propStr
+
+def bench_props( params ):
+    """Benchmark 4: writing and reading nodes with many and big properties."""
+
+    tempdir = params["tempdir"]
+    outfile = tempdir + "/props.dmp"
+    rnd = random.Random( 4711 )
+
+    # a node with many properties and one with a big svn:mergeinfo
+    manyprops = {}
+    for i in range( 5000 ):
+        manyprops["prop%d" % i] = "value %d" % rnd.randint( 0, 1000000 )
+    mergeinfo = []
+    for i in range( 150000 ):
+        mergeinfo.append( "/branches/b%d:%d-%d\n" % ( i, i, i + 100 ) )
+    bigprops = { "svn:mergeinfo": "".join( mergeinfo ) }
+
+    for name, props in ( ( "5000 props", manyprops ),
+                         ( "%dk mergeinfo" % ( len( bigprops["svn:mergeinfo"] )
+                                              / 1024 ), bigprops ) ):
+        nbytes = 20 * len( concat_prop_string( props ) )
+        start = time.time()
+        for i in range( 20 ):
+            concat_prop_string( props )
+        add_bench_result( params, "bench_props", name + " concat",
+                          time.time() - start, nbytes )
+        dump = SvnDumpFile()
+        dump.create_with_rev_n( outfile, "bench-uuid", 1 )
+        dump.add_rev( { "svn:log": "props" } )
+        start = time.time()
+        for i in range( 20 ):
+            node = SvnDumpNode( "dir%d" % i, "add", "dir" )
+            node.set_properties( props )
+            dump.add_node( node )
+        dump.close()
+        add_bench_result( params, "bench_props", name + " add_node",
+                          time.time() - start, nbytes )
+        # properties are parsed on first access only
+        dump = SvnDumpFile()
+        dump.open( outfile )
+        start = time.time()
+        dump.read_next_rev()
+        add_bench_result( params, "bench_props", name + " read_next_rev",
+                          time.time() - start, nbytes )
+        start = time.time()
+        for i in range( dump.get_node_count() ):
+            dump.get_node( i ).get_properties()
+        add_bench_result( params, "bench_props", name + " get_properties",
+                          time.time() - start, nbytes )
+        dump.close()
+    remove( outfile )
+    return 0
+
+def get_big_rev_dump( params ):
+    """Returns the name of the dump with a 500k node revision, creates it."""
+
+    nnodes = 500000
+    dumpfile = "%s/bigrev-%d.dmp" % ( params["tempdir"], nnodes )
+    if not isfile( dumpfile ):
+        print "creating %s" % dumpfile
+        create_big_rev_dump( dumpfile, nnodes )
+    return dumpfile
+
+def bench_big_rev( params ):
+    """Benchmark 8: memory and time for reading a 500k node revision."""
+
+    dumpfile = get_big_rev_dump( params )
+    nbytes = getsize( dumpfile )
+
+    gc.collect()
+    mem = memory_usage()
+    start = time.time()
+    dump = SvnDumpFile()
+    dump.open( dumpfile )
+    dump.read_next_rev()
+    add_bench_result( params, "bench_big_rev", "read_next_rev",
+                      time.time() - start, nbytes )
+    print "%d nodes use %d KB" % ( dump.get_node_count(),
+                                   memory_usage() - mem )
+    start = time.time()
+    n = 0
+    for node in dump.get_nodes_iter():
+        if node.get_kind() == "file":
+            n += 1
+    add_bench_result( params, "bench_big_rev", "iterate nodes",
+                      time.time() - start, 0 )
+    start = time.time()
+    gc.collect()
+    add_bench_result( params, "bench_big_rev", "gc.collect()",
+                      time.time() - start, 0 )
+    dump.close()
+    return 0
+
+def get_binary_dump( params ):
+    """Returns the name of the dump with big binary files, creates it."""
+
+    nfiles = 16
+    size = 32 * 1024 * 1024
+    dumpfile = "%s/binaries-%d.dmp" % ( params["tempdir"], nfiles )
+    if not isfile( dumpfile ):
+        print "creating %s" % dumpfile
+        create_binary_dump( dumpfile, nfiles, size )
+    return dumpfile
+
+def bench_binaries( params ):
+    """Benchmark 16: reading a dump consisting of big binary files."""
+
+    dumpfile = get_binary_dump( params )
+    nbytes = getsize( dumpfile )
+
+    for descr, counting in ( ( "seek", False ), ( "count lines", True ) ):
+        start = time.time()
+        dump = SvnDumpFile()
+        dump.open( dumpfile )
+        dump.set_line_counting( counting )
+        while dump.read_next_rev():
+            pass
+        dump.close()
+        add_bench_result( params, "bench_binaries", "read_next_rev " + descr,
+                          time.time() - start, nbytes )
+    return 0
+
+def bench_digests( params ):
+    """Benchmark 64: md5 and sha1 sums in separate passes or in one."""
+
+    dumpfile = get_binary_dump( params )
+    nbytes = getsize( dumpfile )
+    results = []
+    for descr, passes in ( ( "separate passes", [ [ "md5" ], [ "sha1" ] ] ),
+                           ( "one pass", [ [ "md5", "sha1" ] ] ) ):
+        digests = []
+        start = time.time()
+        dump = SvnDumpFile()
+        dump.open( dumpfile )
+        while dump.read_next_rev():
+            for node in dump.get_nodes_iter():
+                if node.has_text():
+                    for names in passes:
+                        digests.append( node.calculate_digests( names ) )
+        dump.close()
+        add_bench_result( params, "bench_digests", "md5+sha1 " + descr,
+                          time.time() - start, nbytes )
+        results.append( digests )
+    # compare the sums of both runs
+    separate = []
+    for i in range( 0, len( results[0] ), 2 ):
+        separate.append( { "md5": results[0][i]["md5"],
+                           "sha1": results[0][i+1]["sha1"] } )
+    if separate != results[1]:
+        print "bench_digests: different sums"
+        return 1
+    return 0
+
+class DictNodeHistory:
+    """
+    The node history as kept by SvnDumpFileWithHistory up to 0.6.0,
+    a dict of path -> [ kind, [ start, end ], ... ], for comparison.
+    """
+
+    def __init__( self ):
+        self.nodehist = { "": [ "D", [ 0, 999999999 ] ] }
+
+    def get_rev_index( self, nodehist, revnr ):
+        i = len(nodehist) - 1
+        while i > 0 and revnr < nodehist[i][0]:
+            i -= 1
+        if i == 0:
+            return None
+        if revnr > nodehist[i][1] and nodehist[i][1] >= 0:
+            return None
+        return i
+
+    def get_kind( self, revnr, path ):
+        if not self.nodehist.has_key( path ):
+            return None
+        nodehist = self.nodehist[ path ]
+        if self.get_rev_index( nodehist, revnr ) == None:
+            return None
+        return nodehist[0][0]
+
+    def add( self, revnr, path, kind, cfrev=None, cfpath=None ):
+        if not self.nodehist.has_key( path ):
+            self.nodehist[ path ] = [ ( kind ) ]
+        self.nodehist[ path ].append( [ revnr, -1 ] )
+        if self.nodehist[ path ][0][0] == "F" or cfpath == None:
+            return
+        cfpath += "/"
+        cfpathlen = len(cfpath)
+        path += "/"
+        for cfnodepath in self.nodehist.keys()[:]:
+            if cfnodepath.startswith( cfpath ):
+                cfnodehist = self.nodehist[cfnodepath]
+                i = self.get_rev_index( cfnodehist, cfrev )
+                if i != None:
+                    npath = path + cfnodepath[cfpathlen:]
+                    if not self.nodehist.has_key( npath ):
+                        self.nodehist[ npath ] = [ cfnodehist[0] ]
+                    self.nodehist[ npath ].append( [ revnr, -1 ] )
+
+    def delete( self, revnr, path ):
+        self.nodehist[ path ][-1][1] = revnr - 1
+        if self.nodehist[ path ][0][0] == "F":
+            return
+        path += "/"
+        for nodepath in self.nodehist.keys()[:]:
+            if nodepath.startswith( path ):
+                nodehist = self.nodehist[nodepath]
+                if nodehist[-1][1] == -1:
+                    nodehist[-1][1] = revnr - 1
+
+def run_history( hist, nfiles, ncopies ):
+    """
+    Adds nfiles files to trunk, copies trunk ncopies times to a branch,
+    deleting every second branch, and looks up the files in all
+    branches. Returns the count of existing files found.
+    """
+
+    hist.add( 1, "trunk", "D" )
+    hist.add( 1, "branches", "D" )
+    for i in range( nfiles ):
+        if i % 100 == 0:
+            hist.add( 1, "trunk/d%d" % ( i / 100 ), "D" )
+        hist.add( 1, "trunk/d%d/f%d.c" % ( i / 100, i ), "F" )
+    revnr = 1
+    for i in range( ncopies ):
+        revnr += 1
+        hist.add( revnr, "branches/b%d" % i, "D", revnr - 1, "trunk" )
+        if i % 2 == 1:
+            revnr += 1
+            hist.delete( revnr, "branches/b%d" % ( i - 1 ) )
+    found = 0
+    for i in range( ncopies ):
+        for j in range( nfiles ):
+            if hist.get_kind( revnr, "branches/b%d/d%d/f%d.c" %
+                                     ( i, j / 100, j ) ) != None:
+                found += 1
+    return found
+
+def bench_history( params ):
+    """Benchmark 32: node history with many paths and branch copies."""
+
+    for nfiles, ncopies in ( ( 1000, 10 ), ( 1000, 100 ),
+                             ( 10000, 10 ), ( 10000, 100 ),
+                             ( 100000, 10 ) ):
+        descr = "%d paths x %d copies" % ( nfiles, ncopies )
+        results = []
+        for name, histclass in ( ( "dict", DictNodeHistory ),
+                                 ( "trie", NodeHistory ) ):
+            start = time.time()
+            results.append( run_history( histclass(), nfiles, ncopies ) )
+            add_bench_result( params, "bench_history", descr + " " + name,
+                              time.time() - start, 0 )
+        if results[0] != results[1]:
+            print "different results for %s: %r" % ( descr, results )
+            return 1
+    return 0
+
+def bench_writer( params ):
+    """Benchmark 128: writing many small nodes with several buffer sizes."""
+
+    dumpfile = get_big_rev_dump( params )
+    nbytes = getsize( dumpfile )
+    outfile = params["tempdir"] + "/writer.dmp"
+
+    for kb in ( 8, 64, 1024, 8192 ):
+        set_default_write_buffer_size( kb * 1024 )
+        start = time.time()
+        svndump.copy_dump_file( dumpfile, outfile, DirtyTransformer() )
+        add_bench_result( params, "bench_writer",
+                          "re-serialize, %d KB buffer" % kb,
+                          time.time() - start, nbytes )
+    set_default_write_buffer_size( 1024 * 1024 )
+    remove( outfile )
+    return 0
+
+def bench_chunks( params ):
+    """Benchmark 256: copying and hashing big texts with several chunk sizes."""
+
+    dumpfile = get_binary_dump( params )
+    nbytes = getsize( dumpfile )
+    outfile = params["tempdir"] + "/chunks.dmp"
+
+    for kb in ( 16, 64, 256, 1024, 8192 ):
+        set_read_chunk_size( kb * 1024 )
+        start = time.time()
+        svndump.copy_dump_file( dumpfile, outfile, DirtyTransformer() )
+        add_bench_result( params, "bench_chunks",
+                          "re-serialize, %d KB chunks" % kb,
+                          time.time() - start, nbytes )
+        start = time.time()
+        svndump_check_cmdline( "svndumpbench.py", [ "-m", dumpfile ] )
+        add_bench_result( params, "bench_chunks",
+                          "check -m, %d KB chunks" % kb,
+                          time.time() - start, nbytes )
+    set_read_chunk_size( 1024 * 1024 )
+    remove( outfile )
+    return 0
+
+def summarize_revision( dump ):
+    """Returns a summary of a revision for bench_parallel."""
+
+    nodes = 0
+    textlen = 0
+    for node in dump.get_nodes_iter():
+        nodes += 1
+        if node.has_text():
+            textlen += node.get_text_length()
+    return ( dump.get_rev_author(), dump.get_rev_log(), nodes, textlen )
+
+def bench_parallel( params ):
+    """Benchmark 512: reading revision ranges with 1, 4 and 16 workers."""
+
+    dumpfile = params["dumpfile"]
+    nbytes = getsize( dumpfile )
+
+    # the revision ranges are taken from the index
+    dump = SvnDumpFile()
+    dump.open( dumpfile )
+    if dump.get_index() == None:
+        create_dump_index( dumpfile ).save( dumpfile )
+    dump.close()
+
+    results = []
+    for jobs in ( 1, 4, 16 ):
+        start = time.time()
+        results.append( list( map_revisions( dumpfile, summarize_revision,
+                                             jobs=jobs ) ) )
+        add_bench_result( params, "bench_parallel",
+                          "summarize revisions, %d jobs" % jobs,
+                          time.time() - start, nbytes )
+    if results[0] != results[1] or results[0] != results[2]:
+        print "different results for 1, 4 and 16 jobs"
+        return 1
+    return 0
+
+def bench_scan( params ):
+    """Benchmark 1024: finding the records by reading and by scanning."""
+
+    for dumpfile in ( params["dumpfile"], get_big_rev_dump( params ) ):
+        nbytes = getsize( dumpfile )
+        name = dumpfile.split( "/" )[-1]
+        for usemmap in ( False, True ):
+            mode = ""
+            if usemmap:
+                mode = ", mmap"
+            start = time.time()
+            dump = SvnDumpFile()
+            dump.open( dumpfile, usemmap )
+            nread = 0
+            while dump.read_next_rev():
+                nread += 1
+            dump.close()
+            add_bench_result( params, "bench_scan",
+                              "read_next_rev %s%s" % ( name, mode ),
+                              time.time() - start, nbytes )
+            start = time.time()
+            nscan = 0
+            for record in scan_dump_file( dumpfile, usemmap ):
+                if record[0] == "R":
+                    nscan += 1
+            add_bench_result( params, "bench_scan",
+                              "scan_dump_file %s%s" % ( name, mode ),
+                              time.time() - start, nbytes )
+            if nread != nscan:
+                print "read %d but scanned %d revisions" % ( nread, nscan )
+                return 1
+    return 0
+
+def bench_merge( params ):
+    """Benchmark 2048: merging 30 and 300 project dumps."""
+
+    nrevs = 20
+    for ndumps, maxopen in ( ( 30, 256 ), ( 300, 256 ), ( 300, 16 ) ):
+        dirname = "%s/merge-%d" % ( params["tempdir"], ndumps )
+        if not isdir( dirname ):
+            mkdir( dirname )
+            create_project_dumps( dirname, ndumps, nrevs )
+        infiles = [ "%s/proj%d.dmp" % ( dirname, i ) for i in range( ndumps ) ]
+        outfile = dirname + "/merged.dmp"
+        merge = SvnDumpMerge()
+        merge.set_output_file( outfile )
+        merge.set_max_open_files( maxopen )
+        for i in range( ndumps ):
+            index = merge.add_input_file( infiles[i] )
+            merge.add_rename( index, "trunk", "proj%d/trunk" % i )
+        for i in range( ndumps ):
+            merge.add_directory( "proj%d" % i )
+        # merge prints a line per revision
+        stdout = sys.stdout
+        sys.stdout = open( "/dev/null", "w" )
+        start = time.time()
+        try:
+            merge.merge()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        add_bench_result( params, "bench_merge",
+                          "merge %d dumps, %d open files" % ( ndumps,
+                                                             maxopen ),
+                          time.time() - start, getsize( outfile ) )
+    for ndumps in ( 30, 300 ):
+        kill_dir( "%s/merge-%d" % ( params["tempdir"], ndumps ) )
+    return 0
+
+def bench_rename( params ):
+    """Benchmark 4096: renaming paths with 2000 prefix renames or regexes."""
+
+    nrules = 2000
+    rnd = random.Random( 4096 )
+    paths = [ "proj%d/trunk/src/f%d.c" % ( rnd.randint( 0, nrules * 2 ),
+                                           rnd.randint( 0, 100 ) )
+              for i in xrange( 5000 ) ]
+    prefixes = PathRenamer()
+    regexes = PathRenamer()
+    for i in range( nrules ):
+        prefixes.add_rename( "proj%d/trunk" % i, "trunk/proj%d" % i )
+        regexes.add_regex_sub( "^proj%d/trunk/(.*)$" % i,
+                               "trunk/proj%d/\\1" % i )
+    for renamer, descr in ( ( prefixes, "prefix renames" ),
+                            ( regexes, "regex substitutions" ) ):
+        # the second pass finds the paths in the cache
+        for npass in ( 1, 2 ):
+            start = time.time()
+            for path in paths:
+                renamer.rename( path )
+            add_bench_result( params, "bench_rename",
+                              "%d %s, pass %d" % ( nrules, descr, npass ),
+                              time.time() - start, 0 )
+    return 0
+
+
+if __name__ == '__main__':
+
+    benchmarks = 8191
+    nrevs = 2000
+    if len( sys.argv ) > 1:
+        benchmarks = int( sys.argv[1] )
+    if len( sys.argv ) > 2:
+        nrevs = int( sys.argv[2] )
+
+    params = bench_init( nrevs )
+    rc = 0
+    if rc == 0 and benchmarks & 1 != 0:
+        rc = bench_compress( params )
+    if rc == 0 and benchmarks & 2 != 0:
+        rc = bench_copy( params )
+    if rc == 0 and benchmarks & 4 != 0:
+        rc = bench_props( params )
+    if rc == 0 and benchmarks & 8 != 0:
+        rc = bench_big_rev( params )
+    if rc == 0 and benchmarks & 16 != 0:
+        rc = bench_binaries( params )
+    if rc == 0 and benchmarks & 32 != 0:
+        rc = bench_history( params )
+    if rc == 0 and benchmarks & 64 != 0:
+        rc = bench_digests( params )
+    if rc == 0 and benchmarks & 128 != 0:
+        rc = bench_writer( params )
+    if rc == 0 and benchmarks & 256 != 0:
+        rc = bench_chunks( params )
+    if rc == 0 and benchmarks & 512 != 0:
+        rc = bench_parallel( params )
+    if rc == 0 and benchmarks & 1024 != 0:
+        rc = bench_scan( params )
+    if rc == 0 and benchmarks & 2048 != 0:
+        rc = bench_merge( params )
+    if rc == 0 and benchmarks & 4096 != 0:
+        rc = bench_rename( params )
+    show_bench_results( params )
+    sys.exit( rc )
+
@@ -22,15 +22,30 @@
 #===============================================================================
 
 import sys
-from os import mkdir, system, listdir, remove, rmdir
-from os.path import isdir, isfile, abspath
+from os import mkdir, system, listdir, remove, rmdir, stat, utime
+from os.path import isdir, isfile, abspath, dirname
 import time # for svn cp bug
 import zlib
+import gzip
+import bz2
+import hashlib
+import re
 
 import svndump
+from svndump.common import SvnDumpException, ListDict
+from svndump.compress import DecompressReader
+from svndump.blobcache import BlobCache
+from svndump.delta import apply_svndiff, create_svndiff, DeltaWriter
+from svndump.history import NodeHistory
+from svndump.index import SvnDumpIndex, load_dump_index
+from svndump.rename import PathRenamer
 from svndump.node import SvnDumpNode
-from svndump.file import SvnDumpFile
+from svndump.file import SvnDumpFile, SvnDumpFileWithHistory, \
+        set_default_write_deltas, set_default_mmap, create_dump_index, \
+        scan_dump_file
 from svndump.diff import svndump_diff_cmdline
+from svndump.merge import SvnDumpMerge
+from svndump.parallel import map_revisions
 from svndump.eolfix import svndump_eol_fix_cmdline
 
 def run( cmd ):
@@ -251,7 +266,9 @@ def py_create_dump_file( filename, fileid, data, tmpdir ):
                 fileobj.close()
                 node.set_text_file( textfile )
             if action == "delete":
-                del nodeprops[path]
+                # unknown if copied with its parent dir
+                if nodeprops.has_key( path ):
+                    del nodeprops[path]
             elif action == "add" or action == "replace":
                 if nodedata.has_key("props"):
                     props = nodedata["props"].copy()
@@ -472,6 +489,129 @@ data_test1 = [
     }
 ]
 
+# copies, replaces and deletes for the delta round trip
+data_test_delta = [
+    {
+        "nr":       0,
+        "uuid":     "22222222-2222-2222-2222-222222222222",
+        "date":     "2004-02-01T10:00:00.000000Z"
+    },
+    {
+        "date":     "2004-02-01T12:00:00.000000Z",
+        "nodes":    [
+            {
+                "path":     "trunk",
+                "kind":     "dir",
+                "action":   "add"
+            },
+            {
+                "path":     "trunk/a.txt",
+                "kind":     "file",
+                "action":   "add",
+                "text":     "text"
+            },
+            {
+                "path":     "trunk/b.txt",
+                "kind":     "file",
+                "action":   "add",
+                "text":     "text",
+                "props":    {
+                    "test":         "true"
+                }
+            }
+        ]
+    },
+    {
+        "date":     "2004-02-02T12:00:00.000000Z",
+        "nodes":    [
+            # change text and copy a dir
+            {
+                "path":     "trunk/a.txt",
+                "kind":     "file",
+                "action":   "change",
+                "text":     "text"
+            },
+            {
+                "path":     "branch",
+                "kind":     "dir",
+                "action":   "add",
+                "copyfrom": [ "trunk", 1 ]
+            }
+        ]
+    },
+    {
+        "date":     "2004-02-03T12:00:00.000000Z",
+        "nodes":    [
+            # change a copied file, replace and delete files
+            {
+                "path":     "branch/a.txt",
+                "kind":     "file",
+                "action":   "change",
+                "text":     "text"
+            },
+            {
+                "path":     "trunk/b.txt",
+                "kind":     "file",
+                "action":   "replace",
+                "text":     "binary"
+            },
+            {
+                "path":     "trunk/a.txt",
+                "kind":     "file",
+                "action":   "delete"
+            }
+        ]
+    },
+    {
+        "date":     "2004-02-04T12:00:00.000000Z",
+        "nodes":    [
+            # copy and modify a file
+            {
+                "path":     "trunk/a.txt",
+                "kind":     "file",
+                "action":   "add",
+                "text":     "text",
+                "copyfrom": [ "branch/a.txt", 3 ]
+            }
+        ]
+    }
+]
+
+# deletes in and copies of a copied dir for ls
+data_test_ls = data_test_delta + [
+    {
+        "date":     "2004-02-05T12:00:00.000000Z",
+        "nodes":    [
+            {
+                "path":     "branch/b.txt",
+                "kind":     "file",
+                "action":   "delete"
+            },
+            {
+                "path":     "tags",
+                "kind":     "dir",
+                "action":   "add"
+            }
+        ]
+    },
+    {
+        "date":     "2004-02-06T12:00:00.000000Z",
+        "nodes":    [
+            {
+                "path":     "tags/t1",
+                "kind":     "dir",
+                "action":   "add",
+                "copyfrom": [ "branch", 5 ]
+            },
+            {
+                "path":     "branch",
+                "kind":     "dir",
+                "action":   "delete"
+            }
+        ]
+    }
+]
+
 def write_test_file( tmpdir ):
     """Just testing py_create_dump_file."""
     filename = tmpdir + "/test.svndmp"
@@ -492,6 +632,10 @@ def test_init():
     tempwc = tempdir + "/wc"
     params["tempwc"] = tempwc
 
+    # command running svndumptool.py
+    params["svndumptool"] = "'%s' '%s/svndumptool.py'" % \
+            ( sys.executable, dirname( abspath( sys.argv[0] ) ) )
+
     # create needed directories
     if not isdir( tempdir ):
         mkdir( tempdir )
@@ -616,10 +760,1364 @@ def test_eolfix( params ):
     # done.
     return 0
 
+def test_delta( params ):
+    """Test 4: Test applying and creating svndiff deltas."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+
+    # one svndiff1 window transforming "aaaabbbbcccc" into
+    # "aaaaccccdddddddd": source copies 0+4 and 8+4, one byte new data
+    # and a target copy 8+7 overlapping the bytes it writes, the sections
+    # are too short for zlib and stored with their length only
+    source = "aaaabbbbcccc"
+    window = "\x00\x0c\x10\x08\x02" + \
+             "\x07\x04\x00\x04\x08\x81\x47\x08" + "\x01d"
+    delta = "SVN\x01" + window
+    rc = 0
+    if apply_svndiff( source, delta ) != "aaaaccccdddddddd":
+        rc = 1
+    add_test_result( params, "test_delta", "apply svndiff1 window", rc )
+    if rc != 0:
+        print "wrong target text :("
+        return 1
+    # the same window as svndiff0
+    rc = 0
+    window0 = "\x00\x0c\x10\x07\x01" + \
+              "\x04\x00\x04\x08\x81\x47\x08" + "d"
+    if apply_svndiff( source, "SVN\x00" + window0 ) != "aaaaccccdddddddd":
+        rc = 1
+    add_test_result( params, "test_delta", "apply svndiff0 window", rc )
+    if rc != 0:
+        print "wrong target text :("
+        return 1
+    # new data compressed with zlib
+    rc = 0
+    text = "line A\n" * 9
+    ins = "\x01" + chr( 0x80 | len( text ) )
+    new = chr( len( text ) ) + zlib.compress( text )
+    window = "\x00\x00" + chr( len( text ) ) + chr( len( ins ) ) + \
+             chr( len( new ) ) + ins + new
+    if apply_svndiff( "", "SVN\x01" + window ) != text:
+        rc = 1
+    add_test_result( params, "test_delta", "apply compressed window", rc )
+    if rc != 0:
+        print "wrong target text :("
+        return 1
+
+    # errors
+    rc = 1
+    try:
+        apply_svndiff( source, delta[:-1] )
+    except SvnDumpException:
+        rc = 0
+    add_test_result( params, "test_delta", "truncated window", rc )
+    if rc != 0:
+        print "no error :("
+        return 1
+    rc = 1
+    try:
+        apply_svndiff( source[:8], delta )
+    except SvnDumpException:
+        rc = 0
+    add_test_result( params, "test_delta", "source view beyond base", rc )
+    if rc != 0:
+        print "no error :("
+        return 1
+
+    # create deltas against short sources and with windows beyond the
+    # end of the source
+    target = "".join( [ "line %d\n" % i for i in range( 30000 ) ] )
+    rc = 0
+    for source in ( "", "line 0\n", target[1000:150000] + "new\n" ):
+        for version in ( 0, 1 ):
+            delta = create_svndiff( source, target, version )
+            if apply_svndiff( source, delta ) != target:
+                rc = 1
+    if len( create_svndiff( "", target, 0 ) ) > len( target ) + 100:
+        rc = 1
+    add_test_result( params, "test_delta", "create svndiff", rc )
+    if rc != 0:
+        print "wrong delta :("
+        return 1
+
+    # texts too big for a delta and texts based on them are fulltexts
+    writer = DeltaWriter( maxtextsize=64 )
+    results = []
+    for revnr, length in ( ( 1, 100 ), ( 2, 50 ), ( 3, 60 ) ):
+        textfile = "%s/test_delta_text%d" % ( tempfiles, revnr )
+        outfile = open( textfile, "wb" )
+        outfile.write( "%d" % revnr * length )
+        outfile.close()
+        action = "change"
+        if revnr == 1:
+            action = "add"
+        node = SvnDumpNode( "big.txt", action, "file" )
+        node.set_text_file( textfile )
+        results.append( writer.add_node( revnr, node ) != None )
+    rc = 0
+    if results != [ False, False, True ]:
+        rc = 1
+    add_test_result( params, "test_delta", "max text size", rc )
+    if rc != 0:
+        print "wrong deltas %s :(" % results
+        return 1
+
+    # round trip version 2 -> 3 -> 2
+    v2dmp = tempdir + "/test_delta_v2"
+    v3dmp = tempdir + "/test_delta_v3"
+    v2dmp2 = tempdir + "/test_delta_v2b"
+    py_create_dump_file( v2dmp, "delta", data_test_delta, tempfiles )
+    set_default_write_deltas( True )
+    try:
+        svndump.copy_dump_file( v2dmp, v3dmp )
+    finally:
+        set_default_write_deltas( False )
+    svndump.copy_dump_file( v3dmp, v2dmp2 )
+    rc = 0
+    if open( v3dmp, "rb" ).read().count( "Text-delta: true\n" ) == 0:
+        rc = 1
+    add_test_result( params, "test_delta", "v3 has deltas", rc )
+    if rc != 0:
+        print "no deltas written :("
+        return 1
+    rc = run( "cmp '%s' '%s'" % ( v2dmp, v2dmp2 ) )
+    add_test_result( params, "test_delta", "cmp v2 v3 v2", rc )
+    if rc != 0:
+        print "diffs found :("
+        return 1
+
+    # done.
+    return 0
+
+def test_listdict( params ):
+    """Test 8: Test ListDict."""
+
+    # insertion order and access by index
+    ld = ListDict()
+    for key in [ "d", "b", "c", "a" ]:
+        ld[key] = key.upper()
+    rc = 0
+    if ld.keys() != [ "d", "b", "c", "a" ] or ld[1] != "B" or \
+            ld.item( 2 ) != ( "c", "C" ) or ld.key( 3 ) != "a":
+        rc = 1
+    add_test_result( params, "test_listdict", "order and index", rc )
+    if rc != 0:
+        print "wrong order :("
+        return 1
+
+    # delete by key and index, re-add and replace by index
+    del ld["b"]
+    del ld[0]
+    rc = 0
+    if ld.keys() != [ "c", "a" ] or len( ld ) != 2 or ld[0] != "C":
+        rc = 1
+    ld["d"] = "D2"
+    ld[0] = "C2"
+    if list( ld ) != [ "c", "a", "d" ] or ld.values() != [ "C2", "A", "D2" ] \
+            or ld.items() != [ ( "c", "C2" ), ( "a", "A" ), ( "d", "D2" ) ]:
+        rc = 1
+    add_test_result( params, "test_listdict", "delete and re-add", rc )
+    if rc != 0:
+        print "wrong order :("
+        return 1
+
+    # many deletes between iterations
+    ld = ListDict()
+    for i in range( 10000 ):
+        ld["k%d" % i] = i
+    for i in range( 1, 10000, 2 ):
+        del ld["k%d" % i]
+    rc = 0
+    if ld.values() != range( 0, 10000, 2 ):
+        rc = 1
+    for i in range( 2499, -1, -1 ):
+        del ld[i * 2 + 1]
+    if ld.values() != range( 0, 10000, 4 ):
+        rc = 1
+    ld.clear()
+    if len( ld ) != 0 or ld.keys() != []:
+        rc = 1
+    add_test_result( params, "test_listdict", "many deletes", rc )
+    if rc != 0:
+        print "wrong keys :("
+        return 1
+
+    # done.
+    return 0
+
+def check_history( params, funcname, descr, hist, revnr, expected ):
+    """
+    Compares the kinds and paths of a revision of a NodeHistory with
+    expected = { path -> kind }, paths of kind None must not exist.
+    """
+
+    rc = 0
+    for path, kind in expected.iteritems():
+        if hist.get_kind( revnr, path ) != kind:
+            print "r%d %s: kind %s, expected %s" % ( revnr, path,
+                    hist.get_kind( revnr, path ), kind )
+            rc = 1
+    paths = hist.get_paths( revnr )
+    paths.sort()
+    existing = [ path for path, kind in expected.iteritems() if kind ]
+    existing.sort()
+    if paths != existing:
+        print "r%d paths: %s" % ( revnr, paths )
+        print "  expected %s" % existing
+        rc = 1
+    add_test_result( params, funcname, descr, rc )
+    return rc
+
+def test_history( params ):
+    """Test 16: Test NodeHistory."""
+
+    hist = NodeHistory()
+    hist.add( 1, "trunk", "D" )
+    hist.add( 1, "trunk/a", "F" )
+    hist.add( 1, "trunk/d", "D" )
+    hist.add( 1, "trunk/d/b", "F" )
+    hist.add( 2, "trunk/d/c", "F" )
+    hist.delete( 3, "trunk/d" )
+    hist.add( 4, "trunk/d", "D" )
+    hist.delete( 5, "trunk/a" )
+
+    rc = check_history( params, "test_history", "r1", hist, 1,
+            { "trunk": "D", "trunk/a": "F", "trunk/d": "D",
+              "trunk/d/b": "F", "trunk/d/c": None } )
+    if rc == 0:
+        rc = check_history( params, "test_history", "r2", hist, 2,
+            { "trunk": "D", "trunk/a": "F", "trunk/d": "D",
+              "trunk/d/b": "F", "trunk/d/c": "F" } )
+    if rc == 0:
+        # recursive delete
+        rc = check_history( params, "test_history", "r3", hist, 3,
+            { "trunk": "D", "trunk/a": "F", "trunk/d": None,
+              "trunk/d/b": None, "trunk/d/c": None } )
+    if rc == 0:
+        # re-added without the old children
+        rc = check_history( params, "test_history", "r4", hist, 4,
+            { "trunk": "D", "trunk/a": "F", "trunk/d": "D",
+              "trunk/d/b": None, "trunk/d/c": None } )
+    if rc == 0:
+        rc = check_history( params, "test_history", "r5", hist, 5,
+            { "trunk": "D", "trunk/a": None, "trunk/d": "D" } )
+    if rc != 0:
+        print "wrong history :("
+        return 1
+
+    # done.
+    return 0
+
+def test_history_copies( params ):
+    """Test 32: Test copied directories in NodeHistory."""
+
+    hist = NodeHistory()
+    hist.add( 1, "trunk", "D" )
+    hist.add( 1, "trunk/a", "F" )
+    hist.add( 1, "trunk/d", "D" )
+    hist.add( 1, "trunk/d/b", "F" )
+    # copy, then modify below the copy
+    hist.add( 2, "branch", "D", 1, "trunk" )
+    hist.add( 3, "branch/d/c", "F" )
+    hist.delete( 3, "branch/a" )
+    # modify the source after the copy
+    hist.add( 4, "trunk/e", "F" )
+    hist.delete( 4, "trunk/d" )
+    # copy of a copy and a copy of an older revision
+    hist.add( 5, "tag", "D", 4, "branch" )
+    hist.add( 5, "old", "D", 1, "trunk" )
+    # delete a copy source
+    hist.delete( 6, "branch" )
+
+    rc = check_history( params, "test_history_copies", "copy", hist, 2,
+            { "trunk": "D", "trunk/a": "F", "trunk/d": "D",
+              "trunk/d/b": "F", "branch": "D", "branch/a": "F",
+              "branch/d": "D", "branch/d/b": "F" } )
+    if rc == 0:
+        rc = check_history( params, "test_history_copies", "modify copy",
+            hist, 3,
+            { "trunk": "D", "trunk/a": "F", "trunk/d": "D",
+              "trunk/d/b": "F", "trunk/d/c": None, "branch": "D",
+              "branch/a": None, "branch/d": "D", "branch/d/b": "F",
+              "branch/d/c": "F" } )
+    if rc == 0:
+        rc = check_history( params, "test_history_copies", "modify source",
+            hist, 4,
+            { "trunk": "D", "trunk/a": "F", "trunk/d": None,
+              "trunk/e": "F", "branch": "D", "branch/a": None,
+              "branch/d": "D", "branch/d/b": "F", "branch/d/c": "F",
+              "branch/e": None } )
+    if rc == 0:
+        rc = check_history( params, "test_history_copies", "copy of copy",
+            hist, 5,
+            { "trunk": "D", "trunk/a": "F", "trunk/e": "F", "branch": "D",
+              "branch/d": "D", "branch/d/b": "F", "branch/d/c": "F",
+              "tag": "D", "tag/a": None, "tag/d": "D", "tag/d/b": "F",
+              "tag/d/c": "F", "old": "D", "old/a": "F", "old/d": "D",
+              "old/d/b": "F", "old/e": None } )
+    if rc == 0:
+        rc = check_history( params, "test_history_copies", "delete source",
+            hist, 6,
+            { "trunk": "D", "trunk/a": "F", "trunk/e": "F", "branch": None,
+              "branch/d": None, "branch/d/c": None, "tag": "D",
+              "tag/d": "D", "tag/d/b": "F", "tag/d/c": "F", "old": "D",
+              "old/a": "F", "old/d": "D", "old/d/b": "F" } )
+    if rc != 0:
+        print "wrong history :("
+        return 1
+
+    # done.
+    return 0
+
+def check_renames( params, descr, renamer, expected ):
+    """
+    Renames paths with a PathRenamer and compares them with
+    expected = [ ( path, renamed path ), ... ].
+    """
+
+    rc = 0
+    for path, newpath in expected:
+        if renamer.rename( path ) != newpath:
+            print "%s: renamed to %s, expected %s" % ( path,
+                    renamer.rename( path ), newpath )
+            rc = 1
+    add_test_result( params, "test_rename", descr, rc )
+    return rc
+
+def test_rename( params ):
+    """Test 64: Test PathRenamer."""
+
+    # prefix renames, the first matching one added wins
+    renamer = PathRenamer()
+    renamer.add_rename( "trunk/sub", "moved" )
+    renamer.add_rename( "/trunk/", "p1/trunk" )
+    renamer.add_rename( "trunk/sub/x", "ignored" )
+    renamer.add_rename( "tags", "p1/tags/" )
+    renamer.add_regex_sub( "^branches/([^/]+)", "p1/branches/\\1" )
+    rc = check_renames( params, "prefix renames", renamer,
+            [ ( "trunk", "p1/trunk" ),
+              ( "trunk/a.txt", "p1/trunk/a.txt" ),
+              ( "/trunk/a.txt", "p1/trunk/a.txt" ),
+              ( "trunk/sub", "moved" ),
+              ( "trunk/sub/x/y.txt", "moved/x/y.txt" ),
+              ( "trunkx/a.txt", "trunkx/a.txt" ),
+              ( "tags/t1", "p1/tags/t1" ),
+              ( "branches/b1/a.txt", "p1/branches/b1/a.txt" ),
+              ( "other", "other" ) ] )
+    if rc != 0:
+        print "wrong renames :("
+        return 1
+
+    # renames added after renaming (cached paths) and a root rename
+    renamer.add_rename( "other", "p1/other" )
+    renamer.add_rename( "/", "root" )
+    rc = check_renames( params, "added later", renamer,
+            [ ( "other/a.txt", "p1/other/a.txt" ),
+              ( "trunk/a.txt", "p1/trunk/a.txt" ),
+              ( "x/a.txt", "root/x/a.txt" ) ] )
+    if rc != 0:
+        print "wrong renames :("
+        return 1
+
+    # regex substitutions are applied in order, each once, more than
+    # fit into one combined regex, with back references and reused
+    # group names
+    renamer = PathRenamer()
+    for i in range( 150 ):
+        renamer.add_regex_sub( "^d%d/" % i, "e%d/" % ( i + 1 ) )
+    renamer.add_regex_sub( "(a+)b\\1", "X" )
+    renamer.add_regex_sub( "(?P<n>y)", "<\\g<n>>" )
+    renamer.add_regex_sub( "(?P<n>z)", "[\\g<n>]" )
+    renamer.add_regex_sub( "(?i)CASE", "case" )
+    rc = check_renames( params, "regex substitutions", renamer,
+            [ ( "d0/f", "e1/f" ),
+              ( "d149/f", "e150/f" ),
+              ( "d99/aabaa", "e100/X" ),
+              ( "d5/abc", "e6/abc" ),
+              ( "yz/yz", "<y>[z]/yz" ),
+              ( "Case/f", "case/f" ),
+              ( "f/d0/", "f/d0/" ) ] )
+    if rc != 0:
+        print "wrong renames :("
+        return 1
+
+    # mkdir excludes
+    rc = 0
+    renamer.add_exclude( "p1" )
+    if not renamer.is_excluded( "p1" ) or renamer.is_excluded( "p1/trunk" ):
+        rc = 1
+    add_test_result( params, "test_rename", "excludes", rc )
+    if rc != 0:
+        print "wrong excludes :("
+        return 1
+
+    # done.
+    return 0
+
+def test_merge_max_open( params ):
+    """Test 128: Test merge with a limited count of open input files."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+
+    # create input dumps with interleaving dates, one of them compressed
+    # and one with deltas which both can't be reopened
+    ninputs = 5
+    infiles = []
+    for i in range( ninputs ):
+        data = []
+        for rev in data_test_delta:
+            rev = rev.copy()
+            rev["date"] = rev["date"].replace( "T12:", "T%02d:" % ( 10 + i ) )
+            data.append( rev )
+        infile = "%s/test_merge_in%d" % ( tempdir, i )
+        set_default_write_deltas( i == 3 )
+        try:
+            py_create_dump_file( infile, "merge%d" % i, data, tempfiles )
+        finally:
+            set_default_write_deltas( False )
+        if i == 2:
+            text = open( infile, "rb" ).read()
+            infile += ".gz"
+            outfile = gzip.open( infile, "wb" )
+            outfile.write( text )
+            outfile.close()
+        infiles.append( infile )
+
+    # merge with all files open and with 2 and 1 open files
+    outfiles = []
+    for maxopen in ( 256, 2, 1 ):
+        outfile = "%s/test_merge_out%d" % ( tempdir, maxopen )
+        merge = SvnDumpMerge()
+        merge.set_output_file( outfile )
+        merge.set_max_open_files( maxopen )
+        for i in range( ninputs ):
+            index = merge.add_input_file( infiles[i] )
+            merge.add_rename( index, "trunk", "p%d/trunk" % i )
+            merge.add_rename( index, "branch", "p%d/branch" % i )
+        merge.merge()
+        outfiles.append( outfile )
+
+    rc = 0
+    if open( outfiles[0], "rb" ).read().count( "Revision-number: " ) != \
+            1 + ninputs * ( len( data_test_delta ) - 1 ):
+        rc = 1
+    add_test_result( params, "test_merge_max_open", "revision count", rc )
+    if rc != 0:
+        print "wrong revision count :("
+        return 1
+    for outfile in outfiles[1:]:
+        rc = run( "cmp '%s' '%s'" % ( outfiles[0], outfile ) )
+        add_test_result( params, "test_merge_max_open",
+                         "cmp %s" % outfile[len( tempdir ) + 1:], rc )
+        if rc != 0:
+            print "diffs found :("
+            return 1
+
+    # done.
+    return 0
+
+def test_index( params ):
+    """Test 256: Test saving and loading indexes with big offsets."""
+
+    # get params
+    tempdir = params["tempdir"]
+
+    # any file will do, the index only remembers its size and mtime
+    dumpfile = tempdir + "/test_index"
+    outfile = open( dumpfile, "wb" )
+    outfile.write( "SVN-fs-dump-format-version: 2\n\n" )
+    outfile.close()
+    revs = [ ( 0, 2**32 + 1, 2**32 + 50, 0 ),
+             ( 1, 5 * 2**32 + 7, -1, 3 ),
+             ( 2, 2**53 - 1, 2**53 - 1, 2**31 - 1 ) ]
+    index = SvnDumpIndex()
+    for revnr, offset, propoffset, nodecount in revs:
+        index.add_rev( revnr, offset, propoffset, nodecount )
+    index.save( dumpfile )
+    index = load_dump_index( dumpfile )
+    rc = 0
+    if index == None or index.get_rev_count() != len( revs ):
+        rc = 1
+    else:
+        for i in range( len( revs ) ):
+            if ( index.get_rev_nr( i ), index.get_rev_offset( i ),
+                    index.get_rev_prop_offset( i ),
+                    index.get_node_count( i ) ) != revs[i]:
+                rc = 1
+    add_test_result( params, "test_index", "big offsets", rc )
+    if rc != 0:
+        print "wrong index :("
+        return 1
+
+    # done.
+    return 0
+
+class AddCopySourceMd5:
+    """Transformer adding Text-copy-source-md5 to copied files."""
+
+    def __init__( self ):
+        # md5 of the texts { path: { revnr: md5 } }
+        self.md5s = {}
+
+    def transform( self, dump ):
+        revnr = dump.get_rev_nr()
+        for node in dump.get_nodes_iter():
+            path = node.get_path()
+            if node.has_copy_from() and node.get_kind() == "file":
+                cfmd5s = self.md5s[node.get_copy_from_path()]
+                cfrev = max( [ r for r in cfmd5s.keys()
+                                    if r <= node.get_copy_from_rev() ] )
+                node.set_checksum( "Text-copy-source-md5", cfmd5s[cfrev] )
+            if node.has_md5():
+                self.md5s.setdefault( path, {} )[revnr] = node.get_text_md5()
+
+class SetNodeProperty:
+    """Transformer changing a property through get_properties()."""
+
+    def __init__( self, revnr, path, name, value ):
+        self.revnr = revnr
+        self.path = path
+        self.name = name
+        self.value = value
+
+    def transform( self, dump ):
+        if dump.get_rev_nr() != self.revnr:
+            return
+        for node in dump.get_nodes_iter():
+            if node.get_path() == self.path and node.has_properties():
+                node.get_properties()[self.name] = self.value
+
+def test_raw_copy( params ):
+    """Test 512: Test copying unmodified nodes raw."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+
+    # a dump with copy source checksums
+    plaindmp = tempdir + "/test_raw_plain"
+    indmp = tempdir + "/test_raw_in"
+    py_create_dump_file( plaindmp, "raw", data_test_delta, tempfiles )
+    svndump.copy_dump_file( plaindmp, indmp, AddCopySourceMd5() )
+    rc = 0
+    if open( indmp, "rb" ).read().count( "Text-copy-source-md5: " ) != 1:
+        rc = 1
+    add_test_result( params, "test_raw_copy", "copy source md5 added", rc )
+    if rc != 0:
+        print "no copy source md5 :("
+        return 1
+
+    # unmodified copies, read from the file and memory mapped
+    for usemmap in ( False, True ):
+        outdmp = "%s/test_raw_copy%d" % ( tempdir, usemmap )
+        set_default_mmap( usemmap )
+        try:
+            svndump.copy_dump_file( indmp, outdmp )
+        finally:
+            set_default_mmap( False )
+        rc = run( "cmp '%s' '%s'" % ( indmp, outdmp ) )
+        add_test_result( params, "test_raw_copy", "cmp copy mmap=%d" % usemmap,
+                         rc )
+        if rc != 0:
+            print "diffs found :("
+            return 1
+
+    # property changed in the dict returned by get_properties()
+    outdmp = tempdir + "/test_raw_props"
+    svndump.copy_dump_file( indmp, outdmp,
+                    SetNodeProperty( 1, "trunk/b.txt", "test", "changed" ) )
+    dump = SvnDumpFile()
+    dump.open( outdmp )
+    values = []
+    while dump.read_next_rev():
+        for node in dump.get_nodes_by_path( "trunk/b.txt", "AR" ):
+            values.append( node.get_property( "test" ) )
+    dump.close()
+    rc = 0
+    if values != [ "changed", None ]:
+        rc = 1
+    add_test_result( params, "test_raw_copy", "modified property", rc )
+    if rc != 0:
+        print "wrong property values %s :(" % values
+        return 1
+
+    # copy source checksums turned off
+    outdmp = tempdir + "/test_raw_nocs"
+    srcdmp = SvnDumpFile()
+    dstdmp = SvnDumpFile()
+    srcdmp.open( indmp )
+    srcdmp.read_next_rev()
+    dstdmp.create_like( outdmp, srcdmp )
+    dstdmp.set_copy_source_checksums( False )
+    while srcdmp.has_revision():
+        dstdmp.add_rev_from_dump( srcdmp )
+        srcdmp.read_next_rev()
+    srcdmp.close()
+    dstdmp.close()
+    rc = run( "cmp '%s' '%s'" % ( plaindmp, outdmp ) )
+    add_test_result( params, "test_raw_copy", "no copy source checksums", rc )
+    if rc != 0:
+        print "diffs found :("
+        return 1
+
+    # done.
+    return 0
+
+def test_stream( params ):
+    """Test 1024: Test reading dumps from a pipe."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+    svndumptool = params["svndumptool"]
+
+    for name, data, deltas in ( ( "v2", data_test1, False ),
+                                ( "v3", data_test_delta, True ) ):
+        indmp = "%s/test_stream_%s" % ( tempdir, name )
+        filedmp = "%s/test_stream_%s_file" % ( tempdir, name )
+        pipedmp = "%s/test_stream_%s_pipe" % ( tempdir, name )
+        set_default_write_deltas( deltas )
+        try:
+            py_create_dump_file( indmp, "stream", data, tempfiles )
+        finally:
+            set_default_write_deltas( False )
+        svndump.copy_dump_file( indmp, filedmp )
+        rc = run( "cat '%s' | %s copy - '%s'" % ( indmp, svndumptool,
+                                                  pipedmp ) )
+        if rc == 0:
+            rc = run( "cmp '%s' '%s'" % ( filedmp, pipedmp ) )
+        add_test_result( params, "test_stream", "cmp %s file pipe" % name,
+                         rc )
+        if rc != 0:
+            print "diffs found :("
+            return 1
+
+    # done.
+    return 0
+
+class ChunkReader:
+    """File object returning the given chunks one per read()."""
+
+    def __init__( self, chunks ):
+        self.chunks = chunks
+
+    def read( self, length ):
+        if len( self.chunks ) == 0:
+            return ""
+        return self.chunks.pop( 0 )
+
+    def close( self ):
+        pass
+
+def test_compress( params ):
+    """Test 2048: Test reading and writing compressed dumps."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+
+    # compress by copying, then decompress by copying again
+    indmp = tempdir + "/test_compress"
+    py_create_dump_file( indmp, "compress", data_test1, tempfiles )
+    text = open( indmp, "rb" ).read()
+    for ext, magic in ( ( ".gz", "\x1f\x8b" ), ( ".bz2", "BZh" ) ):
+        packed = indmp + ext
+        outdmp = indmp + ext + ".out"
+        svndump.copy_dump_file( indmp, packed )
+        svndump.copy_dump_file( packed, outdmp )
+        rc = 0
+        if not open( packed, "rb" ).read().startswith( magic ):
+            rc = 1
+        add_test_result( params, "test_compress", "write %s" % ext, rc )
+        if rc != 0:
+            print "not compressed :("
+            return 1
+        rc = run( "cmp '%s' '%s'" % ( indmp, outdmp ) )
+        add_test_result( params, "test_compress", "cmp %s" % ext, rc )
+        if rc != 0:
+            print "diffs found :("
+            return 1
+
+    # concatenated gzip streams
+    packed = indmp + ".cat.gz"
+    outdmp = indmp + ".cat.out"
+    half = len( text ) / 2
+    outfile = open( packed, "wb" )
+    for part in ( text[:half], text[half:] ):
+        gzfile = gzip.GzipFile( fileobj=outfile, mode="wb" )
+        gzfile.write( part )
+        gzfile.close()
+    outfile.close()
+    svndump.copy_dump_file( packed, outdmp )
+    rc = run( "cmp '%s' '%s'" % ( indmp, outdmp ) )
+    add_test_result( params, "test_compress", "cmp concatenated gz", rc )
+    if rc != 0:
+        print "diffs found :("
+        return 1
+
+    # concatenated streams split at and between the streams
+    parts = [ text[:half], text[half:] ]
+    for compression in ( "gz", "bz2" ):
+        if compression == "gz":
+            streams = []
+            for part in parts:
+                zobj = zlib.compressobj( 9, zlib.DEFLATED, 16 + zlib.MAX_WBITS )
+                streams.append( zobj.compress( part ) + zobj.flush() )
+        else:
+            streams = [ bz2.compress( part ) for part in parts ]
+        data = "".join( streams )
+        mid = len( streams[0] ) / 2
+        rc = 0
+        for chunks in ( streams, [ data[:mid], data[mid:] ] ):
+            reader = DecompressReader( ChunkReader( chunks ), compression )
+            if reader.read( len( text ) + 1 ) != text:
+                rc = 1
+        add_test_result( params, "test_compress",
+                         "concatenated %s chunks" % compression, rc )
+        if rc != 0:
+            print "wrong text :("
+            return 1
+
+    # done.
+    return 0
+
+def create_sha1_dump( filename, tmpdir ):
+    """Creates a dump with sha1 sums and copy source checksums."""
+
+    text = "line A\r\nline B\r\n" * 10
+    textfile = tmpdir + "/sha1-text"
+    outfile = open( textfile, "wb" )
+    outfile.write( text )
+    outfile.close()
+    dump = SvnDumpFile()
+    dump.create_with_rev_0( filename, "33333333-3333-3333-3333-333333333333",
+                            "2004-03-01T10:00:00.000000Z" )
+    revprops = { "svn:date": "2004-03-01T12:00:00.000000Z",
+                 "svn:author": "t1", "svn:log": "add" }
+    dump.add_rev( revprops )
+    node = SvnDumpNode( "trunk", "add", "dir" )
+    node.set_properties( {} )
+    dump.add_node( node )
+    node = SvnDumpNode( "trunk/a.txt", "add", "file" )
+    node.set_properties( {} )
+    node.set_text_file( textfile, sha1="calc" )
+    dump.add_node( node )
+    revprops = { "svn:date": "2004-03-02T12:00:00.000000Z",
+                 "svn:author": "t2", "svn:log": "copy" }
+    dump.add_rev( revprops )
+    node = SvnDumpNode( "trunk/b.txt", "add", "file" )
+    node.set_copy_from( "trunk/a.txt", 1 )
+    node.set_text_file( textfile, sha1="calc" )
+    node.set_checksum( "Text-copy-source-md5",
+                       hashlib.md5( text ).hexdigest() )
+    node.set_checksum( "Text-copy-source-sha1",
+                       hashlib.sha1( text ).hexdigest() )
+    dump.add_node( node )
+    dump.close()
+
+def get_dump_errors( filename ):
+    """Returns the error types check -m finds in a dump."""
+
+    dump = SvnDumpFileWithHistory()
+    dump.set_check_md5( True )
+    dump.open( filename )
+    errors = []
+    while dump.read_next_rev():
+        for err in dump.get_rev_errors() or []:
+            errors.append( err[0] )
+    dump.close()
+    return errors
+
+def test_checksums( params ):
+    """Test 4096: Test sha1 sums and copy source checksums."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+
+    indmp = tempdir + "/test_checksums"
+    create_sha1_dump( indmp, tempfiles )
+    intext = open( indmp, "rb" ).read()
+    rc = 0
+    if intext.count( "Text-content-sha1: " ) != 2 or \
+            intext.count( "Text-copy-source-sha1: " ) != 1 or \
+            get_dump_errors( indmp ) != []:
+        rc = 1
+    add_test_result( params, "test_checksums", "sha1 written", rc )
+    if rc != 0:
+        print "wrong dump :("
+        return 1
+
+    # the sha1 headers survive a round trip through version 3
+    v3dmp = tempdir + "/test_checksums_v3"
+    v2dmp = tempdir + "/test_checksums_v2"
+    set_default_write_deltas( True )
+    try:
+        svndump.copy_dump_file( indmp, v3dmp )
+    finally:
+        set_default_write_deltas( False )
+    svndump.copy_dump_file( v3dmp, v2dmp )
+    rc = run( "cmp '%s' '%s'" % ( indmp, v2dmp ) )
+    add_test_result( params, "test_checksums", "cmp v2 v3 v2", rc )
+    if rc != 0:
+        print "diffs found :("
+        return 1
+
+    # check finds a wrong sha1 sum
+    baddmp = tempdir + "/test_checksums_bad"
+    sha1 = hashlib.sha1( "line A\r\nline B\r\n" * 10 ).hexdigest()
+    outfile = open( baddmp, "wb" )
+    outfile.write( intext.replace( "Text-content-sha1: " + sha1,
+                                   "Text-content-sha1: " + "0" * 40, 1 ) )
+    outfile.close()
+    rc = 0
+    if get_dump_errors( baddmp ) != \
+            [ SvnDumpFileWithHistory.ERR_NODE_SHA1_FAIL ]:
+        rc = 1
+    add_test_result( params, "test_checksums", "check wrong sha1", rc )
+    if rc != 0:
+        print "wrong sha1 not found :("
+        return 1
+
+    # eolfix changes the copy source, its checksums have to be dropped
+    fixeddmp = tempdir + "/test_checksums_eolfix"
+    svndump_eol_fix_cmdline( "svndumptest.py",
+                             [ "-r", "\\.txt$", indmp, fixeddmp ] )
+    fixedtext = open( fixeddmp, "rb" ).read()
+    rc = 0
+    if fixedtext.count( "Text-copy-source-" ) != 0 or \
+            fixedtext.count( "Text-content-sha1: " ) != 2 or \
+            fixedtext.count( "\r" ) != 0 or get_dump_errors( fixeddmp ) != []:
+        rc = 1
+    add_test_result( params, "test_checksums", "eolfix copy source", rc )
+    if rc != 0:
+        print "wrong eolfix output :("
+        return 1
+
+    # done.
+    return 0
+
+def test_export( params ):
+    """Test 8192: Test exporting files from a pipe."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+    svndumptool = params["svndumptool"]
+
+    # branch/b.txt is not modified in r2 and r4
+    exports = [ ( 2, "branch/b.txt" ), ( 4, "branch/b.txt" ),
+                ( 3, "trunk/b.txt" ), ( 4, "trunk/a.txt" ) ]
+    for name, deltas in ( ( "v2", False ), ( "v3", True ) ):
+        indmp = "%s/test_export_%s" % ( tempdir, name )
+        set_default_write_deltas( deltas )
+        try:
+            py_create_dump_file( indmp, "export", data_test_delta, tempfiles )
+        finally:
+            set_default_write_deltas( False )
+        filedir = "%s/test_export_%s_file" % ( tempdir, name )
+        pipedir = "%s/test_export_%s_pipe" % ( tempdir, name )
+        kill_dir( filedir )
+        kill_dir( pipedir )
+        mkdir( filedir )
+        mkdir( pipedir )
+        # export always saves to the given file name
+        args = {}
+        for outdir in ( filedir, pipedir ):
+            args[outdir] = " ".join( [ "-e %d %s '%s/r%d-%s'" % ( revnr,
+                                path, outdir, revnr, path.replace( "/", "-" ) )
+                            for revnr, path in exports ] )
+        rc = run( "%s export %s '%s'" % ( svndumptool, args[filedir],
+                                          indmp ) )
+        if rc == 0:
+            rc = run( "cat '%s' | %s export %s -" % ( indmp, svndumptool,
+                                                     args[pipedir] ) )
+        if rc == 0:
+            rc = run( "diff -r '%s' '%s'" % ( filedir, pipedir ) )
+        if rc == 0 and len( listdir( pipedir ) ) != len( exports ):
+            rc = 1
+        if rc == 0 and open( pipedir + "/r2-branch-b.txt", "rb" ).read() != \
+                create_text( "text", "export", 1 ):
+            rc = 1
+        add_test_result( params, "test_export", "export %s file pipe" % name,
+                         rc )
+        if rc != 0:
+            print "diffs found :("
+            return 1
+
+    # the blob cache with room for two texts
+    texts = { "a": "text a", "b": "text b", "c": "text c" }
+    reads = []
+    def read( location ):
+        reads.append( location )
+        return texts[location]
+    md5s = {}
+    sha1s = {}
+    for location, text in texts.items():
+        md5s[location] = hashlib.md5( text ).hexdigest()
+        sha1s[location] = hashlib.sha1( text ).hexdigest()
+    cache = BlobCache( read, 12 )
+    cache.add_text( md5s["a"], sha1s["a"], 6, "a" )
+    cache.add_text( md5s["b"], "", -1, "b" )
+    cache.add_text( md5s["c"], "", 6, "c", True )
+    cache.add_text( md5s["c"], "", 6, "c2" )
+    texts["c2"] = texts["c"]
+    rc = 0
+    if cache.get_text( md5s["a"] ) != "text a" or \
+            cache.get_text( sha1s["a"] ) != "text a" or \
+            cache.get_length( md5s["b"] ) != 6 or \
+            cache.get_text( md5s["c"] ) != "text c" or \
+            cache.get_text( md5s["a"] ) != "text a" or \
+            cache.has_text( sha1s["b"] ) or \
+            cache.get_text( sha1s["c"] ) != None:
+        rc = 1
+    # a dropped, b and c cached
+    if reads != [ "a", "b", "c2", "a" ]:
+        rc = 1
+    add_test_result( params, "test_export", "blob cache lru", rc )
+    if rc != 0:
+        print "wrong reads %s :(" % reads
+        return 1
+
+    # texts without location are lost without spill file
+    rc = 0
+    for spill in ( False, True ):
+        cache = BlobCache( read, 12, spill )
+        cache.add_content( md5s["a"], sha1s["a"], "text a" )
+        cache.add_content( md5s["b"], sha1s["b"], "text b" )
+        cache.add_content( md5s["c"], sha1s["c"], "text c" )
+        cache.add_content( "0" * 32, "", "too big for the cache" )
+        if spill:
+            expected = [ "text a", "text b", "text c",
+                         "too big for the cache" ]
+        else:
+            expected = [ None, "text b", "text c", None ]
+        if [ cache.get_text( sha1s["a"] ), cache.get_text( md5s["b"] ),
+             cache.get_text( md5s["c"] ), cache.get_text( "0" * 32 ) ] != \
+                expected:
+            rc = 1
+        cache.close()
+    add_test_result( params, "test_export", "blob cache spill", rc )
+    if rc != 0:
+        print "wrong texts :("
+        return 1
+
+    # done.
+    return 0
+
+def read_rev_offsets( filename ):
+    """Returns revision number and offset of the revisions of a dump."""
+
+    dump = SvnDumpFile()
+    dump.open( filename )
+    revs = []
+    offset = dump.get_next_rev_offset()
+    while dump.read_next_rev():
+        revs.append( ( dump.get_rev_nr(), offset ) )
+        offset = dump.get_next_rev_offset()
+    dump.close()
+    return revs
+
+def test_resume( params ):
+    """Test 16384: Test resuming checks of a growing dump."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+    svndumptool = params["svndumptool"]
+
+    fulldmp = tempdir + "/test_resume_full"
+    checkdmp = tempdir + "/test_resume"
+    outfile = tempdir + "/test_resume.out"
+    if isfile( checkdmp + ".sdthist" ):
+        remove( checkdmp + ".sdthist" )
+    py_create_dump_file( fulldmp, "resume", data_test_delta, tempfiles )
+    text = open( fulldmp, "rb" ).read()
+    # cut the dump before r3, r3 deletes and r4 copies nodes of r1 and r2
+    offset = dict( read_rev_offsets( fulldmp ) )[3]
+    dmpfile = open( checkdmp, "wb" )
+    dmpfile.write( text[:offset] )
+    dmpfile.close()
+    check = "%s check -A -v -r '%s' > '%s'" % ( svndumptool, checkdmp,
+                                                outfile )
+    rc = run( check )
+    lines = open( outfile, "rb" ).read().splitlines()
+    if rc == 0 and ( "  Revision 2" not in lines or
+                     "  Revision 3" in lines or
+                     not isfile( checkdmp + ".sdthist" ) ):
+        rc = 1
+    add_test_result( params, "test_resume", "check truncated", rc )
+    if rc != 0:
+        print "wrong output :("
+        return 1
+
+    # append the rest, only r3 and r4 are checked
+    dmpfile = open( checkdmp, "ab" )
+    dmpfile.write( text[offset:] )
+    dmpfile.close()
+    rc = run( check )
+    lines = open( outfile, "rb" ).read().splitlines()
+    if rc == 0 and ( "Resuming after revision 2" not in lines or
+                     "  Revision 2" in lines or
+                     "  Revision 3" not in lines or
+                     "  Revision 4" not in lines or lines[-1] != "OK" ):
+        rc = 1
+    add_test_result( params, "test_resume", "resume appended", rc )
+    if rc != 0:
+        print "wrong output :("
+        return 1
+
+    # a rewritten dump is checked from the start
+    py_create_dump_file( checkdmp, "rewritten", data_test_delta, tempfiles )
+    rc = run( check )
+    lines = open( outfile, "rb" ).read().splitlines()
+    if rc == 0 and ( "Resuming after revision 2" in lines or
+                     "  Revision 1" not in lines or lines[-1] != "OK" ):
+        rc = 1
+    add_test_result( params, "test_resume", "no resume after rewrite", rc )
+    if rc != 0:
+        print "wrong output :("
+        return 1
+
+    # done.
+    return 0
+
+def test_check_jobs( params ):
+    """Test 32768: Test checking md5 sums in threads."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+    svndumptool = params["svndumptool"]
+
+    # many revisions so the sums of the first ones are printed while the
+    # sums of later ones are still calculated
+    data_many = [ data_test_delta[0],
+                  { "date": "2004-05-01T12:00:00.000000Z",
+                    "nodes": [ { "path": "d", "kind": "dir",
+                                 "action": "add" } ] } ]
+    for revnr in range( 2, 102 ):
+        nodes = []
+        for i in range( 3 ):
+            nodes.append( { "path": "d/f%d-%d.txt" % ( revnr, i ),
+                            "kind": "file", "action": "add",
+                            "text": "text" } )
+        data_many.append( { "date": "2004-05-01T12:00:00.000000Z",
+                            "nodes": nodes } )
+
+    md5re = re.compile( "^Text-content-md5: ([0-9a-f]{32})$", re.M )
+    for name, data in ( ( "test1", data_test1 ), ( "many", data_many ) ):
+        # every second md5 sum is wrong
+        gooddmp = "%s/test_check_jobs_%s_good" % ( tempdir, name )
+        baddmp = "%s/test_check_jobs_%s" % ( tempdir, name )
+        py_create_dump_file( gooddmp, "jobs", data, tempfiles )
+        count = [ 0 ]
+        def corrupt( match ):
+            count[0] += 1
+            if count[0] % 2 == 0:
+                return match.group( 0 )
+            return "Text-content-md5: %032x" % count[0]
+        dmpfile = open( baddmp, "wb" )
+        dmpfile.write( md5re.sub( corrupt, open( gooddmp, "rb" ).read() ) )
+        dmpfile.close()
+
+        for options in ( "-m", "-A -v" ):
+            outputs = []
+            for jobs in ( 1, 2, 4 ):
+                outfile = "%s/test_check_jobs_%d.out" % ( tempdir, jobs )
+                run( "%s check %s -j %d '%s' > '%s'" % ( svndumptool,
+                                        options, jobs, baddmp, outfile ) )
+                outputs.append( open( outfile, "rb" ).read() )
+            rc = 0
+            if outputs[0].count( "ERROR - md5" ) != ( count[0] + 1 ) / 2:
+                rc = 1
+            for output in outputs[1:]:
+                if output != outputs[0]:
+                    rc = 1
+            add_test_result( params, "test_check_jobs",
+                             "check %s %s" % ( options, name ), rc )
+            if rc != 0:
+                print "diffs found :("
+                return 1
+
+    # done.
+    return 0
+
+def test_ls( params ):
+    """Test 65536: Test listing the files of revisions."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+    svndumptool = params["svndumptool"]
+
+    indmp = tempdir + "/test_ls"
+    outfile = tempdir + "/test_ls.out"
+    py_create_dump_file( indmp, "ls", data_test_ls, tempfiles )
+    trunk = [ "/trunk", "/trunk/a.txt", "/trunk/b.txt" ]
+    branch = [ "/branch", "/branch/a.txt", "/branch/b.txt" ]
+    expected = [
+        [],
+        trunk,
+        branch + trunk,
+        branch + [ "/trunk", "/trunk/b.txt" ],
+        branch + trunk,
+        [ "/branch", "/branch/a.txt", "/tags" ] + trunk,
+        [ "/tags", "/tags/t1", "/tags/t1/a.txt" ] + trunk,
+    ]
+    for revnr in range( len( expected ) ):
+        rc = run( "%s ls -r %d '%s' > '%s'" % ( svndumptool, revnr, indmp,
+                                               outfile ) )
+        if rc == 0 and \
+                open( outfile, "rb" ).read().splitlines() != expected[revnr]:
+            rc = 1
+        add_test_result( params, "test_ls", "ls -r %d" % revnr, rc )
+        if rc != 0:
+            print "wrong file list :("
+            return 1
+
+    # several revisions in one pass, HEAD is the last one
+    rc = run( "%s ls -r 2,6,3,HEAD '%s' > '%s'" % ( svndumptool, indmp,
+                                                   outfile ) )
+    lines = []
+    for revnr in ( 2, 6, 3, 6 ):
+        lines.append( "Revision %d:" % revnr )
+        lines.extend( expected[revnr] )
+    if rc == 0 and open( outfile, "rb" ).read().splitlines() != lines:
+        rc = 1
+    add_test_result( params, "test_ls", "ls -r 2,6,3,HEAD", rc )
+    if rc != 0:
+        print "wrong file list :("
+        return 1
+
+    # done.
+    return 0
+
+def read_rev_nodes( filename ):
+    """Returns the node paths of the revisions of a dump."""
+
+    dump = SvnDumpFile()
+    dump.open( filename )
+    revs = {}
+    while dump.read_next_rev():
+        revs[dump.get_rev_nr()] = [ node.get_path()
+                                    for node in dump.get_nodes_iter() ]
+    dump.close()
+    return revs
+
+def check_seek_rev( filename, revs, indexed ):
+    """Seeks to revisions of a dump, returns 0 if they are right."""
+
+    dump = SvnDumpFile()
+    dump.open( filename )
+    rc = 0
+    if ( dump.get_index() != None ) != indexed:
+        rc = 1
+    for revnr in ( 4, 1, 6, 0, 6, 3 ):
+        if not dump.seek_rev( revnr ) or dump.get_rev_nr() != revnr or \
+                [ node.get_path() for node in dump.get_nodes_iter() ] != \
+                    revs[revnr]:
+            rc = 1
+    if dump.seek_rev( 7 ):
+        rc = 1
+    dump.close()
+    return rc
+
+def test_seek_rev( params ):
+    """Test 131072: Test seeking revisions with and without index."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+
+    indmp = tempdir + "/test_seek_rev"
+    py_create_dump_file( indmp, "seek", data_test_ls, tempfiles )
+    revs = read_rev_nodes( indmp )
+    if isfile( indmp + ".sdtidx" ):
+        remove( indmp + ".sdtidx" )
+    rc = check_seek_rev( indmp, revs, False )
+    add_test_result( params, "test_seek_rev", "seek without index", rc )
+    if rc != 0:
+        print "wrong revision :("
+        return 1
+    create_dump_index( indmp ).save( indmp )
+    rc = check_seek_rev( indmp, revs, True )
+    add_test_result( params, "test_seek_rev", "seek with index", rc )
+    if rc != 0:
+        print "wrong revision :("
+        return 1
+
+    # rewritten with other sizes the index is stale
+    py_create_dump_file( indmp, "seek rewritten", data_test_ls, tempfiles )
+    revs = read_rev_nodes( indmp )
+    rc = check_seek_rev( indmp, revs, False )
+    add_test_result( params, "test_seek_rev", "seek stale index size", rc )
+    if rc != 0:
+        print "wrong revision :("
+        return 1
+
+    # same size but touched
+    create_dump_index( indmp ).save( indmp )
+    mtime = stat( indmp ).st_mtime
+    utime( indmp, ( mtime + 10, mtime + 10 ) )
+    rc = check_seek_rev( indmp, revs, False )
+    add_test_result( params, "test_seek_rev", "seek stale index mtime", rc )
+    if rc != 0:
+        print "wrong revision :("
+        return 1
+
+    # done.
+    return 0
+
+def test_scan( params ):
+    """Test 262144: Test scanning dumps for revisions and nodes."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+
+    for name, data, deltas in ( ( "test1", data_test1, False ),
+                                ( "ls", data_test_ls, False ),
+                                ( "v3", data_test_ls, True ) ):
+        indmp = "%s/test_scan_%s" % ( tempdir, name )
+        set_default_write_deltas( deltas )
+        try:
+            py_create_dump_file( indmp, "scan", data, tempfiles )
+            packed = indmp + ".gz"
+            svndump.copy_dump_file( indmp, packed )
+        finally:
+            set_default_write_deltas( False )
+
+        # the index written and the text offsets seen by a full parse
+        if isfile( indmp + ".sdtidx" ):
+            remove( indmp + ".sdtidx" )
+        dump = SvnDumpFile()
+        dump.set_write_index( True )
+        dump.open( indmp )
+        nodes = []
+        while dump.read_next_rev():
+            for node in dump.get_nodes_iter():
+                nodes.append( ( node.get_path(), node.get_text_offset() ) )
+        dump.close()
+        index = load_dump_index( indmp )
+        revs = []
+        for i in range( index.get_rev_count() ):
+            revs.append( ( index.get_rev_nr( i ), index.get_rev_offset( i ),
+                           index.get_rev_prop_offset( i ),
+                           index.get_node_count( i ) ) )
+
+        for filename, usemmap in ( ( indmp, False ), ( indmp, True ),
+                                   ( packed, False ) ):
+            scanrevs = []
+            scannodes = []
+            for kind, offset, bodyoffset, tags in \
+                    scan_dump_file( filename, usemmap ):
+                if kind == "R":
+                    scanrevs.append( [ int( tags["Revision-number:"] ),
+                                       offset, bodyoffset, 0 ] )
+                    continue
+                scanrevs[-1][3] += 1
+                textoffset = -1
+                if tags.has_key( "Text-content-length:" ) and \
+                        not tags.has_key( "Text-delta:" ):
+                    textoffset = bodyoffset + \
+                            int( tags.get( "Prop-content-length:", 0 ) )
+                scannodes.append( ( tags["Node-path:"], textoffset ) )
+            rc = 0
+            if [ tuple( rev ) for rev in scanrevs ] != revs or \
+                    scannodes != nodes:
+                rc = 1
+            add_test_result( params, "test_scan", "scan %s%s" % ( name,
+                    [ "", " mmap" ][usemmap] + filename[len( indmp ):] ), rc )
+            if rc != 0:
+                print "wrong offsets :("
+                return 1
+
+    # done.
+    return 0
+
+def get_rev_summary( dump, prefix ):
+    """Returns revision number, author and node paths for map_revisions."""
+
+    paths = [ node.get_path() for node in dump.get_nodes_iter() ]
+    return "%s%d %s %s" % ( prefix, dump.get_rev_nr(), dump.get_rev_author(),
+                            ",".join( paths ) )
+
+def test_log_jobs( params ):
+    """Test 524288: Test reading revisions in worker processes."""
+
+    # get params
+    tempdir = params["tempdir"]
+    tempfiles = params["tempfiles"]
+    svndumptool = params["svndumptool"]
+
+    dumps = []
+    for name, data, deltas in ( ( "test1", data_test1, False ),
+                                ( "ls", data_test_ls, True ) ):
+        indmp = "%s/test_log_jobs_%s" % ( tempdir, name )
+        set_default_write_deltas( deltas )
+        try:
+            py_create_dump_file( indmp, "log", data, tempfiles )
+        finally:
+            set_default_write_deltas( False )
+        if isfile( indmp + ".sdtidx" ):
+            remove( indmp + ".sdtidx" )
+        dumps.append( indmp )
+    # the same with index and compressed
+    indexed = tempdir + "/test_log_jobs_indexed"
+    svndump.copy_dump_file( dumps[0], indexed )
+    create_dump_index( indexed ).save( indexed )
+    dumps.append( indexed )
+    packed = tempdir + "/test_log_jobs.gz"
+    svndump.copy_dump_file( dumps[0], packed )
+    dumps.append( packed )
+
+    # map_revisions returns the results in revision order
+    for indmp in dumps:
+        results = []
+        for jobs in ( 1, 3 ):
+            results.append( list( map_revisions( indmp, get_rev_summary,
+                                                 ( "r", ), jobs, 2, 8 ) ) )
+        lastrev = min( 8, read_rev_offsets( indmp )[-1][0] )
+        rc = 0
+        if [ revnr for revnr, summary in results[0] ] != \
+                range( 2, lastrev + 1 ) or results[0] != results[1]:
+            rc = 1
+        add_test_result( params, "test_log_jobs",
+                         "map %s" % indmp[len( tempdir ) + 1:], rc )
+        if rc != 0:
+            print "wrong results :("
+            return 1
+
+    # log -j 3 prints the same as log
+    for indmp in dumps:
+        for options in ( "", "-v", "-r 3:6", "-r 4" ):
+            outputs = []
+            for jobs in ( 1, 3 ):
+                outfile = "%s/test_log_jobs_%d.out" % ( tempdir, jobs )
+                run( "%s log %s -j %d '%s' > '%s'" % ( svndumptool, options,
+                                                     jobs, indmp, outfile ) )
+                outputs.append( open( outfile, "rb" ).read() )
+            rc = 0
+            if outputs[0].count( "\nr" ) == 0 or outputs[0] != outputs[1]:
+                rc = 1
+            add_test_result( params, "test_log_jobs", "log %s %s" % (
+                             options, indmp[len( tempdir ) + 1:] ), rc )
+            if rc != 0:
+                print "diffs found :("
+                return 1
+
+    # done.
+    return 0
+
 
 if __name__ == '__main__':
 
-    tests = 255
+    tests = 1048575
     if len( sys.argv ) > 1:
         tests = int( sys.argv[1] )
 
@@ -629,5 +2127,41 @@ if __name__ == '__main__':
         rc = test_dumps( params )
     if rc == 0 and tests & 2 != 0:
         rc = test_eolfix( params )
+    if rc == 0 and tests & 4 != 0:
+        rc = test_delta( params )
+    if rc == 0 and tests & 8 != 0:
+        rc = test_listdict( params )
+    if rc == 0 and tests & 16 != 0:
+        rc = test_history( params )
+    if rc == 0 and tests & 32 != 0:
+        rc = test_history_copies( params )
+    if rc == 0 and tests & 64 != 0:
+        rc = test_rename( params )
+    if rc == 0 and tests & 128 != 0:
+        rc = test_merge_max_open( params )
+    if rc == 0 and tests & 256 != 0:
+        rc = test_index( params )
+    if rc == 0 and tests & 512 != 0:
+        rc = test_raw_copy( params )
+    if rc == 0 and tests & 1024 != 0:
+        rc = test_stream( params )
+    if rc == 0 and tests & 2048 != 0:
+        rc = test_compress( params )
+    if rc == 0 and tests & 4096 != 0:
+        rc = test_checksums( params )
+    if rc == 0 and tests & 8192 != 0:
+        rc = test_export( params )
+    if rc == 0 and tests & 16384 != 0:
+        rc = test_resume( params )
+    if rc == 0 and tests & 32768 != 0:
+        rc = test_check_jobs( params )
+    if rc == 0 and tests & 65536 != 0:
+        rc = test_ls( params )
+    if rc == 0 and tests & 131072 != 0:
+        rc = test_seek_rev( params )
+    if rc == 0 and tests & 262144 != 0:
+        rc = test_scan( params )
+    if rc == 0 and tests & 524288 != 0:
+        rc = test_log_jobs( params )
     show_test_results( params )
 
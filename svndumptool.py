@@ -24,6 +24,10 @@
 import sys
 
 from svndump import __version
+from svndump.file import set_default_mmap, set_default_write_index, \
+        set_default_line_counting, set_default_write_deltas, \
+        set_default_write_buffer_size
+from svndump.common import set_read_chunk_size
 from svndump.cvs2svnfix import svndump_cvs2svnfix_cmdline
 from svndump.diff import svndump_diff_cmdline
 from svndump.edit import svndump_edit_cmdline
@@ -35,7 +39,7 @@ from svndump.props import svndump_transform_revprop_cmdline, \
 from svndump.sanitize import svndump_sanitize_cmdline
 from svndump.tools import svndump_copy_cmdline, svndump_export_cmdline, \
                           svndump_check_cmdline, svndump_log_cmdline, \
-                          svndump_ls_cmdline, \
+                          svndump_ls_cmdline, svndump_index_cmdline, \
                           svndump_join_cmdline, svndump_split_cmdline
 
 __commands = {
@@ -47,6 +51,7 @@ __commands = {
     "edit":                 svndump_edit_cmdline,
     "eolfix":               svndump_eol_fix_cmdline,
     "export":               svndump_export_cmdline,
+    "index":                svndump_index_cmdline,
     "join":                 svndump_join_cmdline,
     "log":                  svndump_log_cmdline,
     "ls":                   svndump_ls_cmdline,
@@ -57,13 +62,74 @@ __commands = {
     "transform-revprop":    svndump_transform_revprop_cmdline,
 }
 
+def __opt_mmap( value ):
+    set_default_mmap( True )
+
+def __opt_write_index( value ):
+    set_default_write_index( True )
+
+def __opt_debug_line_numbers( value ):
+    set_default_line_counting( True )
+
+def __opt_deltas( value ):
+    set_default_write_deltas( True )
+
+def __kb_value( value ):
+    kb = int( value )
+    if kb < 1:
+        raise ValueError, "size must be at least 1KB"
+    return kb * 1024
+
+def __opt_write_buffer( value ):
+    set_default_write_buffer_size( __kb_value( value ) )
+
+def __opt_read_chunk( value ):
+    set_read_chunk_size( __kb_value( value ) )
+
+# global options: name -> ( takes a value, function )
+__global_options = {
+    "--mmap":               ( False, __opt_mmap ),
+    "--write-index":        ( False, __opt_write_index ),
+    "--debug-line-numbers": ( False, __opt_debug_line_numbers ),
+    "--deltas":             ( False, __opt_deltas ),
+    "--write-buffer":       ( True, __opt_write_buffer ),
+    "--read-chunk":         ( True, __opt_read_chunk ),
+}
+
+def __parse_global_options( args ):
+    """
+    Applies the global options at the start of args and removes them.
+
+    Global options are given before the command name, values are
+    specified as --option=value.
+
+    @type args: list( string )
+    @param args: Commandline arguments.
+    @rtype: list( string )
+    @return: The remaining arguments.
+    """
+    while len( args ) > 0 and args[0].startswith( "--" ):
+        name, value = ( args[0].split( "=", 1 ) + [ None ] )[:2]
+        if not __global_options.has_key( name ):
+            break
+        takesvalue, func = __global_options[name]
+        if takesvalue != ( value != None ):
+            break
+        try:
+            func( value )
+        except ValueError:
+            print >>sys.stderr, "invalid value '%s' for %s" % ( value, name )
+            sys.exit( 1 )
+        args = args[1:]
+    return args
+
 def __help( appname, args ):
     rc = 0
     if len(args) == 1 and __commands.has_key( args[0] ):
         __commands[args[0]]( appname + " " + args[0], [ "-h" ] )
     else:
         print ""
-        print "svndumptool.py command [options]"
+        print "svndumptool.py [global options] command [options]"
         print ""
         print "  commands:"
         print "    apply-autoprops      apply auto-props to added files"
@@ -74,6 +140,7 @@ def __help( appname, args ):
         print "    edit                 edit files in a dump file"
         print "    eolfix               fix EOL of text files in a dump"
         print "    export               export files from a dump file"
+        print "    index                create revision offset indexes"
         print "    join                 join dump files"
         print "    log                  show the log of a dump file"
         print "    ls                   list files of a given revision"
@@ -84,6 +151,14 @@ def __help( appname, args ):
         print "    transform-prop       transform a node property"
         print "    --version            print the version"
         print ""
+        print "  global options:"
+        print "    --mmap               memory map the input dump files"
+        print "    --write-index        index dump files which are read completely"
+        print "    --debug-line-numbers report line numbers in errors (slow)"
+        print "    --deltas             write dump files with text deltas (version 3)"
+        print "    --write-buffer=KB    size of the write buffer (default 1024)"
+        print "    --read-chunk=KB      size of the chunks texts are read in (default 1024)"
+        print ""
         print "  use 'svndumptool.py command -h' for help about the commands."
         print ""
     return rc
@@ -103,18 +178,19 @@ if __name__ == '__main__':
     func = __help;
     args = []
     argidx = 0
+    argv = sys.argv[:1] + __parse_global_options( sys.argv[1:] )
     if pfx == "svndump" and sfx == ".py" and __commands.has_key( cmd ):
         func = __commands[cmd]
         argidx = 1
-    elif len( sys.argv ) > 1:
-        cmd = sys.argv[1]
+    elif len( argv ) > 1:
+        cmd = argv[1]
         if __commands.has_key( cmd ):
             func = __commands[cmd]
             appname += " " + cmd
         elif cmd == "--version":
             func = __print_version
         argidx = 2
-    if argidx < len( sys.argv ):
-        args = sys.argv[argidx:]
+    if argidx < len( argv ):
+        args = argv[argidx:]
     sys.exit( func( appname, args ) )
 